@@ -0,0 +1,219 @@
+"""
+로봇(ARM CPU)용 백본 실행 준비.
+
+    fuse          : Conv + BatchNorm 을 하나의 Conv 로 합친다 (utils.torch_utils.fuse_conv_and_bn)
+    channels_last : 입력과 가중치를 NHWC 로 둔다 (CPU conv 커널이 더 빠른 경우가 많음)
+    runtime       : eager / torchscript(분할 지점별 trace + freeze) / onnx(분할 지점별 export + onnxruntime)
+    threads       : torch(onnx 는 onnxruntime) intra-op / inter-op 스레드 수 (0 이면 기본값)
+
+trace / export 는 분할 지점마다 처음 쓸 때 한 번만 하므로 적응형 분할로 지점이 바뀌어도 그대로 동작하고,
+입력 해상도는 고정하지 않는다. save_dir 를 주면 만든 TorchScript / ONNX 파일을 남긴다.
+
+장치에서 설정별 ms/frame 비교:
+    python edge_runtime.py --model yolov5n_backbone.pt --runtimes eager torchscript onnx --threads 4
+"""
+import argparse
+import copy
+import io
+import statistics
+import time
+from pathlib import Path
+
+import torch
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+RUNTIMES = ("eager", "torchscript", "onnx")
+
+
+# BackboneModel 클래스 정의 (저장할 때 사용한 클래스)
+class BackboneModel(torch.nn.Module):
+    def __init__(self, layers):
+        super(BackboneModel, self).__init__()
+        self.layers = torch.nn.ModuleList(layers)
+
+    def forward(self, x, split=None):
+        """레이어 0 ~ split-1 만 실행한다 (split 이 None 이면 전체)."""
+        outputs = []
+        for m in self.layers[:split]:
+            if m.f != -1:
+                if isinstance(m.f, int):
+                    x = outputs[m.f]
+                else:
+                    x = [outputs[j] for j in m.f]
+            x = m(x)
+            outputs.append(x)
+        return outputs
+
+
+class _FixedSplit(torch.nn.Module):
+    """trace / export 용으로 분할 지점을 고정한 래퍼."""
+
+    def __init__(self, model, split):
+        super().__init__()
+        self.model = model
+        self.split = split
+
+    def forward(self, x):
+        return self.model(x, self.split)
+
+
+def fuse_layers(model):
+    """Conv(+DWConv) 의 BatchNorm 을 conv 가중치에 합친다 (models.yolo.DetectionModel.fuse 와 같은 방식). 합친 수를 반환한다."""
+    from utils.torch_utils import fuse_conv_and_bn
+
+    fused = 0
+    for m in model.modules():
+        if hasattr(m, "bn") and hasattr(m, "forward_fuse"):
+            m.conv = fuse_conv_and_bn(m.conv, m.bn)
+            delattr(m, "bn")
+            m.forward = m.forward_fuse
+            fused += 1
+    return fused
+
+
+def configure_threads(intra_op=0, inter_op=0):
+    """torch 스레드 수 설정. inter-op 은 병렬 작업을 시작하기 전에만 바꿀 수 있으므로 프로세스 시작 시 호출한다."""
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        torch.set_num_interop_threads(inter_op)
+
+
+class EdgeBackbone:
+    """BackboneModel 과 같게 runner(x, split) 으로 호출해 분할 지점까지의 출력 리스트를 받는다."""
+
+    def __init__(self, model, runtime="eager", channels_last=False, save_dir=None, name="backbone"):
+        if runtime not in RUNTIMES:
+            raise ValueError(f"runtime 은 {RUNTIMES} 중 하나여야 합니다: {runtime}")
+        if runtime == "onnx" and onnxruntime is None:
+            raise RuntimeError("onnx runtime 에는 onnxruntime 패키지가 필요합니다.")
+        self.model = model.eval()
+        self.runtime = runtime
+        # ONNX 는 onnxruntime 이 메모리 배치를 정하므로 channels_last 를 쓰지 않는다
+        self.channels_last = channels_last and runtime != "onnx"
+        self.save_dir = Path(save_dir) if save_dir else None
+        self.name = name
+        self.split_count = len(model.layers)
+        self._compiled = {}
+        if self.channels_last:
+            self.model.to(memory_format=torch.channels_last)
+
+    def _input(self, x):
+        return x.contiguous(memory_format=torch.channels_last) if self.channels_last else x
+
+    def prepare(self, split, size=640):
+        """split 의 trace / export 를 미리 해 둔다 (첫 프레임이 밀리지 않도록)."""
+        split = split or self.split_count
+        if self.runtime != "eager" and split not in self._compiled:
+            self._compiled[split] = self._compile(split, size)
+
+    def _compile(self, split, size):
+        started = time.perf_counter()
+        wrapper = _FixedSplit(self.model, split).eval()
+        example = self._input(torch.zeros(1, 3, size, size))
+        suffix = ".torchscript" if self.runtime == "torchscript" else ".onnx"
+        path = self.save_dir / f"{self.name}_s{split}{suffix}" if self.save_dir else None
+        if self.runtime == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(wrapper, example, check_trace=False)
+                # optimize_for_inference 는 mkldnn 변환 비용 때문에 작은 백본에서는 오히려 느려 freeze 만 한다
+                compiled = torch.jit.freeze(traced)
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                torch.jit.save(compiled, str(path))
+        else:
+            buffer = io.BytesIO()
+            with torch.no_grad():
+                torch.onnx.export(
+                    wrapper, example, buffer, input_names=["images"],
+                    output_names=[f"out{i}" for i in range(split)],
+                    dynamic_axes={"images": {2: "height", 3: "width"}}, opset_version=17, dynamo=False,
+                )
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(buffer.getvalue())
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = torch.get_num_threads()
+            compiled = onnxruntime.InferenceSession(buffer.getvalue(), options, providers=["CPUExecutionProvider"])
+        print(f"백본 {self.runtime} 준비 완료 (분할 지점 {split}, {time.perf_counter() - started:.1f}s"
+              + (f", {path}" if path is not None else "") + ")")
+        return compiled
+
+    def __call__(self, x, split=None):
+        split = split or self.split_count
+        if self.runtime == "eager":
+            return self.model(self._input(x), split)
+        compiled = self._compiled.get(split)
+        if compiled is None:
+            compiled = self._compiled[split] = self._compile(split, x.shape[-1])
+        if self.runtime == "onnx":
+            return [torch.from_numpy(out) for out in compiled.run(None, {"images": x.numpy()})]
+        return list(compiled(self._input(x)))
+
+
+def benchmark(runner, split, x, frames=30, warmup=5):
+    """입력 x 로 (ms/frame 리스트, 마지막 출력) 을 반환한다."""
+    with torch.inference_mode():
+        for _ in range(warmup):
+            runner(x, split)
+        times = []
+        for _ in range(frames):
+            started = time.perf_counter()
+            outputs = runner(x, split)
+            times.append((time.perf_counter() - started) * 1000)
+    return times, outputs
+
+
+def main():
+    import split_model
+
+    parser = argparse.ArgumentParser(description="백본 실행 설정별 ms/frame 측정 (로봇에서 실행)")
+    parser.add_argument("--model", type=Path, default=Path("yolov5n_backbone.pt"))
+    parser.add_argument("--full-model", type=Path, default=Path("yolov5n.pt"), help="--model 이 없을 때 잘라 쓸 체크포인트")
+    parser.add_argument("--split", type=int, default=0, help="분할 지점 (0 이면 아티팩트의 기본값)")
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--runtimes", nargs="+", default=["eager", "torchscript"], choices=RUNTIMES)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op 스레드 수 (0 이면 torch 기본값)")
+    parser.add_argument("--interop-threads", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--save-dir", type=Path, default=None, help="TorchScript / ONNX 파일을 저장할 디렉터리")
+    args = parser.parse_args()
+
+    configure_threads(args.threads, args.interop_threads)
+    with torch.serialization.safe_globals({"__main__.BackboneModel": BackboneModel}):
+        layers, meta = split_model.load_part(args.model, "backbone", fallback=args.full_model, split=10)
+    split = args.split or meta["backbone_len"]
+    original = BackboneModel(layers).float().eval()
+    print(f"분할 지점 {split}, 입력 {args.size}x{args.size}, intra-op 스레드 {torch.get_num_threads()}")
+
+    # 기준: 이전 실행 방식 (fuse 없음, eager)
+    x = torch.rand(1, 3, args.size, args.size, generator=torch.Generator().manual_seed(0))
+    times, reference = benchmark(EdgeBackbone(original), split, x, args.frames)
+    rows = [("eager (fuse 없음)", times, 0.0)]
+    for runtime in args.runtimes:
+        if runtime == "onnx" and onnxruntime is None:
+            print("onnxruntime 이 없어 onnx 는 건너뜁니다.")
+            continue
+        for channels_last in ([False] if runtime == "onnx" else [False, True]):
+            model = copy.deepcopy(original)
+            fuse_layers(model)
+            runner = EdgeBackbone(model, runtime, channels_last, save_dir=args.save_dir, name=args.model.stem)
+            runner.prepare(split, args.size)
+            times, outputs = benchmark(runner, split, x, args.frames)
+            diff = max(float((a - b).abs().max()) for a, b in zip(reference, outputs))
+            rows.append((f"{runtime} + fuse" + (" + channels_last" if channels_last else ""), times, diff))
+
+    baseline = statistics.mean(rows[0][1])
+    print(f"\n{'설정':32s} {'mean ms':>8s} {'p50 ms':>8s} {'p90 ms':>8s} {'speedup':>8s} {'max |diff|':>11s}")
+    for label, times, diff in rows:
+        p90 = statistics.quantiles(times, n=10)[8] if len(times) >= 2 else times[0]
+        print(f"{label:32s} {statistics.mean(times):8.2f} {statistics.median(times):8.2f} {p90:8.2f} "
+              f"{baseline / statistics.mean(times):8.2f} {diff:11.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+neck-head 부하에 맞춰 백본의 업로드를 조절하는 pacer.
+
+목표는 검출 나이(프레임 캡처 ~ 그 프레임의 검출 결과 수신)를 target_age 아래로 유지하는 것이다.
+
+건너뛰기 : neck-head 가 알려 준 예상 대기(expected_wait_ms, 보고 후 지난 시간만큼 줄여 봄)와 최근 전송 시간의 합이
+           target_age 를 넘거나 Retry-After 로 거절된 동안에는 프레임을 보내지 않는다 (보내도 목표보다 늦게 도착한다).
+전송 간격: eval_interval 마다 새로 받은 검출 나이(EWMA)가 목표를 넘으면 간격을 1.5 배로 늘리고(max_interval 까지),
+           목표의 절반 아래면 base_interval 쪽으로 줄인다.
+해상도   : 간격이 max_interval 에 닿았는데도 목표를 넘으면 입력 해상도를 한 단계 낮추고,
+           간격이 base_interval 로 돌아온 뒤에도 여유가 있으면 한 단계씩 되돌린다.
+
+검출 나이는 백본 시계로만 잰다 (neck-head 가 meta.captured_at 을 응답에 그대로 돌려준다).
+"""
+import collections
+import statistics
+import threading
+import time
+
+from split_controller import Ewma
+
+
+class FramePacer:
+    def __init__(self, target_age, base_interval, max_interval=5.0, resolutions=(640,), max_age=None,
+                 eval_interval=1.0, report_interval=30.0):
+        self.target_age = target_age
+        self.base_interval = base_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.interval = base_interval
+        self.resolutions = sorted(set(resolutions), reverse=True)
+        self.level = 0
+        self.max_age = max_age
+        self.eval_interval = eval_interval
+        self.report_interval = report_interval
+
+        self.age = Ewma()
+        self.transfer = Ewma()  # 응답 왕복 시간 - 서버 처리 시간 (초)
+        self.counters = collections.Counter()
+        self._ages = collections.deque(maxlen=512)  # 최근 검출 나이 (초), 보고용
+        self._new_samples = 0
+        self._expected_wait = 0.0
+        self._load_at = 0.0
+        self._retry_until = 0.0
+        self._latest_captured_at = None
+        self._lock = threading.Lock()
+        self._last_eval = time.monotonic()
+        self._last_report = time.monotonic()
+
+    @property
+    def resolution(self):
+        return self.resolutions[self.level]
+
+    def observe_load(self, load):
+        """neck-head 부하 보고 콜백 (NeckHeadClient.on_load). 거절 / 오류 응답도 포함한다."""
+        now = time.monotonic()
+        with self._lock:
+            if "expected_wait_ms" in load:
+                self._expected_wait = float(load["expected_wait_ms"]) / 1000
+                self._load_at = now
+            if load.get("retry_after"):
+                self._retry_until = now + float(load["retry_after"])
+
+    def observe_result(self, nbytes, rtt, result):
+        """검출 응답 콜백 (NeckHeadClient.on_result)."""
+        with self._lock:
+            server_ms = result.get("server_ms")
+            if server_ms is not None:
+                self.transfer.update(max(rtt - server_ms / 1000, 0.0))
+            captured_at = result.get("captured_at")
+            if captured_at is None:
+                return
+            age = max(time.time() - captured_at, 0.0)
+            self.age.update(age)
+            self._ages.append(age)
+            self._new_samples += 1
+            if self._latest_captured_at is None or captured_at > self._latest_captured_at:
+                self._latest_captured_at = captured_at
+
+    def detection_age(self):
+        """지금 쓰고 있는 검출 결과의 나이(초). 아직 결과가 없으면 None."""
+        if self._latest_captured_at is None:
+            return None
+        return max(time.time() - self._latest_captured_at, 0.0)
+
+    def is_stale(self):
+        """max_age 보다 오래된 검출 결과면 True (그리지 않는다)."""
+        age = self.detection_age()
+        return self.max_age is not None and age is not None and age > self.max_age
+
+    def should_send(self):
+        """이번 프레임을 보낼지 정한다. 건너뛰면 이유별로 센다."""
+        now = time.monotonic()
+        self._evaluate(now)
+        self._report(now)
+        with self._lock:
+            if now < self._retry_until:
+                self.counters["skipped_retry"] += 1
+                return False
+            backlog = max(self._expected_wait - (now - self._load_at), 0.0)
+            if backlog + (self.transfer.value or 0.0) > self.target_age:
+                self.counters["skipped_backlog"] += 1
+                return False
+            self.counters["sent"] += 1
+        return True
+
+    def _evaluate(self, now):
+        if now - self._last_eval < self.eval_interval:
+            return
+        self._last_eval = now
+        with self._lock:
+            if not self._new_samples:
+                return
+            self._new_samples = 0
+            age = self.age.value
+        if age > self.target_age:
+            if self.interval < self.max_interval:
+                self.interval = min(max(self.interval * 1.5, 0.05), self.max_interval)
+            elif self.level < len(self.resolutions) - 1:
+                self.level += 1
+                print(f"검출 나이 {age * 1000:.0f} ms > 목표 {self.target_age * 1000:.0f} ms, "
+                      f"입력 해상도 {self.resolutions[self.level - 1]} -> {self.resolution}")
+        elif age < self.target_age * 0.5:
+            if self.interval > self.base_interval:
+                self.interval = max(self.interval / 1.5, self.base_interval)
+            elif self.level > 0:
+                self.level -= 1
+                print(f"검출 나이 {age * 1000:.0f} ms, "
+                      f"입력 해상도 {self.resolutions[self.level + 1]} -> {self.resolution}")
+
+    def stats(self):
+        with self._lock:
+            ages = list(self._ages)
+            counters = dict(self.counters)
+        percentiles = statistics.quantiles(ages, n=20, method="inclusive") if len(ages) >= 2 else []
+        return {
+            "age_p50_ms": round(percentiles[9] * 1000, 1) if percentiles else None,
+            "age_p95_ms": round(percentiles[18] * 1000, 1) if percentiles else None,
+            "interval": round(self.interval, 3),
+            "resolution": self.resolution,
+            **counters,
+        }
+
+    def _report(self, now):
+        if self.report_interval <= 0 or now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        stats = self.stats()
+        print(f"검출 나이 p50 {stats['age_p50_ms']} / p95 {stats['age_p95_ms']} ms "
+              f"(목표 {self.target_age * 1000:.0f} ms), 전송 간격 {stats['interval']} s, 해상도 {stats['resolution']}, "
+              f"전송 {stats.get('sent', 0)} / 건너뜀 {stats.get('skipped_backlog', 0) + stats.get('skipped_retry', 0)}")
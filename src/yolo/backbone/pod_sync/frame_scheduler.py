@@ -0,0 +1,93 @@
+"""
+백본 실행 시점 결정. 카메라 프레임(~20 fps)마다 백본을 돌리지 않고 neck-head 로 보낼 프레임에서만 돌린다.
+
+demand : pacer 의 전송 간격마다, pacer 가 보내도 된다고 할 때만 실행한다 (실행한 프레임은 모두 전송).
+scene  : demand 에 더해, 마지막 실행 프레임과 비교해 장면이 그대로면(축소 흑백 프레임의 평균 밝기 차이) 건너뛴다.
+         장면이 그대로여도 refresh_interval 마다는 실행해 검출 결과가 오래되지 않게 한다.
+always : 모든 프레임에서 실행하고 전송 시점에 최신 결과를 보낸다 (이전 동작).
+"""
+import collections
+import time
+
+import cv2
+import numpy as np
+
+SCHEDULE_MODES = ("demand", "scene", "always")
+
+
+class SceneChangeDetector:
+    """size x size 흑백으로 줄인 프레임의 평균 절대 차이(0~1)로 장면 변화를 잰다."""
+
+    def __init__(self, size=32):
+        self.size = size
+        self._reference = None
+        self._last = None
+
+    def difference(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self._last = cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self._reference is None:
+            return 1.0
+        return float(np.abs(self._last - self._reference).mean()) / 255
+
+    def accept(self):
+        """마지막으로 잰 프레임을 다음 비교 기준으로 삼는다."""
+        self._reference = self._last
+
+
+class FrameScheduler:
+    def __init__(self, mode="demand", scene_threshold=0.02, refresh_interval=2.0, report_interval=30.0):
+        if mode not in SCHEDULE_MODES:
+            raise ValueError(f"알 수 없는 schedule: {mode}")
+        self.mode = mode
+        self.scene = SceneChangeDetector() if mode == "scene" else None
+        self.scene_threshold = scene_threshold
+        self.refresh_interval = refresh_interval
+        self.report_interval = report_interval
+        self.counters = collections.Counter()
+        self._last_tick = 0.0
+        self._last_run = 0.0
+        self._last_report = time.monotonic()
+
+    @property
+    def on_demand(self):
+        """True 면 실행한 프레임을 모두 전송한다 (전송 간격 / 건너뛰기는 여기서 이미 판단)."""
+        return self.mode != "always"
+
+    def should_run(self, frame, pacer):
+        """이번 카메라 프레임에서 백본을 실행할지 정한다."""
+        now = time.monotonic()
+        self._report(now)
+        self.counters["frames"] += 1
+        if not self.on_demand:
+            self.counters["runs"] += 1
+            return True
+        if now - self._last_tick < pacer.interval:
+            return False
+        if self.scene is not None and now - self._last_run < self.refresh_interval:
+            if self.scene.difference(frame) < self.scene_threshold:
+                # 다음 프레임에서 다시 본다 (전송 시점은 그대로)
+                self.counters["skipped_scene"] += 1
+                return False
+        self._last_tick = now
+        # neck-head 가 밀려 있으면 보내도 목표 나이 안에 결과가 오지 않으므로 계산하지 않는다
+        if not pacer.should_send():
+            return False
+        if self.scene is not None:
+            if now - self._last_run >= self.refresh_interval:
+                self.scene.difference(frame)
+            self.scene.accept()
+        self._last_run = now
+        self.counters["runs"] += 1
+        return True
+
+    def _report(self, now):
+        if self.report_interval <= 0 or now - self._last_report < self.report_interval:
+            return
+        elapsed = now - self._last_report
+        self._last_report = now
+        counters = dict(self.counters)
+        self.counters.clear()
+        print(f"백본 실행 {counters.get('runs', 0)} / 카메라 프레임 {counters.get('frames', 0)} "
+              f"({counters.get('runs', 0) / elapsed:.1f} 회/s, schedule {self.mode}, "
+              f"장면 변화 없음 {counters.get('skipped_scene', 0)})")
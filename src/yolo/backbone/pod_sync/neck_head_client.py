@@ -0,0 +1,427 @@
+"""
+neck-head 서버 전송 클라이언트.
+
+HttpNeckHeadClient      : 프레임마다 /process_neck_head 로 multipart POST (응답을 기다림)
+WebSocketNeckHeadClient : /ws/neck_head 지속 연결. 응답을 기다리지 않고 SDIT 프레임을 연속 전송하고,
+                          수신 스레드가 frame_id 가 붙은 검출 결과를 받아 반영한다.
+UnixSocketNeckHeadClient: 같은 노드의 neck-head 와 Unix domain socket 으로 WebSocket 과 같은 스트림을 주고받는다.
+LocalFirstNeckHeadClient: 로컬 소켓에 연결할 수 있으면 UDS, 아니면 network 클라이언트로 보낸다.
+
+모든 클라이언트가 가장 최근 검출 결과를 detections 속성으로 제공한다.
+on_result 를 지정하면 응답마다 on_result(전송 바이트, 왕복 시간(초), 응답 dict) 를 호출한다.
+on_load 를 지정하면 거절 / 오류를 포함한 모든 응답마다 on_load(서버 부하 dict) 를 호출한다
+(queue_depth / service_ms / expected_wait_ms, 거절이면 retry_after).
+서버가 delta 프레임의 기준 keyframe 이 없다고 거절하면 keyframe_required 가 True 가 된다 (송신 측이 확인 후 내린다).
+use_packed_detections 로 class 표를 넘기면 Accept 헤더로 SDID 검출 응답을 요청한다 (JSON 대신 22B/검출).
+"""
+import json
+import socket
+import threading
+import time
+
+import requests
+
+import split_protocol
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+
+class NeckHeadClient:
+    transport = None
+
+    def __init__(self):
+        self.detections = []
+        self.on_result = None
+        self.on_load = None
+        self.keyframe_required = False
+        self.class_names = None
+        self.class_table = None
+        self._last_frame_id = -1
+        self._lock = threading.Lock()
+
+    @property
+    def packed(self):
+        return self.class_names is not None
+
+    def use_packed_detections(self, class_names, class_table):
+        """SDID 검출 응답을 요청한다. class 이름 표는 /split_info 에서 한 번 받은 것을 쓴다."""
+        self.class_names = list(class_names)
+        self.class_table = class_table
+
+    def accept_header(self):
+        if not self.packed:
+            return "application/json"
+        return f"{split_protocol.DETECTIONS_CONTENT_TYPE}, application/json;q=0.5"
+
+    def _parse(self, body):
+        """응답 본문(JSON 또는 SDID)을 (응답 dict, 검출 리스트) 로 바꾼다."""
+        if isinstance(body, bytes) and split_protocol.is_detections_payload(body):
+            records, result = split_protocol.decode_detections(body)
+            names = self.class_names or []
+            if result.get("class_table") != self.class_table:
+                print("neck-head class 표가 /split_info 와 달라 class id 로 표시합니다.")
+                names = []
+            return result, split_protocol.detections_to_dicts(records, names)
+        result = json.loads(body)
+        return result, result.get("detections", [])
+
+    def _notify(self, nbytes, rtt, result):
+        if self.on_result is not None:
+            self.on_result(nbytes, rtt, result)
+
+    def _notify_load(self, load):
+        if self.on_load is not None and load:
+            self.on_load(load)
+
+    def _check_keyframe(self, result):
+        """기준 keyframe 이 없어 거절된 응답이면 keyframe_required 를 세운다."""
+        if result.get("keyframe_required"):
+            self.keyframe_required = True
+            return True
+        return False
+
+    def _apply_result(self, frame_id, detections):
+        with self._lock:
+            # 파이프라이닝 중 늦게 도착한 이전 프레임 결과는 버린다.
+            if frame_id is not None:
+                if frame_id < self._last_frame_id:
+                    return
+                self._last_frame_id = frame_id
+            self.detections = detections
+
+    def send(self, frame_id, payload, filename, content_type):
+        """페이로드를 전송한다. 전송하지 못하고 건너뛴 경우 False."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class HttpNeckHeadClient(NeckHeadClient):
+    transport = "http"
+
+    def __init__(self, url, timeout=5):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, frame_id, payload, filename, content_type):
+        try:
+            files = {"file": (filename, payload, content_type)}
+            sent_at = time.perf_counter()
+            response = self.session.post(
+                self.url, files=files, headers={"Accept": self.accept_header()}, timeout=self.timeout
+            )
+            load = {
+                field: float(response.headers[header])
+                for field, header in split_protocol.LOAD_HEADERS.items() if header in response.headers
+            }
+            if "Retry-After" in response.headers:
+                load["retry_after"] = float(response.headers["Retry-After"])
+            self._notify_load(load)
+            result, detections = self._parse(response.content)
+            self._apply_result(frame_id, detections)
+            if response.status_code == 200:
+                self._notify(len(payload), time.perf_counter() - sent_at, result)
+            elif not self._check_keyframe(result):
+                print(f"neck-head 서버 오류 응답 {response.status_code}:", result.get("detail"))
+        except Exception as e:
+            print("neck-head 서버 요청 실패:", e)
+            self._apply_result(frame_id, [])
+        return True
+
+    def close(self):
+        self.session.close()
+
+
+class StreamNeckHeadClient(NeckHeadClient):
+    """
+    지속 연결 스트림 공통 동작. 응답을 기다리지 않고 프레임을 보내고(max_inflight 까지),
+    수신 스레드가 frame_id 로 결과를 맞춘다. 하위 클래스는 _open / _recv / _send_payload / _close 를 구현한다.
+    """
+
+    def __init__(self, url, max_inflight=4, connect_timeout=2, reconnect_interval=3):
+        super().__init__()
+        self.url = url
+        self.max_inflight = max_inflight
+        self.connect_timeout = connect_timeout
+        self.reconnect_interval = reconnect_interval
+        self._conn = None
+        self._inflight = 0
+        self._sent = {}  # frame_id -> (전송 시각, 바이트)
+        self._last_connect_attempt = 0.0
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _recv(self, conn):
+        """응답 메시지 하나 (bytes 또는 str). 연결이 닫히면 빈 값."""
+        raise NotImplementedError
+
+    def _send_payload(self, conn, payload):
+        raise NotImplementedError
+
+    def _close(self, conn):
+        raise NotImplementedError
+
+    def ensure_connected(self):
+        """연결되어 있거나 지금 연결했으면 True. 재연결 시도는 reconnect_interval 마다 한 번."""
+        return (self._conn or self._connect()) is not None
+
+    def _connect(self):
+        now = time.time()
+        if now - self._last_connect_attempt < self.reconnect_interval:
+            return None
+        self._last_connect_attempt = now
+        try:
+            conn = self._open()
+        except Exception as e:
+            print(f"neck-head {self.transport} 연결 실패:", e)
+            return None
+        with self._lock:
+            self._conn = conn
+            self._inflight = 0
+            self._sent.clear()
+        threading.Thread(target=self._receive_loop, args=(conn,), daemon=True).start()
+        print(f"neck-head {self.transport} 연결: {self.url}")
+        return conn
+
+    def _disconnect(self, conn, reason):
+        with self._lock:
+            if self._conn is not conn:
+                return
+            self._conn = None
+            self._inflight = 0
+            self._sent.clear()
+            self.detections = []
+        print(f"neck-head {self.transport} 끊김:", reason)
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    def _receive_loop(self, conn):
+        while True:
+            try:
+                message = self._recv(conn)
+            except Exception as e:
+                self._disconnect(conn, e)
+                return
+            if not message:
+                self._disconnect(conn, "서버가 연결을 닫음")
+                return
+            received_at = time.perf_counter()
+            try:
+                result, detections = self._parse_result(message)
+            except Exception as e:
+                # 서버는 프레임마다 응답 하나를 수신 순서대로 보내므로 가장 오래 기다린 프레임의 응답으로 보고 건너뛴다
+                # (수신 스레드가 멈추면 in-flight 가 줄지 않아 전송이 max_inflight 에서 영영 막힌다)
+                print(f"neck-head {self.transport} 응답을 해석할 수 없어 건너뜁니다:", e)
+                with self._lock:
+                    self._inflight = max(self._inflight - 1, 0)
+                    if self._sent:
+                        del self._sent[next(iter(self._sent))]
+                continue
+            with self._lock:
+                self._inflight = max(self._inflight - 1, 0)
+                sent = self._sent.pop(result.get("frame_id"), None)
+            try:
+                self._handle_result(result, detections, sent, received_at)
+            except Exception as e:
+                print(f"neck-head {self.transport} 응답 처리 실패:", e)
+
+    def _parse_result(self, message):
+        """_parse 에 더해 응답이 JSON 객체이고 frame_id / detections 형식이 맞는지 확인한다. 아니면 ValueError."""
+        result, detections = self._parse(message)
+        if not isinstance(result, dict):
+            raise ValueError(f"응답이 JSON 객체가 아닙니다: {type(result).__name__}")
+        frame_id = result.get("frame_id")
+        if frame_id is not None and (isinstance(frame_id, bool) or not isinstance(frame_id, int)):
+            raise ValueError(f"frame_id 가 정수가 아닙니다: {frame_id!r}")
+        if not isinstance(detections, list):
+            raise ValueError(f"detections 가 리스트가 아닙니다: {type(detections).__name__}")
+        return result, detections
+
+    def _handle_result(self, result, detections, sent, received_at):
+        self._notify_load(result)
+        if "error" in result:
+            if not self._check_keyframe(result):
+                print(f"neck-head {self.transport} 오류:", result["error"])
+            return
+        self._apply_result(result.get("frame_id"), detections)
+        if sent is not None:
+            self._notify(sent[1], received_at - sent[0], result)
+
+    def send(self, frame_id, payload, filename, content_type):
+        if not self.ensure_connected():
+            return False
+        with self._lock:
+            conn = self._conn
+            if conn is None:  # 수신 스레드가 방금 연결을 끊은 경우
+                return False
+            # 응답이 밀려 있으면 이번 프레임은 건너뛴다 (카메라 주기가 RTT 에 묶이지 않도록).
+            if self._inflight >= self.max_inflight:
+                return False
+            self._inflight += 1
+            self._sent[frame_id] = (time.perf_counter(), len(payload))
+        try:
+            self._send_payload(conn, payload)
+        except Exception as e:
+            self._disconnect(conn, e)
+            return False
+        return True
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            self._disconnect(conn, "종료")
+
+
+class WebSocketNeckHeadClient(StreamNeckHeadClient):
+    transport = "websocket"
+
+    def __init__(self, url, **kwargs):
+        if websocket is None:
+            raise RuntimeError("websocket-client 패키지가 설치되어 있지 않습니다.")
+        super().__init__(url, **kwargs)
+
+    def _open(self):
+        ws = websocket.create_connection(
+            self.url, timeout=self.connect_timeout, header=[f"Accept: {self.accept_header()}"]
+        )
+        ws.settimeout(None)
+        return ws
+
+    def _recv(self, ws):
+        return ws.recv()
+
+    def _send_payload(self, ws, payload):
+        ws.send_binary(payload)
+
+    def _close(self, ws):
+        ws.close()
+
+
+class UnixSocketNeckHeadClient(StreamNeckHeadClient):
+    """같은 노드의 neck-head 와 hostPath 로 공유한 Unix domain socket 스트림 (길이 prefix framing)."""
+
+    transport = "uds"
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self._send_lock = threading.Lock()
+
+    def _write_frame(self, sock, payload):
+        with self._send_lock:
+            sock.sendall(split_protocol.STREAM_FRAME_HEADER.pack(len(payload)))
+            sock.sendall(memoryview(payload))  # 페이로드를 복사하지 않고 그대로 커널로 넘긴다
+
+    def _open(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.url)
+            sock.settimeout(None)
+            self._write_frame(sock, json.dumps({"accept": self.accept_header()}).encode("utf-8"))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                return None
+            received += n
+        return bytes(buffer)
+
+    def _recv(self, sock):
+        header = self._recv_exact(sock, split_protocol.STREAM_FRAME_HEADER.size)
+        if header is None:
+            return None
+        (size,) = split_protocol.STREAM_FRAME_HEADER.unpack(header)
+        return self._recv_exact(sock, size)
+
+    def _send_payload(self, sock, payload):
+        self._write_frame(sock, payload)
+
+    def _close(self, sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        finally:
+            sock.close()
+
+
+class LocalFirstNeckHeadClient:
+    """
+    같은 노드일 때 로컬(UDS) 클라이언트로 보내고, 연결할 수 없으면 network 클라이언트로 보낸다.
+    로컬 연결은 reconnect_interval 마다 다시 시도하므로 neck-head 가 같은 노드로 돌아오면 자동으로 복귀한다.
+    """
+
+    def __init__(self, local, network):
+        self.local = local
+        self.network = network
+        self._active = network
+
+    @property
+    def transport(self):
+        return f"{self.local.transport}|{self.network.transport}"
+
+    @property
+    def packed(self):
+        return self.network.packed
+
+    @property
+    def detections(self):
+        return self._active.detections
+
+    @property
+    def on_result(self):
+        return self.network.on_result
+
+    @on_result.setter
+    def on_result(self, callback):
+        self.local.on_result = callback
+        self.network.on_result = callback
+
+    @property
+    def on_load(self):
+        return self.network.on_load
+
+    @on_load.setter
+    def on_load(self, callback):
+        self.local.on_load = callback
+        self.network.on_load = callback
+
+    @property
+    def keyframe_required(self):
+        return self.local.keyframe_required or self.network.keyframe_required
+
+    @keyframe_required.setter
+    def keyframe_required(self, value):
+        self.local.keyframe_required = value
+        self.network.keyframe_required = value
+
+    def use_packed_detections(self, class_names, class_table):
+        self.local.use_packed_detections(class_names, class_table)
+        self.network.use_packed_detections(class_names, class_table)
+
+    def send(self, frame_id, payload, filename, content_type):
+        if self.local.ensure_connected():
+            self._active = self.local
+            return self.local.send(frame_id, payload, filename, content_type)
+        self._active = self.network
+        return self.network.send(frame_id, payload, filename, content_type)
+
+    def close(self):
+        self.local.close()
+        self.network.close()
@@ -0,0 +1,60 @@
+"""
+백본 pod 파이프라인 단계(캡처 / 백본 추론 / 업로드) 사이에서 쓰는 동기화 도구.
+"""
+import threading
+import time
+
+
+class LatestSlot:
+    """
+    크기 1 버퍼. 새 값이 들어오면 소비되지 않은 이전 값을 덮어쓴다 (latest frame wins).
+    소비자는 마지막으로 본 seq 를 넘겨 그보다 새 값이 올 때까지 기다린다.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._value = None
+        self._consumer_seq = 0
+
+    def put(self, value):
+        with self._cond:
+            self._seq += 1
+            self._value = value
+            self._cond.notify_all()
+            return self._seq
+
+    def wait_newer(self, seq, timeout=None):
+        """seq 보다 새 값이 있으면 (seq, value), timeout 안에 없으면 None."""
+        with self._cond:
+            self._consumer_seq = seq
+            self._cond.notify_all()
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout):
+                return None
+            return self._seq, self._value
+
+    def wait_consumed(self, timeout=None):
+        """(소비자가 하나일 때) 소비자가 마지막 값까지 처리하고 다음 값을 기다리면 True, timeout 안에 아니면 False."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._consumer_seq >= self._seq, timeout)
+
+
+class RateLimiter:
+    """wait() 호출 사이 간격을 interval 초 이상으로 유지한다. interval 이 0 이하면 제한하지 않는다."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+
+    def wait(self, stop_event=None):
+        if self.interval <= 0:
+            return
+        now = time.monotonic()
+        delay = self._next - now
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            now = self._next
+        self._next = now + self.interval
@@ -6,35 +6,61 @@ from pathlib import Path
 import requests
 import io
 import time
-from datetime import datetime
-
-
-# BackboneModel 클래스 정의 (저장할 때 사용한 클래스)
-class BackboneModel(torch.nn.Module):
-    def __init__(self, layers):
-        super(BackboneModel, self).__init__()
-        self.layers = torch.nn.ModuleList(layers)
-
-    def forward(self, x):
-        outputs = []
-        for m in self.layers:
-            if m.f != -1:
-                if isinstance(m.f, int):
-                    x = outputs[m.f]
-                else:
-                    x = [outputs[j] for j in m.f]
-            x = m(x)
-            outputs.append(x)
-        return outputs
+import threading
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+import split_model
+import split_protocol
+from edge_runtime import RUNTIMES, BackboneModel, EdgeBackbone, configure_threads, fuse_layers
+from payload_archiver import PayloadArchiver
+from neck_head_client import (
+    HttpNeckHeadClient, LocalFirstNeckHeadClient, UnixSocketNeckHeadClient, WebSocketNeckHeadClient, websocket,
+)
+from frame_pacer import FramePacer
+from frame_scheduler import SCHEDULE_MODES, FrameScheduler
+from pipeline import LatestSlot, RateLimiter
+from split_delta import DeltaEncoder
+from split_controller import BATTERY_SCALES, SplitController, calibrate, query_battery_percentage
+from split_trace import Tracer
+from video_client import AutoVideoClient, HttpVideoClient, WebSocketVideoClient, pack_detections, websocket_url
 
 
 # 경로 설정
 YOLO_ROOT = Path.cwd()
-backbone_model_path = YOLO_ROOT / 'yolov5n_backbone.pt'
+backbone_model_path = YOLO_ROOT / os.environ.get("BACKBONE_MODEL_PATH", "yolov5n_backbone.pt")
+# 분할 아티팩트가 없을 때 잘라 쓸 전체 체크포인트와 분할 지점
+full_model_path = YOLO_ROOT / os.environ.get("BACKBONE_FULL_MODEL_PATH", "yolov5n.pt")
+DEFAULT_BACKBONE_LEN = 10
 
-# 안전한 globals를 추가하여 분할한 backbone 모델 로드 (weights_only=False 옵션 사용)
+# 로봇 CPU 실행 설정 (edge_runtime.py). 장치별 최적값은 python edge_runtime.py 로 측정해 고른다
+BACKBONE_RUNTIME = os.environ.get("BACKBONE_RUNTIME", "eager").lower()  # eager / torchscript / onnx
+if BACKBONE_RUNTIME not in RUNTIMES:
+    raise ValueError(f"BACKBONE_RUNTIME 은 {RUNTIMES} 중 하나여야 합니다: {BACKBONE_RUNTIME}")
+BACKBONE_FUSE = os.environ.get("BACKBONE_FUSE", "true").lower() in {"true", "1", "yes", "on"}
+BACKBONE_CHANNELS_LAST = os.environ.get("BACKBONE_CHANNELS_LAST", "false").lower() in {"true", "1", "yes", "on"}
+BACKBONE_THREADS = int(os.environ.get("BACKBONE_THREADS", "0"))  # intra-op, 0 이면 torch 기본값
+BACKBONE_INTEROP_THREADS = int(os.environ.get("BACKBONE_INTEROP_THREADS", "0"))
+# 비우지 않으면 분할 지점별 TorchScript / ONNX 파일을 이 디렉터리에 남긴다
+BACKBONE_EXPORT_DIR = os.environ.get("BACKBONE_EXPORT_DIR", "")
+configure_threads(BACKBONE_THREADS, BACKBONE_INTEROP_THREADS)
+
+# split_model.py 로 만든 백본 아티팩트 로드. 이전 버전의 BackboneModel 피클 파일도 그대로 읽는다.
 with torch.serialization.safe_globals({"__main__.BackboneModel": BackboneModel}):
-    backbone_model = torch.load(backbone_model_path, map_location='cpu', weights_only=False).eval()
+    backbone_layers, backbone_meta = split_model.load_part(
+        backbone_model_path, "backbone", fallback=full_model_path, split=DEFAULT_BACKBONE_LEN
+    )
+backbone_model = BackboneModel(backbone_layers).float().eval()
+fused_layers = fuse_layers(backbone_model) if BACKBONE_FUSE else 0
+backbone_runner = EdgeBackbone(
+    backbone_model, BACKBONE_RUNTIME, BACKBONE_CHANNELS_LAST, save_dir=BACKBONE_EXPORT_DIR or None,
+    name=backbone_model_path.stem,
+)
+# 이 백본이 계산할 수 있는 분할 지점 (= 실행할 레이어 수)
+BACKBONE_SPLIT_POINTS = split_model.split_points("backbone", backbone_layers, backbone_meta)
+print(f"백본 모델 로드 완료 (레이어 0~{len(backbone_layers) - 1}, 기본 분할 지점 {backbone_meta['backbone_len']}, "
+      f"{BACKBONE_RUNTIME}, Conv+BN fuse {fused_layers}개, channels_last {backbone_runner.channels_last}, "
+      f"intra-op 스레드 {torch.get_num_threads()})")
 
 # 이미지 전처리 transform 정의
 transform = T.Compose([T.ToTensor()])
@@ -48,76 +74,298 @@ process_url = os.environ.get(
     f"http://{target_host}:30080/process_neck_head"
 )
 
+# neck-head 서버가 실제로 사용하는 백본 출력 인덱스를 알려주는 엔드포인트
+split_info_url = os.environ.get(
+    "BACKBONE_SPLIT_INFO_URL",
+    process_url.rsplit("/", 1)[0] + "/split_info"
+)
+SPLIT_INFO_RETRY_SEC = float(os.environ.get("BACKBONE_SPLIT_INFO_RETRY_SEC", "10"))
+# 분할 지점(백본이 실행할 레이어 수). 0 이면 neck-head 서버의 기본값을 따른다
+SPLIT = int(os.environ.get("BACKBONE_SPLIT", "0"))
+# neck-head 가 처리에 쓸 head 모델 ID. 비우면 서버 기본 모델
+MODEL_ID = os.environ.get("BACKBONE_MODEL_ID", "")
+
+# 적응형 분할: 업로드 처리량 / 서버 큐 대기 / CPU / 배터리를 보고 실행 중 분할 지점을 옮긴다
+ADAPTIVE_SPLIT = os.environ.get("BACKBONE_ADAPTIVE_SPLIT", "false").lower() in {"true", "1", "yes", "on"}
+# 후보 분할 지점 (쉼표 구분). 비어 있으면 서버와 백본이 모두 처리할 수 있는 전체 지점
+ADAPTIVE_SPLITS = [int(s) for s in os.environ.get("BACKBONE_ADAPTIVE_SPLITS", "").split(",") if s.strip()]
+SPLIT_EVAL_SEC = float(os.environ.get("BACKBONE_SPLIT_EVAL_SEC", "2"))
+SPLIT_MIN_DWELL_SEC = float(os.environ.get("BACKBONE_SPLIT_MIN_DWELL_SEC", "10"))
+SPLIT_HYSTERESIS = float(os.environ.get("BACKBONE_SPLIT_HYSTERESIS", "0.15"))
+SERVER_SPEEDUP = float(os.environ.get("BACKBONE_SERVER_SPEEDUP", "4"))  # 서버가 로봇보다 몇 배 빠른지
+CPU_HIGH_PCT = float(os.environ.get("BACKBONE_CPU_HIGH_PCT", "85"))
+LOW_BATTERY_PCT = float(os.environ.get("BACKBONE_LOW_BATTERY_PCT", "20"))
+LOW_BATTERY_WEIGHT = float(os.environ.get("BACKBONE_LOW_BATTERY_WEIGHT", "2"))
+
+# 배터리 텔레메트리 (metric-collector ingester 가 적재한 InfluxDB). INFLUX_URL 이 없으면 사용하지 않음
+INFLUX_URL = os.environ.get("INFLUX_URL")
+INFLUX_TOKEN = os.environ.get("INFLUX_TOKEN")
+INFLUX_ORG = os.environ.get("INFLUX_ORG", "keti")
+INFLUX_BUCKET = os.environ.get("INFLUX_BUCKET", "turtlebot")
+# 배터리 텔레메트리의 percentage 단위: fraction(0~1, ROS BatteryState) / percent(0~100)
+BATTERY_SCALE = os.environ.get("BACKBONE_BATTERY_SCALE", "fraction").lower()
+if BATTERY_SCALE not in BATTERY_SCALES:
+    raise ValueError(f"BACKBONE_BATTERY_SCALE 은 {tuple(BATTERY_SCALES)} 중 하나여야 합니다: {BATTERY_SCALE}")
+NODE_NAME = os.environ.get("NODE_NAME", "")
+BOT_NAME = os.environ.get("BACKBONE_BOT_NAME", NODE_NAME)
+
+# 전송 포맷: auto(서버가 지원하면 SDIT 바이너리) / binary / torch(torch.save)
+WIRE_FORMAT = os.environ.get("BACKBONE_WIRE_FORMAT", "auto").lower()
+# 전송 전 양자화: none / fp16 / int8 (채널별). SDIT wire version 2 이상에서만 적용
+QUANTIZATION = os.environ.get("BACKBONE_QUANTIZATION", "none").lower()
+if QUANTIZATION not in split_protocol.QUANTIZATION_MODES:
+    raise ValueError(f"BACKBONE_QUANTIZATION 은 {split_protocol.QUANTIZATION_MODES} 중 하나여야 합니다: {QUANTIZATION}")
+# 연속 프레임 delta encoding (SDIT v3, split_delta.py). keyframe 이후에는 keyframe 과의 차이만 보낸다.
+# threshold 는 버릴 residual 크기 (keyframe 텐서 최대 절댓값 대비), delta 가 keyframe 의 max_ratio 를 넘으면 새 keyframe
+DELTA_ENCODING = os.environ.get("BACKBONE_DELTA_ENCODING", "false").lower() in {"true", "1", "yes", "on"}
+DELTA_KEYFRAME_INTERVAL = int(os.environ.get("BACKBONE_DELTA_KEYFRAME_INTERVAL", "30"))
+DELTA_THRESHOLD = float(os.environ.get("BACKBONE_DELTA_THRESHOLD", "0.01"))
+DELTA_MAX_RATIO = float(os.environ.get("BACKBONE_DELTA_MAX_RATIO", "0.5"))
+
+# neck-head 전송 방식: auto(서버가 스트림을 지원하면 websocket) / http / websocket
+TRANSPORT = os.environ.get("BACKBONE_TRANSPORT", "auto").lower()
+# 미지정 시 process_url 의 호스트와 split_info 의 stream_path 로 구성
+stream_url = os.environ.get("BACKBONE_NECK_HEAD_WS_URL")
+WS_MAX_INFLIGHT = int(os.environ.get("BACKBONE_WS_MAX_INFLIGHT", "4"))
+# neck-head 와 같은 노드(NODE_NAME 일치)면 hostPath 로 공유한 이 소켓으로 보낸다 (비우면 사용 안 함)
+LOCAL_SOCKET = os.environ.get("BACKBONE_LOCAL_SOCKET", "/run/sdi-split/neck-head.sock")
+# 검출 응답 포맷: auto(서버가 지원하면 SDID 바이너리) / json
+DETECTIONS_FORMAT = os.environ.get("BACKBONE_DETECTIONS_FORMAT", "auto").lower()
+
 FASTAPI_SERVER_URL = os.environ.get(
     "BACKBONE_FASTAPI_URL",
     f"http://{os.environ.get('BACKBONE_FASTAPI_HOST', target_host)}:8000/upload_image"
 )
+# 이미지 서버의 stream(채널) ID. 여러 로봇이 같은 서버를 쓰므로 기본은 로봇 이름, 비우면 서버의 기본 stream
+VIDEO_STREAM = os.environ.get("BACKBONE_VIDEO_STREAM", BOT_NAME)
+# 이미지 서버 전송 방식: auto(서버가 지원하면 websocket 지속 연결, 아니면 HTTP) / http / websocket (video_client.py)
+VIDEO_TRANSPORT = os.environ.get("BACKBONE_VIDEO_TRANSPORT", "auto").lower()
+# 미지정 시 BACKBONE_FASTAPI_URL 의 호스트와 /ws/upload_image/{stream} 로 구성
+VIDEO_WS_URL = os.environ.get("BACKBONE_VIDEO_WS_URL") or websocket_url(FASTAPI_SERVER_URL, VIDEO_STREAM)
+VIDEO_WS_RECONNECT_SEC = float(os.environ.get("BACKBONE_VIDEO_WS_RECONNECT_SEC", "10"))
+# 검출 결과를 그리는 곳: auto(서버가 지원하면 서버) / server / robot. 서버에서 그리면 로봇은 원본 프레임과 검출 결과만 보낸다
+VIDEO_OVERLAY = os.environ.get("BACKBONE_VIDEO_OVERLAY", "auto").lower()
+
+# 단계별 실행 간격 (초). 0 이면 새 프레임이 들어오는 대로 처리
+INFER_INTERVAL_SEC = float(os.environ.get("BACKBONE_INFER_INTERVAL_SEC", "0"))
+HEAD_INTERVAL_SEC = float(os.environ.get("BACKBONE_HEAD_INTERVAL_SEC", "0.5"))
+
+# 검출 나이(캡처 ~ 검출 결과 수신) 목표. neck-head 가 밀리면 전송 간격을 늘리고 프레임을 건너뛰며,
+# 그래도 넘으면 입력 해상도를 낮춘다 (frame_pacer.py). 해상도 단계는 32 의 배수, 쉼표 구분
+TARGET_AGE_MS = float(os.environ.get("BACKBONE_TARGET_AGE_MS", "1000"))
+MAX_HEAD_INTERVAL_SEC = float(os.environ.get("BACKBONE_MAX_HEAD_INTERVAL_SEC", "5"))
+RESOLUTIONS = [int(r) for r in os.environ.get("BACKBONE_RESOLUTIONS", "640,480,320").split(",") if r.strip()]
+# 이보다 오래된 검출 결과는 영상에 그리지 않는다 (기본 목표의 3배, 0 이면 항상 그림)
+DETECTION_MAX_AGE_MS = float(os.environ.get("BACKBONE_DETECTION_MAX_AGE_MS", str(TARGET_AGE_MS * 3)))
+PACER_REPORT_SEC = float(os.environ.get("BACKBONE_PACER_REPORT_SEC", "30"))
+# 백본 실행 시점: demand(전송할 프레임만) / scene(+ 장면 변화가 없으면 건너뜀) / always(모든 프레임, frame_scheduler.py)
+SCHEDULE = os.environ.get("BACKBONE_SCHEDULE", "demand").lower()
+if SCHEDULE not in SCHEDULE_MODES:
+    raise ValueError(f"BACKBONE_SCHEDULE 은 {SCHEDULE_MODES} 중 하나여야 합니다: {SCHEDULE}")
+# 축소 흑백 프레임의 평균 밝기 차이(0~1)가 이보다 작으면 장면이 그대로라고 본다
+SCENE_THRESHOLD = float(os.environ.get("BACKBONE_SCENE_THRESHOLD", "0.02"))
+# 장면이 그대로여도 이 간격마다는 실행 (기본은 검출 결과를 그리는 최대 나이의 절반)
+SCENE_REFRESH_SEC = float(os.environ.get(
+    "BACKBONE_SCENE_REFRESH_SEC", str(DETECTION_MAX_AGE_MS / 2000 if DETECTION_MAX_AGE_MS > 0 else MAX_HEAD_INTERVAL_SEC)
+))
+VIDEO_INTERVAL_SEC = float(os.environ.get("BACKBONE_VIDEO_INTERVAL_SEC", "0.05"))
 
 SAVE_INPUT_IMAGES = os.environ.get("SAVE_INPUT_IMAGES", "true").lower() in {"true", "1", "yes", "on"}
 INPUT_IMAGE_SAVE_DIR = Path(os.environ.get("INPUT_IMAGE_SAVE_DIR", "/data/backbone-input-images")).resolve()
+# 샘플링 / 대기열 / 용량·기간 제한 / 압축은 ARCHIVE_* 환경 변수 (payload_archiver.py)
+input_image_archiver = PayloadArchiver.from_env(INPUT_IMAGE_SAVE_DIR, "frame", enabled=SAVE_INPUT_IMAGES)
 
-if SAVE_INPUT_IMAGES:
-    INPUT_IMAGE_SAVE_DIR.mkdir(parents=True, exist_ok=True)
 
-# 웹캠 열기 (기본 카메라 장치 0번 사용)
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    raise RuntimeError("카메라를 열 수 없습니다.")
+def fetch_split_info():
+    """neck-head 서버의 split 정보(필요한 백본 출력, 지원 wire version)를 받아온다. 실패 시 None."""
+    try:
+        params = {"model": MODEL_ID} if MODEL_ID else None
+        response = requests.get(split_info_url, params=params, timeout=2)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print("neck-head split 정보 요청 실패 (전체 백본 출력을 torch.save 로 전송):", e)
+        return None
 
-print("실시간 카메라 스트림 시작 (0.5초마다 neck-head 서버 전송, 20fps로 FastAPI 서버에 이미지 전송)")
 
-last_process_time = 0
-detections = []  # 마지막 서버 전송에서 받은 검출 결과
+def choose_split(split_info):
+    """백본과 서버가 모두 처리할 수 있는 분할 지점 중 BACKBONE_SPLIT(미지정 시 서버 기본값)에 가장 가까운 값."""
+    info = split_info or {}
+    server_default = info.get("backbone_len", backbone_meta["backbone_len"])
+    wanted = SPLIT or server_default
+    server_points = info.get("split_points") or [server_default]
+    candidates = [s for s in server_points if s in BACKBONE_SPLIT_POINTS]
+    if not candidates:
+        print(f"neck-head 서버와 공통 분할 지점이 없습니다 (서버: {server_points}, 백본: {BACKBONE_SPLIT_POINTS})")
+        candidates = BACKBONE_SPLIT_POINTS
+    split = min(candidates, key=lambda s: abs(s - wanted))
+    if split != wanted:
+        print(f"분할 지점 {wanted} 을 사용할 수 없어 {split} 로 실행합니다.")
+    return split
 
-while True:
-    # 프레임 획득
-    ret, frame = cap.read()
-    if not ret:
-        print("프레임을 읽어올 수 없습니다.")
-        break
 
-    # 프레임을 640x640 크기로 resize하여 frame_resized에 저장
-    frame_resized = cv2.resize(frame, (640, 640))
+def required_outputs_of(split_info, split):
+    """split 지점에서 서버가 사용하는 백본 출력 인덱스. 모르면 None (전체 전송)."""
+    info = split_info or {}
+    required = (info.get("required_outputs_by_split") or {}).get(str(split))
+    if required is None and split == info.get("backbone_len"):
+        required = info.get("required_outputs")
+    return set(required) if required is not None else None
 
-    # BGR -> RGB 변환 및 tensor 변환
-    frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-    input_tensor = transform(frame_rgb).unsqueeze(0)  # [1, 3, 640, 640]
 
-    # Backbone 추론 (실시간으로 진행)
-    with torch.no_grad():
-        backbone_outputs = backbone_model(input_tensor)
+def wire_version_of(split_info):
+    """사용할 SDIT wire version. torch.save 포맷을 써야 하면 None."""
+    if WIRE_FORMAT == "torch":
+        return None
+    if WIRE_FORMAT == "binary":
+        return split_protocol.WIRE_VERSION
+    return split_protocol.negotiate_wire_version((split_info or {}).get("wire_versions"))
 
 
-    current_time = time.time()
-    if current_time - last_process_time >= 0.5:
-        last_process_time = current_time
-        if SAVE_INPUT_IMAGES:
-            timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
-            image_filename = INPUT_IMAGE_SAVE_DIR / f"frame_{timestamp}.jpg"
-            if cv2.imwrite(str(image_filename), frame_resized):
-                print(f"입력 이미지 저장: {image_filename}")
-            else:
-                print("입력 이미지 저장 실패")
-        # 백본 출력 리스트를 메모리 버퍼에 저장 (바이너리 형식)
-        buffer = io.BytesIO()
-        torch.save(backbone_outputs, buffer)
-        buffer.seek(0)
-        data_bytes = buffer.getvalue()
-        data_size = len(data_bytes)
-        print(f"전송 데이터 크기: {data_size} 바이트")
-
-        try:
-            files = {"file": ("backbone_outputs.pt", data_bytes)}
-            response = requests.post(process_url, files=files, timeout=5)
-            resp_json = response.json()
-            detections = resp_json.get("detections", [])
-            print("neck-head 서버 응답:", detections)
-        except Exception as e:
-            print("neck-head 서버 요청 실패:", e)
-            detections = []
-
-    # 프레임에 검출 결과 그리기 (최근 neck-head 서버 결과 사용)
-    frame_draw = frame_resized.copy()  # BGR 이미지
+def quantization_for(version):
+    """협상된 wire version 에서 쓸 수 있는 양자화 모드."""
+    if QUANTIZATION != "none" and (version or 0) < 2:
+        return "none"
+    return QUANTIZATION
+
+
+def create_neck_head_client(split_info, wire_version):
+    """
+    설정과 서버 지원 여부에 따라 WebSocket 스트림 또는 HTTP 클라이언트를 만든다.
+    neck-head 와 같은 노드면 로컬 소켓을 먼저 쓰고, 연결할 수 없을 때만 이 클라이언트로 보낸다.
+    """
+    client = _create_transport(split_info, wire_version)
+    info = split_info or {}
+    if is_colocated(info) and wire_version:
+        client = LocalFirstNeckHeadClient(UnixSocketNeckHeadClient(LOCAL_SOCKET, max_inflight=WS_MAX_INFLIGHT), client)
+    if (DETECTIONS_FORMAT == "auto" and info.get("classes")
+            and split_protocol.DETECTIONS_CONTENT_TYPE in (info.get("detection_formats") or [])):
+        client.use_packed_detections(info["classes"], info.get("class_table"))
+    return client
+
+
+def is_colocated(info):
+    """neck-head 가 같은 노드에서 로컬 소켓을 열어 두었고, 이 pod 에서도 그 소켓이 보이는지."""
+    return bool(
+        LOCAL_SOCKET and NODE_NAME and info.get("node_name") == NODE_NAME
+        and info.get("local_socket") and Path(LOCAL_SOCKET).exists()
+    )
+
+
+def _create_transport(split_info, wire_version):
+    stream_path = (split_info or {}).get("stream_path")
+    wants_stream = TRANSPORT == "websocket" or (TRANSPORT == "auto" and (stream_url or stream_path))
+    if wants_stream and wire_version and websocket is not None:
+        url = stream_url
+        if not url:
+            parts = urlsplit(process_url)
+            scheme = "wss" if parts.scheme == "https" else "ws"
+            url = urlunsplit((scheme, parts.netloc, stream_path or "/ws/neck_head", "", ""))
+        return WebSocketNeckHeadClient(url, max_inflight=WS_MAX_INFLIGHT)
+    if TRANSPORT == "websocket":
+        print("WebSocket 전송을 사용할 수 없어 HTTP 로 전송합니다 (SDIT 미지원 서버 또는 websocket-client 미설치).")
+    return HttpNeckHeadClient(process_url, timeout=5)
+
+
+def create_split_controller(split_info, wire_version):
+    """적응형 분할이 켜져 있으면 후보 분할 지점을 calibrate 해 제어기를 만든다."""
+    if not ADAPTIVE_SPLIT or split_info is None:
+        return None
+    by_split = {int(s): set(r) for s, r in (split_info.get("required_outputs_by_split") or {}).items()}
+    points = [
+        s for s in sorted(by_split)
+        if s in BACKBONE_SPLIT_POINTS and (not ADAPTIVE_SPLITS or s in ADAPTIVE_SPLITS)
+    ]
+    if len(points) < 2:
+        # 분할 범위 없이(--split 만) 만든 아티팩트면 백본과 head 가 같이 처리할 수 있는 지점이 하나뿐이다
+        print("=" * 80)
+        print(f"경고: BACKBONE_ADAPTIVE_SPLIT=true 이지만 후보 분할 지점이 {points} 뿐이라 적응형 분할을 끕니다.")
+        print(f"  백본 아티팩트 분할 지점: {BACKBONE_SPLIT_POINTS[0]}~{BACKBONE_SPLIT_POINTS[-1]}, "
+              f"neck-head 분할 지점: {sorted(by_split)}")
+        print("  두 이미지를 같은 범위로 다시 빌드하세요 (--build-arg MIN_SPLIT=4 --build-arg MAX_SPLIT=17, "
+              "split_model.py --min-split / --max-split).")
+        print("=" * 80)
+        return None
+    layer_ms, cut_bytes = calibrate(
+        backbone_model.layers, {s: by_split[s] for s in points}, wire_version, quantization_for(wire_version)
+    )
+    def _query_battery():
+        return query_battery_percentage(
+            INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET, BOT_NAME, scale=BATTERY_SCALE
+        )
+
+    battery_source = None
+    if INFLUX_URL and BOT_NAME:
+        battery_source = _query_battery
+    print(f"적응형 분할 후보: {points}, 배터리 조회: {BOT_NAME if battery_source else '사용 안 함'}")
+    return SplitController(
+        layer_ms, cut_bytes,
+        server_speedup=SERVER_SPEEDUP, hysteresis=SPLIT_HYSTERESIS, min_dwell=SPLIT_MIN_DWELL_SEC,
+        eval_interval=SPLIT_EVAL_SEC, cpu_high=CPU_HIGH_PCT, low_battery=LOW_BATTERY_PCT,
+        battery_weight=LOW_BATTERY_WEIGHT, battery_source=battery_source,
+    )
+
+
+def select_backbone_outputs(outputs, required):
+    """required 에 없는 출력은 None 으로 비워 인덱스는 유지하고 전송량만 줄인다."""
+    if required is None:
+        return outputs
+    return [out if i in required else None for i, out in enumerate(outputs)]
+
+
+def payload_meta(captured_at=None, scale=1.0):
+    """SDIT meta: 검출 나이 계산용 캡처 시각과, 입력 해상도를 낮췄으면 box 를 되돌릴 배율."""
+    meta = {"model": MODEL_ID} if MODEL_ID else {}
+    if captured_at is not None:
+        meta["captured_at"] = round(captured_at, 6)
+    if scale != 1.0:
+        meta["scale"] = scale
+    return meta
+
+
+def create_delta_encoder(wire_version):
+    """BACKBONE_DELTA_ENCODING 이 켜져 있고 서버가 SDIT v3 를 지원하면 DeltaEncoder, 아니면 None."""
+    if not DELTA_ENCODING or (wire_version or 0) < split_protocol.DELTA_WIRE_VERSION:
+        return None
+    # 재시작한 백본이 이전 프로세스의 keyframe 기준을 쓰지 않도록 stream 이름에 임의 suffix 를 붙인다
+    stream_id = f"{BOT_NAME or 'backbone'}-{uuid.uuid4().hex[:8]}"
+    return DeltaEncoder(
+        stream_id, keyframe_interval=DELTA_KEYFRAME_INTERVAL, threshold=DELTA_THRESHOLD,
+        max_ratio=DELTA_MAX_RATIO, quantization=quantization_for(wire_version),
+    )
+
+
+def encode_backbone_payload(outputs, required, version, frame_id, captured_at=None, scale=1.0):
+    """(페이로드 바이트, 파일 이름, content type) 을 만든다."""
+    selected_outputs = select_backbone_outputs(outputs, required)
+    if version:
+        meta = payload_meta(captured_at, scale)
+        # SDIT 바이너리 프레임 (raw 텐서 버퍼, pickle 없음)
+        data_bytes = split_protocol.encode_outputs(
+            selected_outputs, version=version, quantization=quantization_for(version),
+            frame_id=frame_id, **meta,
+        )
+        return data_bytes, "backbone_outputs.sdit", split_protocol.CONTENT_TYPE
+    # 백본 출력 리스트를 메모리 버퍼에 저장 (torch.save 형식)
+    buffer = io.BytesIO()
+    torch.save(selected_outputs, buffer)
+    return buffer.getvalue(), "backbone_outputs.pt", "application/octet-stream"
+
+
+# 프레임 단위 단계별 시간 (SPLIT_TRACE_LEVEL / SPLIT_TRACE_SAMPLE, 기본 꺼짐)
+backbone_tracer = Tracer("backbone")
+upload_tracer = Tracer("backbone.upload")
+
+
+def encode_jpeg(frame):
+    ok, jpeg = cv2.imencode(".jpg", frame)
+    if not ok:
+        raise ValueError("JPEG 인코딩 실패")
+    return jpeg.tobytes()
+
+
+def draw_detections(frame, detections):
+    frame_draw = frame.copy()  # BGR 이미지
     for det in detections:
         box = det["box"]
         label = det["class"]
@@ -133,21 +381,261 @@ while True:
             (0, 255, 0),
             2
         )
+    return frame_draw
+
+
+class HeadUploader:
+    """최신 백본 출력을 HEAD_INTERVAL_SEC 마다 neck-head 로 보내고 최근 검출 결과를 보관한다."""
+
+    def __init__(self):
+        self.frame_id = 0
+        self.split_info = fetch_split_info()
+        self.last_split_info_time = time.time()
+        self._configure()
+
+    def _configure(self):
+        self.split = choose_split(self.split_info)
+        self.required_outputs = required_outputs_of(self.split_info, self.split)
+        self.wire_version = wire_version_of(self.split_info)
+        self.client = create_neck_head_client(self.split_info, self.wire_version)
+        self.controller = create_split_controller(self.split_info, self.wire_version)
+        self.delta = create_delta_encoder(self.wire_version)
+        # 입력 해상도를 낮추면 box 배율을 SDIT meta 로 보내야 하므로 torch.save 전송에서는 640 고정
+        self.pacer = FramePacer(
+            TARGET_AGE_MS / 1000, HEAD_INTERVAL_SEC, max_interval=MAX_HEAD_INTERVAL_SEC,
+            resolutions=RESOLUTIONS if self.wire_version else [640],
+            max_age=DETECTION_MAX_AGE_MS / 1000 if DETECTION_MAX_AGE_MS > 0 else None,
+            report_interval=PACER_REPORT_SEC,
+        )
+        self.client.on_result = self._on_result
+        self.client.on_load = self.pacer.observe_load
+        print(f"head 모델: {(self.split_info or {}).get('model') or MODEL_ID or '서버 기본'}, "
+              f"분할 지점: {self.split} (백본 레이어 0~{self.split - 1})")
+        if self.required_outputs is not None:
+            print(f"neck-head 가 사용하는 백본 출력 인덱스: {sorted(self.required_outputs)}")
+        print(f"전송 포맷: {'SDIT v%d' % self.wire_version if self.wire_version else 'torch.save'}, "
+              f"양자화: {quantization_for(self.wire_version)}, 전송 방식: {self.client.transport}, "
+              f"검출 응답: {'SDID' if self.client.packed else 'JSON'}")
+        if self.delta is not None:
+            print(f"delta encoding: stream {self.delta.stream_id}, keyframe 간격 {DELTA_KEYFRAME_INTERVAL}, "
+                  f"threshold {DELTA_THRESHOLD}, max ratio {DELTA_MAX_RATIO}")
+
+    def _on_result(self, nbytes, rtt, result):
+        self.pacer.observe_result(nbytes, rtt, result)
+        if self.controller is not None:
+            self.controller.observe_upload(nbytes, rtt, result)
+
+    @property
+    def detections(self):
+        # 목표보다 한참 늦은 검출 결과는 그리지 않는다
+        if self.pacer.is_stale():
+            return []
+        return self.client.detections
+
+    def _refresh_split_info(self):
+        # split 정보를 아직 못 받았다면 주기적으로 다시 시도
+        now = time.time()
+        if self.split_info is not None or now - self.last_split_info_time < SPLIT_INFO_RETRY_SEC:
+            return
+        self.last_split_info_time = now
+        split_info = fetch_split_info()
+        if split_info is not None:
+            self.split_info = split_info
+            self.client.close()
+            self._configure()
+
+    def upload(self, frame_resized, captured_at, input_size, backbone_outputs):
+        # JPEG 인코딩과 쓰기는 보관기의 writer 스레드에서 한다 (frame_resized 는 이후 수정되지 않음)
+        input_image_archiver.submit(lambda: encode_jpeg(frame_resized), ".jpg")
+        self._refresh_split_info()
+        if self.controller is not None:
+            # 다음 프레임부터 백본 단계가 새 분할 지점으로 실행한다
+            split = self.controller.decide(self.split)
+            if split != self.split:
+                self.split = split
+                self.required_outputs = required_outputs_of(self.split_info, split)
 
-    # 0.05초 간격 (약 20fps)로 FastAPI 서버에 이미지 전송
-    ret2, jpeg = cv2.imencode('.jpg', frame_draw)
-    if ret2:
-        image_bytes = jpeg.tobytes()
-        try:
-            files = {"file": ("latest.jpg", image_bytes, "image/jpeg")}
-            response = requests.post(FASTAPI_SERVER_URL, files=files, timeout=2)
-            if response.status_code == 200:
-                print("FastAPI 서버에 이미지 전송 성공")
+        self.frame_id += 1
+        trace = upload_tracer.start(frame_id=self.frame_id, split=len(backbone_outputs))
+        # 분할 지점이 바뀌는 도중 계산된 출력일 수 있으므로 출력 길이 기준으로 필요한 인덱스를 고른다.
+        required = required_outputs_of(self.split_info, len(backbone_outputs))
+        scale = frame_resized.shape[1] / input_size
+        pending = None
+        with trace.stage("encode"):
+            if self.delta is not None:
+                if self.client.keyframe_required:
+                    # neck-head 가 기준 keyframe 을 잃었으므로 (재시작 / 다른 replica) 이번 프레임을 keyframe 으로
+                    self.client.keyframe_required = False
+                    self.delta.reset()
+                data_bytes, pending = self.delta.encode(
+                    select_backbone_outputs(backbone_outputs, required), self.frame_id,
+                    **payload_meta(captured_at, scale),
+                )
+                payload_name, payload_type = "backbone_outputs.sdit", split_protocol.CONTENT_TYPE
             else:
-                print("FastAPI 서버에 이미지 전송 실패:", response.status_code)
-        except Exception as e:
-            print("FastAPI 서버 요청 실패:", e)
+                data_bytes, payload_name, payload_type = encode_backbone_payload(
+                    backbone_outputs, required, self.wire_version, self.frame_id,
+                    captured_at=captured_at, scale=scale,
+                )
+        # HTTP 는 응답까지, WebSocket 은 전송까지의 시간
+        with trace.stage("send"):
+            sent = self.client.send(self.frame_id, data_bytes, payload_name, payload_type)
+        if sent and pending is not None:
+            self.delta.commit(pending)
+        age = self.pacer.detection_age()
+        trace.emit(bytes=len(data_bytes), sent=sent, transport=self.client.transport, input_size=input_size,
+                   age_ms=round(age * 1000, 1) if age is not None else None)
+
+    def close(self):
+        self.client.close()
+
+
+# 단계 간 버퍼: 소비되지 않은 이전 값은 새 값으로 덮어쓴다 (latest frame wins)
+captured_frames = LatestSlot()   # (frame_resized, capture_time)
+backbone_results = LatestSlot()  # (frame_resized, capture_time, 입력 해상도, backbone_outputs)
+stop_event = threading.Event()
+
+
+def capture_loop(cap):
+    while not stop_event.is_set():
+        # 프레임 획득
+        ret, frame = cap.read()
+        if not ret:
+            print("프레임을 읽어올 수 없습니다.")
+            break
+        # 프레임을 640x640 크기로 resize하여 frame_resized에 저장
+        captured_frames.put((cv2.resize(frame, (640, 640)), time.time()))
+    stop_event.set()
+
+
+def inference_loop(uploader, scheduler):
+    limiter = RateLimiter(INFER_INTERVAL_SEC)
+    seq = 0
+    while not stop_event.is_set():
+        # 전송할 프레임만 계산할 때는 이전 결과의 전송이 끝난 뒤 가장 새 프레임으로 계산한다
+        if scheduler.on_demand and not backbone_results.wait_consumed(timeout=0.5):
+            continue
+        item = captured_frames.wait_newer(seq, timeout=0.5)
+        if item is None:
+            continue
+        seq, (frame_resized, captured_at) = item
+        if not scheduler.should_run(frame_resized, uploader.pacer):
+            continue
+        split = uploader.split
+        input_size = uploader.pacer.resolution
+        trace = backbone_tracer.start(split=split, input_size=input_size)
+
+        # BGR -> RGB 변환 및 tensor 변환
+        with trace.stage("preprocess"):
+            frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
+            if input_size != frame_rgb.shape[1]:
+                # neck-head 가 밀릴 때 pacer 가 낮춘 해상도. box 는 neck-head 가 meta.scale 로 되돌린다
+                frame_rgb = cv2.resize(frame_rgb, (input_size, input_size), interpolation=cv2.INTER_AREA)
+            input_tensor = transform(frame_rgb).unsqueeze(0)  # [1, 3, input_size, input_size]
+
+        # Backbone 추론 (분할 지점은 프레임마다 읽으므로 변경은 프레임 경계에서 반영된다)
+        backbone_runner.prepare(split, input_size)  # 새 분할 지점의 trace / export 는 측정 시간에서 뺀다
+        started = time.perf_counter()
+        with torch.inference_mode():
+            backbone_outputs = backbone_runner(input_tensor, split)
+        elapsed = time.perf_counter() - started
+        trace.add("backbone", elapsed)
+        trace.emit()
+        if uploader.controller is not None:
+            uploader.controller.observe_backbone(split, elapsed)
+        backbone_results.put((frame_resized, captured_at, input_size, backbone_outputs))
+        limiter.wait(stop_event)
+
+
+def head_upload_loop(uploader, scheduler):
+    limiter = RateLimiter(HEAD_INTERVAL_SEC)
+    seq = 0
+    while not stop_event.is_set():
+        item = backbone_results.wait_newer(seq, timeout=0.5)
+        if item is None:
+            continue
+        seq, (frame_resized, captured_at, input_size, backbone_outputs) = item
+        if scheduler.on_demand:
+            # 전송 간격과 건너뛰기는 scheduler 가 백본 실행 전에 이미 판단했다
+            uploader.upload(frame_resized, captured_at, input_size, backbone_outputs)
+            continue
+        # neck-head 가 밀려 있으면 보내도 목표 나이 안에 결과가 오지 않으므로 이번 프레임은 건너뛴다
+        if uploader.pacer.should_send():
+            uploader.upload(frame_resized, captured_at, input_size, backbone_outputs)
+        limiter.interval = uploader.pacer.interval  # neck-head 부하에 따라 pacer 가 조절
+        limiter.wait(stop_event)
+
+
+def create_video_client():
+    http = HttpVideoClient(FASTAPI_SERVER_URL, VIDEO_STREAM, timeout=2)
+    if VIDEO_TRANSPORT == "http":
+        return http
+    if websocket is None:
+        if VIDEO_TRANSPORT == "websocket":
+            print("websocket-client 가 설치되어 있지 않아 이미지를 HTTP 로 전송합니다.")
+        return http
+    ws = WebSocketVideoClient(VIDEO_WS_URL, reconnect_interval=VIDEO_WS_RECONNECT_SEC)
+    return ws if VIDEO_TRANSPORT == "websocket" else AutoVideoClient(ws, http)
+
+
+def video_upload_loop(uploader):
+    limiter = RateLimiter(VIDEO_INTERVAL_SEC)
+    client = create_video_client()
+    seq = 0
+    while not stop_event.is_set():
+        item = captured_frames.wait_newer(seq, timeout=0.5)
+        if item is None:
+            continue
+        seq, (frame_resized, captured_at) = item
+
+        # 최근 neck-head 서버 결과를 서버가 그리도록 따로 보내거나, 지원하지 않는 서버면 프레임에 그려 보낸다
+        detections = uploader.detections
+        server_overlay = VIDEO_OVERLAY == "server" or (VIDEO_OVERLAY == "auto" and client.overlay)
+        frame_draw = frame_resized if server_overlay else draw_detections(frame_resized, detections)
+        ret, jpeg = cv2.imencode('.jpg', frame_draw)
+        if ret:
+            client.send(jpeg.tobytes(), pack_detections(detections) if server_overlay else None)
+        limiter.wait(stop_event)
+    client.close()
+
+
+def main():
+    # 웹캠 열기 (기본 카메라 장치 0번 사용)
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        raise RuntimeError("카메라를 열 수 없습니다.")
+
+    print(f"실시간 카메라 스트림 시작 ({HEAD_INTERVAL_SEC}초마다 neck-head 서버 전송, "
+          f"{VIDEO_INTERVAL_SEC}초마다 FastAPI 서버에 이미지 전송)")
+
+    uploader = HeadUploader()
+    # TorchScript / ONNX 는 시작 분할 지점을 미리 trace / export 한다 (다른 지점은 처음 쓸 때)
+    backbone_runner.prepare(uploader.split)
+    scheduler = FrameScheduler(
+        SCHEDULE, scene_threshold=SCENE_THRESHOLD, refresh_interval=SCENE_REFRESH_SEC,
+        report_interval=PACER_REPORT_SEC,
+    )
+    print(f"백본 실행 시점: {SCHEDULE}"
+          + (f" (장면 변화 기준 {SCENE_THRESHOLD}, 최대 {SCENE_REFRESH_SEC}초마다 실행)" if SCHEDULE == "scene" else ""))
+    threads = [
+        threading.Thread(target=capture_loop, args=(cap,), name="capture", daemon=True),
+        threading.Thread(target=inference_loop, args=(uploader, scheduler), name="backbone", daemon=True),
+        threading.Thread(target=head_upload_loop, args=(uploader, scheduler), name="head-upload", daemon=True),
+        threading.Thread(target=video_upload_loop, args=(uploader,), name="video-upload", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    uploader.close()
+    input_image_archiver.close()
+    cap.release()
 
-    time.sleep(0.05)  # 약 20fps로 전송
 
-cap.release()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+실행 중 백본 / neck-head 분할 지점을 옮기는 제어기.
+
+후보 분할 지점 s 마다 아래 비용(ms)을 추정하고, 현재 지점보다 충분히 싼 지점이 있으면 옮긴다.
+
+    비용(s) = 로봇 연산(s) * 로봇 부하 보정 + 전송 바이트(s) / 업로드 처리량 + 서버 연산(s) * 서버 혼잡 보정
+
+로봇 연산 / 전송 바이트 : 시작할 때 빈 프레임으로 레이어별 시간과 분할 지점별 SDIT 크기를 한 번 측정(calibrate)하고,
+                          로봇 연산은 실제 백본 실행 시간과의 비율로 계속 보정한다.
+업로드 처리량           : 응답 왕복 시간에서 서버 처리 시간(server_ms)을 뺀 값을 전송 시간으로 보고 추정한다.
+서버 연산               : 관측한 지점의 서버 연산 시간(server_ms - queue_ms)에, 옮겨 가는 레이어의 로봇 측정값을
+                          server_speedup 으로 나눈 만큼 더하거나 뺀다. 큐 대기(queue_ms)가 길수록 서버 쪽 비용을 키운다.
+로봇 부하               : psutil 시스템 CPU 사용률이 cpu_high 를 넘거나 InfluxDB 의 배터리 잔량이 low_battery 아래면
+                          로봇 연산 비용을 키워 더 이른 지점(서버로 offload)을 선호하게 한다.
+
+decide() 는 업로드 단계에서 호출되고, 백본 단계는 매 프레임 시작 시 현재 분할 지점을 읽으므로
+분할 지점은 항상 프레임 경계에서 바뀐다.
+"""
+import csv
+import io
+import statistics
+import textwrap
+import threading
+import time
+
+import requests
+import torch
+
+import split_protocol
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BATTERY_QUERY = textwrap.dedent("""
+    from(bucket: "{bucket}")
+      |> range(start: -30m)
+      |> filter(fn: (r) => r._measurement == "battery" and
+                           r.bot == "{bot}" and r._field == "percentage")
+      |> last()
+""")
+# battery.percentage 단위. fraction: 0~1 (ROS BatteryState.percentage), percent: 0~100
+BATTERY_SCALES = {"fraction": 100.0, "percent": 1.0}
+
+
+class Ewma:
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+        self.count = 0
+
+    def update(self, sample):
+        self.value = sample if self.value is None else self.value + self.alpha * (sample - self.value)
+        self.count += 1
+        return self.value
+
+
+def calibrate(layers, required_by_split, version, quantization, img_size=640, runs=3):
+    """
+    빈 프레임으로 백본 레이어를 실행해 (레이어별 ms 리스트, {분할 지점: SDIT 바이트}) 를 구한다.
+    required_by_split 은 {분할 지점: 서버가 쓰는 백본 출력 인덱스} 이다.
+    """
+    times = [[] for _ in layers]
+    outputs = []
+    with torch.no_grad():
+        for run in range(runs + 1):  # 첫 회는 warmup
+            x = torch.zeros(1, 3, img_size, img_size)
+            outputs = []
+            for i, m in enumerate(layers):
+                if m.f != -1:
+                    x = outputs[m.f] if isinstance(m.f, int) else [outputs[j] for j in m.f]
+                started = time.perf_counter()
+                x = m(x)
+                if run:
+                    times[i].append((time.perf_counter() - started) * 1000)
+                outputs.append(x)
+    layer_ms = [statistics.median(t) for t in times]
+
+    cut_bytes = {}
+    for split, required in required_by_split.items():
+        if split > len(outputs):
+            continue
+        selected = [out if i in required else None for i, out in enumerate(outputs[:split])]
+        cut_bytes[split] = len(split_protocol.encode_outputs(
+            selected, version=version or split_protocol.WIRE_VERSION, quantization=quantization,
+        ))
+    return layer_ms, cut_bytes
+
+
+def query_battery_percentage(url, token, org, bucket, bot, scale="fraction", timeout=2):
+    """InfluxDB v2 HTTP API(Flux)로 최근 배터리 잔량(%)을 조회한다. 값이 없으면 None."""
+    if scale not in BATTERY_SCALES:
+        raise ValueError(f"배터리 단위는 {tuple(BATTERY_SCALES)} 중 하나여야 합니다: {scale}")
+    headers = {"Content-Type": "application/vnd.flux", "Accept": "application/csv"}
+    if token:
+        headers["Authorization"] = f"Token {token}"
+    response = requests.post(
+        f"{url.rstrip('/')}/api/v2/query", params={"org": org}, headers=headers,
+        data=BATTERY_QUERY.format(bucket=bucket, bot=bot), timeout=timeout,
+    )
+    response.raise_for_status()
+    header = None
+    for row in csv.reader(io.StringIO(response.text)):
+        if "_value" in row:
+            header = row
+        elif header and len(row) == len(header):
+            # 값으로 단위를 추측하지 않는다 (0~100 로봇의 1% 가 100% 로 보이면 저전력 상황을 놓친다)
+            return float(row[header.index("_value")]) * BATTERY_SCALES[scale]
+    return None
+
+
+class SplitController:
+    def __init__(self, layer_ms, cut_bytes, server_speedup=4.0, hysteresis=0.15, min_dwell=10.0,
+                 eval_interval=2.0, cpu_high=85.0, low_battery=20.0, battery_weight=2.0,
+                 battery_source=None, battery_interval=30.0):
+        self.layer_ms = layer_ms
+        self.cut_bytes = cut_bytes
+        self.candidates = sorted(cut_bytes)
+        self.server_speedup = server_speedup
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        self.eval_interval = eval_interval
+        self.cpu_high = cpu_high
+        self.low_battery = low_battery
+        self.battery_weight = battery_weight
+
+        self.robot_scale = Ewma()            # 실제 백본 시간 / calibrate 시간
+        self.upload_bps = Ewma()             # 업로드 처리량 (bytes/s)
+        self.queue_ms = Ewma()
+        self.server_compute_ms = {}          # 분할 지점 -> Ewma(server_ms - queue_ms)
+        self.battery = None
+        self._lock = threading.Lock()
+        self._last_eval = 0.0
+        self._last_switch = time.monotonic()
+
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # 다음 호출부터 직전 호출 이후 사용률을 돌려준다
+        if battery_source is not None:
+            threading.Thread(
+                target=self._poll_battery, args=(battery_source, battery_interval), name="battery", daemon=True
+            ).start()
+
+    def _poll_battery(self, source, interval):
+        while True:
+            try:
+                self.battery = source()
+            except Exception as e:
+                print("배터리 잔량 조회 실패:", e)
+            time.sleep(interval)
+
+    def robot_ms(self, split):
+        return sum(self.layer_ms[:split])
+
+    def observe_backbone(self, split, seconds):
+        expected = self.robot_ms(split)
+        if expected > 0:
+            with self._lock:
+                self.robot_scale.update(seconds * 1000 / expected)
+
+    def observe_upload(self, nbytes, rtt, result):
+        """neck-head 응답 콜백 (NeckHeadClient.on_result)."""
+        server_ms = result.get("server_ms")
+        split = result.get("split")
+        if server_ms is None or split is None:
+            return
+        queue_ms = result.get("queue_ms", 0.0)
+        transfer = max(rtt - server_ms / 1000, 1e-3)
+        with self._lock:
+            self.upload_bps.update(nbytes / transfer)
+            self.queue_ms.update(queue_ms)
+            self.server_compute_ms.setdefault(split, Ewma()).update(max(server_ms - queue_ms, 0.0))
+
+    def _server_ms(self, split):
+        """split 부터 끝까지의 서버 연산 추정치. 관측한 가장 가까운 지점에서 레이어 차이만큼 보정한다."""
+        measured = {s: e.value for s, e in self.server_compute_ms.items() if e.value is not None}
+        nearest = min(measured, key=lambda s: abs(s - split))
+        moved = self.robot_ms(nearest) - self.robot_ms(split)  # split < nearest 이면 서버가 더 맡는다
+        return max(measured[nearest] + moved / self.server_speedup, 0.0)
+
+    def _robot_penalty(self):
+        penalty = self.robot_scale.value or 1.0
+        cpu = psutil.cpu_percent(interval=None) if psutil is not None else None
+        if cpu is not None and cpu > self.cpu_high:
+            # 다른 로봇 작업과 CPU 를 다투는 중이면 최대 2배까지 비용을 키운다
+            penalty *= 1 + (cpu - self.cpu_high) / max(100 - self.cpu_high, 1)
+        if self.battery is not None and self.battery < self.low_battery:
+            penalty *= self.battery_weight
+        return penalty, cpu
+
+    def costs(self):
+        """{분할 지점: 추정 비용(ms)}. 아직 관측이 부족하면 None."""
+        with self._lock:
+            if self.upload_bps.count < 3 or not self.server_compute_ms:
+                return None
+            robot_penalty, _ = self._robot_penalty()
+            service = statistics.fmean(e.value for e in self.server_compute_ms.values())
+            congestion = 1 + (self.queue_ms.value or 0.0) / max(service, 1.0)
+            return {
+                split: self.robot_ms(split) * robot_penalty
+                + self.cut_bytes[split] / self.upload_bps.value * 1000
+                + self._server_ms(split) * congestion
+                for split in self.candidates
+            }
+
+    def decide(self, current):
+        """옮길 분할 지점을 반환한다. 그대로 두면 current."""
+        now = time.monotonic()
+        if now - self._last_eval < self.eval_interval or now - self._last_switch < self.min_dwell:
+            return current
+        self._last_eval = now
+        costs = self.costs()
+        if costs is None or current not in costs:
+            return current
+        best = min(costs, key=costs.get)
+        if best == current or costs[best] > costs[current] * (1 - self.hysteresis):
+            return current
+        self._last_switch = now
+        print(f"분할 지점 변경 {current} -> {best} (추정 {costs[current]:.1f} -> {costs[best]:.1f} ms, "
+              f"업로드 {self.upload_bps.value * 8 / 1e6:.1f} Mbps, 서버 큐 {self.queue_ms.value:.1f} ms, "
+              f"배터리 {self.battery if self.battery is not None else '-'})")
+        return best
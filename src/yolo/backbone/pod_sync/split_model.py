@@ -0,0 +1,175 @@
+"""
+YOLOv5 체크포인트를 백본 / head 아티팩트로 나눠 저장하고 불러오는 도구
+(backbone/pod_sync 와 neck-head-slim/app 에 동일하게 복사해 사용).
+
+분할 아티팩트는 아래 dict 를 torch.save 한 파일이다.
+    part             : "backbone" 또는 "head"
+    layers           : 해당 구간 레이어 (nn.ModuleList, 각 레이어의 i / f 속성 유지)
+    first_layer      : layers[0] 의 원본 레이어 인덱스 (백본은 항상 0)
+    backbone_len     : 기본 분할 지점. 백본은 레이어 [0, backbone_len), head 는 [backbone_len, 끝)을 실행
+    f                : 구간 레이어별 from 인덱스 (m.f)
+    save             : 원본 모델의 save 리스트 (뒤 레이어가 참조하는 출력 인덱스)
+    required_outputs : head 가 참조하는 백본 출력 인덱스
+    output_channels  : 레이어별 출력 채널 수 (Detect 제외, neck-head 가 받은 백본 출력의 shape 검사에 사용)
+    output_strides   : 레이어별 출력 stride (입력 해상도 / 출력 해상도)
+    names / stride   : 클래스 이름, Detect stride
+
+각 pod 는 자기 쪽 아티팩트만 읽으므로 사용하지 않는 절반의 가중치를 메모리에 올리지 않는다.
+실행 중 분할 지점을 바꿀 수 있도록 백본 아티팩트는 레이어 [0, max_split), head 아티팩트는
+[min_split, 끝) 을 담을 수 있으며, 그 범위 안의 어떤 분할 지점이든 처리할 수 있다.
+
+사용 예:
+    python split_model.py --weights yolov5n.pt --split 10 --out-dir .
+    -> yolov5n_backbone.pt (백본 pod 용), yolov5n_head.pt (neck-head pod 용)
+    python split_model.py --weights yolov5n.pt --split 10 --min-split 4 --max-split 17 --out-dir .
+    -> 분할 지점 4 ~ 17 을 모두 처리할 수 있는 아티팩트
+"""
+import argparse
+import copy
+from pathlib import Path
+
+import torch
+
+ARTIFACT_FORMAT = 1
+PARTS = ("backbone", "head")
+
+
+def required_backbone_outputs(layers, split):
+    """
+    head 레이어들의 m.f 를 따라가며 실제로 참조되는 백본 출력 인덱스(< split)를 구한다.
+    yolov5n 기준 split=10 이면 [4, 6, 9].
+    """
+    required = set()
+    for idx, m in enumerate(layers, start=split):
+        sources = [m.f] if isinstance(m.f, int) else m.f
+        for j in sources:
+            src = idx + j if j < 0 else j  # -1 은 직전 레이어 출력
+            if src < split:
+                required.add(src)
+    return sorted(required)
+
+
+def layer_output_shapes(model, size=64):
+    """
+    size x size 더미 입력으로 한 번 forward 해 레이어별 (출력 채널 수 리스트, stride 리스트) 를 구한다.
+    분할 지점이 될 수 없는 마지막 Detect 레이어는 제외한다.
+    """
+    layers = copy.deepcopy(model).float().eval().model[:-1]
+    x = torch.zeros(1, 3, size, size, device=next(model.parameters()).device)
+    outputs = []
+    with torch.no_grad():
+        for m in layers:
+            if m.f != -1:
+                x = outputs[m.f] if isinstance(m.f, int) else [outputs[j] for j in m.f]
+            x = m(x)
+            outputs.append(x)
+    return [int(out.shape[1]) for out in outputs], [size // int(out.shape[-1]) for out in outputs]
+
+
+def split_detection_model(model, split, min_split=None, max_split=None):
+    """
+    DetectionModel 을 잘라 {part: 아티팩트 dict} 를 반환한다.
+    백본은 레이어 [0, max_split), head 는 [min_split, 끝) 을 가진다 (기본값은 둘 다 split).
+    """
+    layers = list(model.model)
+    min_split = split if min_split is None else min_split
+    max_split = split if max_split is None else max_split
+    if not 0 < min_split <= split <= max_split < len(layers):
+        raise ValueError(
+            f"1 <= min_split <= split <= max_split <= {len(layers) - 1} 이어야 합니다: "
+            f"{min_split}, {split}, {max_split}"
+        )
+    names = model.names
+    channels, strides = layer_output_shapes(model)
+    meta = {
+        "format": ARTIFACT_FORMAT,
+        "backbone_len": split,
+        "save": sorted(model.save),
+        "required_outputs": required_backbone_outputs(layers[split:], split),
+        "output_channels": channels,
+        "output_strides": strides,
+        "names": list(names.values()) if isinstance(names, dict) else list(names),
+        "stride": [float(s) for s in model.stride],
+    }
+    parts = {"backbone": (0, layers[:max_split]), "head": (min_split, layers[min_split:])}
+    return {
+        part: dict(
+            meta, part=part, first_layer=first_layer,
+            layers=torch.nn.ModuleList(part_layers), f=[m.f for m in part_layers],
+        )
+        for part, (first_layer, part_layers) in parts.items()
+    }
+
+
+def load_checkpoint_model(weights, map_location="cpu"):
+    return torch.load(weights, map_location=map_location, weights_only=False)["model"]
+
+
+def export_split(weights, split, out_dir, min_split=None, max_split=None):
+    """weights 체크포인트를 out_dir/<stem>_backbone.pt, <stem>_head.pt 로 나눠 저장하고 경로를 반환한다."""
+    weights = Path(weights)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    artifacts = split_detection_model(load_checkpoint_model(weights), split, min_split, max_split)
+    paths = {}
+    for part, artifact in artifacts.items():
+        paths[part] = out_dir / f"{weights.stem}_{part}.pt"
+        torch.save(artifact, paths[part])
+    return paths
+
+
+def load_part(path, part, fallback=None, split=None, map_location="cpu"):
+    """
+    path 의 분할 아티팩트에서 part 레이어를 불러와 (nn.ModuleList, meta) 를 반환한다.
+    path 가 없으면 fallback 전체 체크포인트를 읽어 쓴다. 이때 기본 분할 지점은 split 이고
+    모든 레이어를 가지므로 어떤 분할 지점이든 처리할 수 있다.
+    이전 버전 백본 아티팩트(layers 속성을 가진 nn.Module 을 통째로 저장한 파일)도 읽는다.
+    """
+    if part not in PARTS:
+        raise ValueError(f"알 수 없는 part: {part}")
+    path = Path(path)
+    if not path.exists():
+        if fallback is None or split is None:
+            raise FileNotFoundError(f"분할 모델 파일이 없습니다: {path}")
+        print(f"{path.name} 이 없어 전체 체크포인트 {Path(fallback).name} 에서 {part} 부분을 잘라 사용합니다.")
+        model = load_checkpoint_model(fallback, map_location)
+        artifact = split_detection_model(model, split, 1, len(model.model) - 1)[part]
+    else:
+        artifact = torch.load(path, map_location=map_location, weights_only=False)
+
+    if isinstance(artifact, torch.nn.Module):
+        if part != "backbone" or not hasattr(artifact, "layers"):
+            raise ValueError(f"{path} 는 {part} 아티팩트가 아닙니다.")
+        layers = artifact.layers
+        return layers, {"part": part, "first_layer": 0, "backbone_len": len(layers), "f": [m.f for m in layers]}
+    if not isinstance(artifact, dict) or artifact.get("part") != part:
+        raise ValueError(f"{path} 는 {part} 아티팩트가 아닙니다.")
+    layers = artifact.pop("layers")
+    artifact.setdefault("first_layer", 0 if part == "backbone" else artifact["backbone_len"])
+    return layers, artifact
+
+
+def split_points(part, layers, meta):
+    """이 아티팩트로 처리할 수 있는 분할 지점 목록."""
+    first_layer = meta["first_layer"]
+    if part == "backbone":
+        return list(range(1, first_layer + len(layers) + 1))
+    return list(range(first_layer, first_layer + len(layers)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLOv5 체크포인트를 백본 / head 아티팩트로 분할")
+    parser.add_argument("--weights", type=Path, default=Path("yolov5n.pt"))
+    parser.add_argument("--split", type=int, default=10, help="기본 분할 지점 = 백본 레이어 수 (head 는 이 인덱스부터)")
+    parser.add_argument("--min-split", type=int, default=None, help="head 아티팩트가 처리할 가장 이른 분할 지점")
+    parser.add_argument("--max-split", type=int, default=None, help="백본 아티팩트가 처리할 가장 늦은 분할 지점")
+    parser.add_argument("--out-dir", type=Path, default=Path("."))
+    args = parser.parse_args()
+
+    paths = export_split(args.weights, args.split, args.out_dir, args.min_split, args.max_split)
+    for part, path in paths.items():
+        print(f"{part}: {path} ({path.stat().st_size / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+이미지 서버(영상 스트림) 업로드 클라이언트.
+
+HttpVideoClient      : 프레임마다 /upload_image/{stream} 으로 multipart POST (응답을 기다림)
+WebSocketVideoClient : /ws/upload_image/{stream} 지속 연결. JPEG 하나를 바이너리 메시지 하나로 응답 없이 연속 전송한다
+                       (WebSocket 메시지가 길이를 가지므로 따로 framing 하지 않는다).
+AutoVideoClient      : WebSocket 으로 보내고, 연결할 수 없으면(websocket-client 미설치, 이전 버전 서버) HTTP 로 보낸다.
+                       WebSocket 은 reconnect_interval 마다 다시 시도하므로 서버가 갱신되면 자동으로 지속 연결로 바뀐다.
+
+send(jpeg, detections) 는 보냈으면 True 를 반환한다. detections 를 주면(pack_detections) 서버가 프레임에 그리고,
+서버가 그릴 수 있는지는 응답 / 연결 인사의 "overlay" 로 알려 준다 (overlay 속성, 이전 버전 서버면 False).
+"""
+import json
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+
+def pack_detections(detections):
+    """검출 결과 dict 리스트를 이미지 서버 검출 메시지로 줄인다 (좌표는 정수 픽셀, confidence 는 소수 둘째 자리)."""
+    return [
+        [*map(int, det["box"]), round(float(det["confidence"]), 2), det["class"]]
+        for det in detections
+    ]
+
+
+def stream_url(url, stream):
+    """업로드 URL 뒤에 stream ID 를 붙인다 (비우면 서버의 기본 stream)."""
+    return f"{url.rstrip('/')}/{stream}" if stream else url
+
+
+def websocket_url(upload_url, stream):
+    """http(s)://host/upload_image 에서 ws(s)://host/ws/upload_image/{stream} 를 만든다."""
+    parts = urlsplit(upload_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    return stream_url(urlunsplit((scheme, parts.netloc, "/ws" + parts.path, "", "")), stream)
+
+
+class HttpVideoClient:
+    transport = "http"
+
+    def __init__(self, url, stream=None, timeout=2):
+        self.base_url = url
+        self.url = stream_url(url, stream)
+        self.timeout = timeout
+        self.overlay = False
+        self._session = requests.Session()
+
+    def send(self, jpeg, detections=None):
+        try:
+            files = {"file": ("latest.jpg", jpeg, "image/jpeg")}
+            data = {"detections": json.dumps({"detections": detections})} if detections is not None else None
+            response = self._session.post(self.url, files=files, data=data, timeout=self.timeout)
+            if response.status_code == 404 and self.url != self.base_url:
+                # stream 별 업로드를 지원하지 않는 이전 버전 이미지 서버
+                print(f"이미지 서버가 stream 별 업로드를 지원하지 않아 {self.base_url} 로 보냅니다.")
+                self.url = self.base_url
+                return False
+            if response.status_code != 200:
+                print("FastAPI 서버에 이미지 전송 실패:", response.status_code)
+                return False
+            self.overlay = bool(response.json().get("overlay"))
+            print("FastAPI 서버에 이미지 전송 성공")
+            return True
+        except Exception as e:
+            print("FastAPI 서버 요청 실패:", e)
+            return False
+
+    def close(self):
+        self._session.close()
+
+
+class WebSocketVideoClient:
+    transport = "websocket"
+
+    def __init__(self, url, connect_timeout=2, send_timeout=2, reconnect_interval=10):
+        if websocket is None:
+            raise RuntimeError("websocket-client 패키지가 설치되어 있지 않습니다.")
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        self.reconnect_interval = reconnect_interval
+        self.overlay = False
+        self._ws = None
+        self._last_connect_attempt = 0.0
+        self._failing = False
+        self._sent_detections = None  # 이 연결에서 마지막으로 보낸 검출 결과 (바뀔 때만 보낸다)
+
+    @property
+    def connected(self):
+        return self._ws is not None
+
+    def ensure_connected(self):
+        """연결되어 있거나 지금 연결했으면 True. 재연결 시도는 reconnect_interval 마다 한 번."""
+        if self._ws is not None:
+            return True
+        now = time.monotonic()
+        if now - self._last_connect_attempt < self.reconnect_interval:
+            return False
+        self._last_connect_attempt = now
+        try:
+            self._ws = websocket.create_connection(self.url, timeout=self.connect_timeout)
+        except Exception as e:
+            # 이전 버전 서버면 재시도마다 실패하므로 연속 실패는 처음 한 번만 출력한다
+            if not self._failing:
+                print("이미지 서버 websocket 연결 실패:", e)
+            self._failing = True
+            return False
+        self._failing = False
+        self._sent_detections = None
+        self.overlay = self._read_hello()
+        # 서버가 받지 못하는 동안 캡처가 멈추지 않도록 전송도 제한 시간을 둔다
+        self._ws.settimeout(self.send_timeout)
+        print(f"이미지 서버 websocket 연결: {self.url}" + (" (서버에서 검출 결과를 그림)" if self.overlay else ""))
+        return True
+
+    def _read_hello(self):
+        """연결 직후 서버가 보내는 {"overlay": true}. 보내지 않는 이전 버전 서버면 connect_timeout 뒤 False."""
+        try:
+            return bool(json.loads(self._ws.recv()).get("overlay"))
+        except Exception:
+            return False
+
+    def send(self, jpeg, detections=None):
+        if not self.ensure_connected():
+            return False
+        try:
+            if detections is not None and detections != self._sent_detections:
+                self._ws.send(json.dumps({"detections": detections}))
+                self._sent_detections = detections
+            self._ws.send_binary(jpeg)
+            return True
+        except Exception as e:
+            print("이미지 서버 websocket 끊김:", e)
+            self.close()
+            return False
+
+    def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+
+class AutoVideoClient:
+    """WebSocket 을 쓸 수 있으면 WebSocket, 아니면 HTTP 로 보낸다."""
+
+    def __init__(self, websocket_client, http_client):
+        self.websocket = websocket_client
+        self.http = http_client
+
+    @property
+    def transport(self):
+        return self.websocket.transport if self.websocket.connected else self.http.transport
+
+    @property
+    def overlay(self):
+        return self.websocket.overlay if self.websocket.connected else self.http.overlay
+
+    def send(self, jpeg, detections=None):
+        if self.websocket.ensure_connected() and self.websocket.send(jpeg, detections):
+            return True
+        return self.http.send(jpeg, detections)
+
+    def close(self):
+        self.websocket.close()
+        self.http.close()
@@ -0,0 +1,213 @@
+"""
+neck-head 요청 micro-batching.
+
+여러 백본(로봇)이 동시에 보낸 요청 중 같은 key(입력 feature map shape)를 가진 것들을
+최대 max_batch_size 개, 최대 max_wait 초까지 모아 한 번의 run_batch 호출로 처리한다.
+다른 요청이 대기 / 실행 중이 아니면 max_wait 를 기다리지 않고 바로 실행해 단일 로봇의 지연을 늘리지 않는다.
+run_batch 는 이벤트 루프가 아닌 executor 에서 실행되며 동시에 최대 concurrency 개 배치만 돈다.
+대기 중인 요청이 max_queue 개에 도달하면 submit 은 QueueFullError 로 즉시 거절한다.
+최근 배치 실행 시간(service_time)과 지금 들어온 요청의 예상 대기 시간(expected_wait)은 백본의 전송 조절에 쓰인다.
+"""
+import asyncio
+import bisect
+import collections
+import time
+
+
+class Histogram:
+    """버킷별 카운트 히스토그램. buckets 는 각 버킷의 상한값(오름차순)이고 마지막에 +Inf 버킷이 붙는다."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(bounds, self.counts)),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+        }
+
+
+class QueueFullError(Exception):
+    """대기열이 가득 차 요청을 받을 수 없음."""
+
+
+class _Pending:
+    __slots__ = ("key", "item", "future", "enqueued_at", "started_at")
+
+    def __init__(self, key, item, future):
+        self.key = key
+        self.item = item
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+
+
+class MicroBatcher:
+    """
+    run_batch(items) 는 items 와 같은 순서의 결과 리스트를 반환해야 한다.
+    submit() 은 해당 요청의 결과를 돌려준다.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.005, executor=None, concurrency=1, max_queue=32):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.batch_size_hist = Histogram(range(1, self.max_batch_size + 1))
+        self.queue_wait_hist = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])  # ms
+        self._queue = None
+        self._backlog = collections.deque()  # key 가 달라 이전 배치에 못 들어간 요청
+        self._task = None
+        self._slots = None
+        self._in_flight = set()
+        self.rejected = 0
+        self.service_time = None  # 배치 실행 시간 EWMA (초)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._in_flight):
+            task.cancel()
+
+    def queue_depth(self):
+        return (self._queue.qsize() if self._queue else 0) + len(self._backlog)
+
+    def expected_wait(self):
+        """
+        지금 들어온 요청이 배치 실행을 시작할 때까지의 예상 대기 시간(초).
+        앞에 쌓인 요청이 max_batch_size 씩 묶여 worker concurrency 개로 나눠 처리된다고 본다.
+        """
+        if self.service_time is None:
+            return 0.0
+        batches = -(-self.queue_depth() // self.max_batch_size) + len(self._in_flight)
+        return batches / self.concurrency * self.service_time
+
+    def admit(self):
+        """지금 요청을 받을 수 있으면 True. 대기열이 가득 찼으면 거절 횟수를 세고 False."""
+        if self.queue_depth() >= self.max_queue:
+            self.rejected += 1
+            return False
+        return True
+
+    async def submit(self, key, item):
+        result, _ = await self.submit_timed(key, item)
+        return result
+
+    async def submit_timed(self, key, item):
+        """(결과, 배치 실행 전까지 큐에서 기다린 초) 를 반환한다."""
+        if not self.admit():
+            raise QueueFullError(f"대기 중인 요청이 {self.max_queue}개를 넘었습니다.")
+        future = asyncio.get_running_loop().create_future()
+        pending = _Pending(key, item, future)
+        self._queue.put_nowait(pending)
+        result = await future
+        return result, pending.started_at - pending.enqueued_at
+
+    def _take_backlog(self, key, batch):
+        kept = collections.deque()
+        while self._backlog:
+            pending = self._backlog.popleft()
+            if pending.key == key and len(batch) < self.max_batch_size:
+                batch.append(pending)
+            else:
+                kept.append(pending)
+        self._backlog = kept
+
+    async def _collect(self):
+        first = self._backlog.popleft() if self._backlog else await self._queue.get()
+        batch = [first]
+        self._take_backlog(first.key, batch)
+
+        # 다른 요청이 대기 중이지도, 실행 중이지도 않으면(로봇 한 대) 기다려도 묶을 요청이 없으므로 바로 실행한다
+        wait = self.max_wait if self._queue.qsize() or self._backlog or self._in_flight else 0.0
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            try:
+                if remaining > 0:
+                    pending = await asyncio.wait_for(self._queue.get(), remaining)
+                else:
+                    pending = self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if pending.key == first.key:
+                batch.append(pending)
+            else:
+                self._backlog.append(pending)
+        return batch
+
+    async def _run(self):
+        while True:
+            # 빈 worker 가 생길 때까지 배치를 모으지 않아, worker 가 바쁜 동안 쌓인 요청은 더 큰 배치가 된다.
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._execute(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, batch):
+        try:
+            started = time.perf_counter()
+            self.batch_size_hist.observe(len(batch))
+            for pending in batch:
+                pending.started_at = started
+                self.queue_wait_hist.observe((started - pending.enqueued_at) * 1000)
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.run_batch, [pending.item for pending in batch]
+                )
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                return
+            elapsed = time.perf_counter() - started
+            self.service_time = elapsed if self.service_time is None else 0.8 * self.service_time + 0.2 * elapsed
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "workers": self.concurrency,
+            "in_flight": len(self._in_flight),
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "service_ms": round(self.service_time * 1000, 2) if self.service_time is not None else None,
+            "expected_wait_ms": round(self.expected_wait() * 1000, 2),
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
@@ -0,0 +1,113 @@
+"""
+delta encoding(SDIT v3) 의 전송량 대비 검출 drift 리포트.
+
+BACKBONE_PAYLOAD_DIR 에 저장된 백본 페이로드를 저장 순서(= 수신 순서)대로 다시 읽어 연속 프레임 stream 으로 보고,
+threshold 별로 keyframe + delta 로 인코딩 / 복원한 출력의 head 추론 결과를 원본 프레임 결과와 비교한다.
+delta 로 받은 보관본도 같은 순서로 keyframe 기준을 더해 복원하므로 그대로 쓸 수 있다.
+
+사용 예:
+    python delta_report.py --payload-dir /data/backbone-inputs --thresholds 0.005 0.01 0.02 --limit 300
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+# 리포트 실행 중에는 서버 모듈이 페이로드를 다시 저장하지 않도록 한다.
+os.environ.setdefault("SAVE_BACKBONE_PAYLOADS", "false")
+
+import server_fastapi as server
+import split_protocol
+from payload_archiver import read_archived
+from quantization_report import detect, match_detections
+from split_delta import DeltaEncoder, DeltaReferences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="delta encoding 전송량 / 검출 drift 비교")
+    parser.add_argument("--payload-dir", type=Path, default=server.BACKBONE_PAYLOAD_DIR)
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.005, 0.01, 0.02])
+    parser.add_argument("--keyframe-interval", type=int, default=30)
+    parser.add_argument("--max-ratio", type=float, default=0.5)
+    parser.add_argument("--quantization", default="none", choices=split_protocol.QUANTIZATION_MODES,
+                        help="keyframe 양자화")
+    parser.add_argument("--limit", type=int, default=0, help="사용할 최대 페이로드 수 (0 = 전체)")
+    parser.add_argument("--iou-thres", type=float, default=0.5)
+    args = parser.parse_args()
+
+    paths = sorted(
+        p for p in args.payload_dir.iterdir()
+        if not p.name.startswith(".") and p.name.removesuffix(".gz").endswith((".pt", ".sdit"))
+    )
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"{args.payload_dir} 에 재생할 페이로드가 없습니다.")
+
+    configs = {
+        threshold: {
+            "encoder": DeltaEncoder(f"replay-{threshold}", keyframe_interval=args.keyframe_interval,
+                                    threshold=threshold, max_ratio=args.max_ratio, quantization=args.quantization),
+            "references": DeltaReferences(max_streams=1),
+            "bytes": 0, "dets": 0, "matched": 0, "iou": 0.0, "conf_diff": 0.0, "encode_s": 0.0,
+        }
+        for threshold in args.thresholds
+    }
+    full_bytes = 0
+    reference_dets = 0
+    frames = 0
+
+    for path in paths:
+        try:
+            outputs, meta = server.decode_backbone_payload(read_archived(path))
+            model = server.registry.get(str(meta.get("model") or server.DEFAULT_MODEL_ID))
+            model.validate(outputs)
+        except Exception as e:
+            print(f"건너뜀 {path.name}: {e}")
+            continue
+        required = model.required_outputs_by_split[len(outputs)]
+        selected = [
+            out.float().cpu() if out is not None and i in required else None
+            for i, out in enumerate(outputs)
+        ]
+        reference = detect(model, selected)
+        reference_dets += len(reference)
+        full_bytes += len(split_protocol.encode_outputs(selected, quantization=args.quantization))
+        frames += 1
+
+        for entry in configs.values():
+            started = time.perf_counter()
+            payload, pending = entry["encoder"].encode(selected, frames)
+            entry["encode_s"] += time.perf_counter() - started
+            entry["encoder"].commit(pending)
+            decoded, decoded_meta = split_protocol.decode_outputs(payload, server.device)
+            candidate = detect(model, entry["references"].apply(decoded, decoded_meta))
+            matched, iou_sum, conf_diff_sum = match_detections(reference, candidate, args.iou_thres)
+            entry["bytes"] += len(payload)
+            entry["dets"] += len(candidate)
+            entry["matched"] += matched
+            entry["iou"] += iou_sum
+            entry["conf_diff"] += conf_diff_sum
+
+    if not frames:
+        raise SystemExit("디코딩 가능한 페이로드가 없습니다.")
+
+    per_frame_full = full_bytes / frames
+    print(f"\n페이로드 {frames}개, 원본 프레임 검출 {reference_dets}개, keyframe 간격 {args.keyframe_interval}, "
+          f"keyframe 양자화 {args.quantization}, 전체 프레임 {per_frame_full:.0f} bytes/frame")
+    print(f"{'thres':>7s} {'bytes/frame':>12s} {'ratio':>7s} {'keyframes':>10s} {'enc ms':>7s} "
+          f"{'precision':>10s} {'recall':>8s} {'mean IoU':>9s} {'|dconf|':>8s}")
+    for threshold, entry in configs.items():
+        per_frame = entry["bytes"] / frames
+        precision = entry["matched"] / entry["dets"] if entry["dets"] else 1.0
+        recall = entry["matched"] / reference_dets if reference_dets else 1.0
+        mean_iou = entry["iou"] / entry["matched"] if entry["matched"] else 0.0
+        conf_diff = entry["conf_diff"] / entry["matched"] if entry["matched"] else 0.0
+        keyframes = entry["encoder"].counters["keyframes"]
+        print(f"{threshold:7.3f} {per_frame:12.0f} {per_frame / per_frame_full:7.3f} {keyframes:10d} "
+              f"{entry['encode_s'] / frames * 1000:7.1f} {precision:10.3f} {recall:8.3f} {mean_iou:9.3f} "
+              f"{conf_diff:8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+neck-head head 모델 레지스트리.
+
+여러 head 아티팩트(모델 크기, class 구성, 분할 범위가 다른 변형)를 model ID 로 등록해 두고, 그 ID 의 요청이
+처음 들어올 때 불러온다. 불러온 모델의 파라미터 / 버퍼 메모리 합이 memory_budget 을 넘으면 가장 오래 쓰지 않은
+모델부터 내린다(LRU, pinned 모델은 제외). 서로 다른 모델은 로더 스레드 풀에서 동시에 불러오고, 같은 모델을 동시에 요청하면
+한 번만 불러와 결과를 나눠 쓴다. 로드는 추론 worker 와 다른 스레드에서 하므로 다른 모델 추론을 막지 않는다.
+"""
+import asyncio
+import collections
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import split_model
+import split_protocol
+from postprocess import Postprocessor
+
+
+class UnknownModelError(ValueError):
+    pass
+
+
+class ModelLoadError(RuntimeError):
+    pass
+
+
+class HeadModel:
+    """불러온 head 한 개. 분할 지점별로 필요한 백본 출력과 class 표 / 후처리기를 함께 가진다."""
+
+    def __init__(self, model_id, layers, meta, class_names=None, postprocess_options=None):
+        self.model_id = model_id
+        self.layers = layers
+        self.first_layer = meta["first_layer"]
+        self.backbone_len = meta["backbone_len"]
+        # 백본이 어느 레이어까지 계산해 보내든 head 가 가진 레이어 범위 안이면 이어서 처리한다.
+        # 분할 지점은 백본 출력 리스트의 길이(= 백본이 실행한 레이어 수)로 구분한다.
+        self.split_points = split_model.split_points("head", layers, meta)
+        self.required_outputs_by_split = {
+            split: split_model.required_backbone_outputs(self.layers_from(split), split)
+            for split in self.split_points
+        }
+        # 레이어별 출력 채널 / stride. 이전 버전 아티팩트에는 없으므로 그때는 shape 을 검사하지 않는다
+        self.output_channels = meta.get("output_channels")
+        self.output_strides = meta.get("output_strides")
+        self.class_names = list(class_names or meta.get("names") or [])
+        self.class_table = split_protocol.class_table_id(self.class_names)
+        self.postprocessor = Postprocessor(self.class_names, **(postprocess_options or {}))
+        self.nbytes = sum(
+            t.numel() * t.element_size() for t in itertools.chain(layers.parameters(), layers.buffers())
+        )
+
+    def layers_from(self, split):
+        return self.layers[split - self.first_layer:]
+
+    def validate(self, backbone_outputs):
+        """
+        이 모델로 처리할 수 없는 백본 출력이면 ValueError.
+        필요한 출력이 모두 있는지, 각 출력이 [N, C, H, W] 이고 채널 수가 이 분할 지점과 맞는지,
+        batch 크기와 입력 해상도(H / W × stride)가 출력끼리 같은지 확인한다.
+        """
+        split = len(backbone_outputs)
+        required = self.required_outputs_by_split.get(split)
+        if required is None:
+            raise ValueError(f"{self.model_id}: 지원하지 않는 분할 지점입니다: {split} (가능: {self.split_points})")
+        missing = [i for i in required if backbone_outputs[i] is None]
+        if missing:
+            raise ValueError(f"필요한 백본 출력이 누락되었습니다: {missing}")
+        if not self.output_channels or not self.output_strides:
+            return
+        inputs = set()
+        for i in required:
+            shape = list(backbone_outputs[i].shape)
+            if len(shape) != 4 or shape[1] != self.output_channels[i]:
+                raise ValueError(
+                    f"{self.model_id}: 백본 출력 {i} 의 shape {shape} 이 분할 지점 {split} 과 맞지 않습니다 "
+                    f"([N, {self.output_channels[i]}, H, W] 필요)"
+                )
+            stride = self.output_strides[i]
+            inputs.add((shape[0], shape[2] * stride, shape[3] * stride))
+        if len(inputs) > 1:
+            raise ValueError(
+                f"{self.model_id}: 백본 출력들의 batch 크기 / 입력 해상도가 서로 다릅니다: "
+                + ", ".join(f"{i}={list(backbone_outputs[i].shape)}" for i in required)
+            )
+
+
+class ModelRegistry:
+    """
+    model ID -> spec 등록과 지연 로드 / LRU 내림을 맡는다.
+    loader(model_id, spec) 는 HeadModel 을 만들어 반환하는 함수이며 로더 스레드에서 호출된다.
+    """
+
+    def __init__(self, loader, memory_budget=0, load_workers=2):
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.specs = {}
+        self.counters = collections.Counter()
+        self._models = collections.OrderedDict()  # 오래 쓰지 않은 순
+        self._loading = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(load_workers, 1), thread_name_prefix="neck-head-load")
+
+    def register(self, model_id, pinned=False, **spec):
+        self.specs[model_id] = spec
+        if pinned:
+            self._pinned.add(model_id)
+
+    def _future(self, model_id):
+        with self._lock:
+            model = self._models.get(model_id)
+            if model is not None:
+                self._models.move_to_end(model_id)
+                future = Future()
+                future.set_result(model)
+                return future
+            future = self._loading.get(model_id)
+            if future is not None:
+                return future
+            if model_id not in self.specs:
+                raise UnknownModelError(f"등록되지 않은 모델입니다: {model_id} (가능: {sorted(self.specs)})")
+            future = self._executor.submit(self._load, model_id)
+            self._loading[model_id] = future
+            return future
+
+    def _load(self, model_id):
+        try:
+            model = self.loader(model_id, self.specs[model_id])
+        except Exception as e:
+            with self._lock:
+                self._loading.pop(model_id, None)
+                self.counters["load_failures"] += 1
+            raise ModelLoadError(f"head 모델 {model_id} 로드 실패: {e}") from e
+        with self._lock:
+            self._loading.pop(model_id, None)
+            self._models[model_id] = model
+            self.counters["loads"] += 1
+            self._evict(keep=model_id)
+        print(f"head 모델 {model_id} 로드 완료 ({model.nbytes / 1e6:.1f} MB, 분할 지점 {model.split_points})")
+        return model
+
+    def _evict(self, keep):
+        while self.memory_budget > 0 and self.used_bytes() > self.memory_budget:
+            victim = next(
+                (model_id for model_id in self._models if model_id != keep and model_id not in self._pinned), None
+            )
+            if victim is None:
+                break
+            del self._models[victim]
+            self.counters["evictions"] += 1
+            print(f"head 모델 {victim} 내림 (메모리 한도 {self.memory_budget / 1e6:.0f} MB)")
+
+    def used_bytes(self):
+        return sum(model.nbytes for model in self._models.values())
+
+    def get(self, model_id):
+        """모델을 반환한다. 아직 없으면 불러올 때까지 기다린다 (이벤트 루프 밖에서 사용)."""
+        return self._future(model_id).result()
+
+    async def aget(self, model_id):
+        return await asyncio.wrap_future(self._future(model_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "registered": sorted(self.specs),
+                "loaded": {model_id: model.nbytes for model_id, model in self._models.items()},
+                "loading": sorted(self._loading),
+                "memory_budget": self.memory_budget,
+                "used_bytes": self.used_bytes(),
+                **self.counters,
+            }
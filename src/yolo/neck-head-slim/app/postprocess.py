@@ -0,0 +1,83 @@
+"""
+neck-head 후처리: Detect 출력 [B, N, 5 + nc] -> 이미지별 검출 결과.
+
+NMS 는 utils.general.non_max_suppression (클래스별 batched NMS, max_det, class 필터)을 그대로 사용하고,
+남은 검출은 이미지마다 한 번의 .cpu().numpy() 로 옮겨 배열 단위로 응답을 만든다.
+
+conf_thres 를 무엇과 비교할지는 conf_mode 로 고른다.
+    objectness : objectness 만 비교하고 obj × class 점수는 거르지 않는다 (이전 neck-head 동작, 기본값)
+    score      : YOLOv5 와 같이 objectness 와 obj × class 점수를 모두 비교한다 (같은 임계값이면 검출이 더 적다)
+"""
+import numpy as np
+
+from utils.general import non_max_suppression
+
+CONF_MODES = ("objectness", "score")
+
+
+def resolve_classes(classes, class_names):
+    """class id 또는 이름 목록을 id 리스트로 바꾼다. 같은 이름이 여러 id 에 있으면 모두 포함한다. None 이면 전체."""
+    if not classes:
+        return None
+    ids = set()
+    for c in classes:
+        c = str(c).strip()
+        if c.isdigit():
+            ids.add(int(c))
+            continue
+        matched = [i for i, name in enumerate(class_names) if name == c]
+        if not matched:
+            raise ValueError(f"알 수 없는 class: {c}")
+        ids.update(matched)
+    return sorted(ids)
+
+
+class Postprocessor:
+    def __init__(self, class_names, conf_thres=0.20, iou_thres=0.45, classes=None, agnostic=False, max_det=300,
+                 conf_mode="objectness"):
+        if conf_mode not in CONF_MODES:
+            raise ValueError(f"알 수 없는 conf_mode: {conf_mode} (가능: {', '.join(CONF_MODES)})")
+        self.class_names = list(class_names)
+        self.conf_thres = conf_thres
+        self.conf_mode = conf_mode
+        self.iou_thres = iou_thres
+        self.classes = resolve_classes(classes, self.class_names)
+        self.agnostic = agnostic
+        self.max_det = max_det
+        self._labels = np.array(self.class_names, dtype=object)
+
+    def labels(self, nc):
+        """class id -> 이름 배열. 모델 class 수가 이름 목록보다 많으면 Unknown(id) 로 채운다."""
+        if len(self._labels) < nc:
+            extra = [f"Unknown({i})" for i in range(len(self._labels), nc)]
+            self._labels = np.array(self.class_names + extra, dtype=object)
+        return self._labels
+
+    def nms(self, prediction):
+        """이미지별 (n, 6) numpy 배열 [x1, y1, x2, y2, conf, cls] 리스트."""
+        if self.conf_mode == "objectness":
+            # objectness 로 먼저 거른 행만 넘기고 NMS 안에서는 점수로 거르지 않는다
+            detections = [
+                self._nms(x[x[:, 4] > self.conf_thres][None], 0.0)[0] for x in prediction
+            ]
+        else:
+            detections = self._nms(prediction, self.conf_thres)
+        return [det.cpu().numpy() for det in detections]
+
+    def _nms(self, prediction, conf_thres):
+        return non_max_suppression(
+            prediction, conf_thres, self.iou_thres,
+            classes=self.classes, agnostic=self.agnostic, max_det=self.max_det,
+        )
+
+    def to_dicts(self, det, nc):
+        names = self.labels(nc)[det[:, 5].astype(np.int64)].tolist()
+        return [
+            {"box": box, "class": name, "confidence": conf}
+            for box, name, conf in zip(det[:, :4].tolist(), names, det[:, 4].tolist())
+        ]
+
+    def __call__(self, prediction):
+        """이미지별 [{"box": [x1, y1, x2, y2], "class": 이름, "confidence": 점수}, ...] 리스트."""
+        nc = prediction.shape[-1] - 5
+        return [self.to_dicts(det, nc) for det in self.nms(prediction)]
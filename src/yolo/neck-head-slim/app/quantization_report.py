@@ -0,0 +1,122 @@
+"""
+양자화 전송 모드(fp16 / int8)의 정확도 대비 전송량 리포트.
+
+BACKBONE_PAYLOAD_DIR 에 저장된 백본 페이로드(.pt / .sdit, gzip 보관본 포함)를 다시 읽어, 원본(float32) 경로와
+각 양자화 경로로 head 추론을 수행한 뒤 프레임당 전송 바이트와 검출 결과 차이를 비교한다.
+
+사용 예:
+    python quantization_report.py --payload-dir /data/backbone-inputs --modes fp16 int8 --limit 200
+"""
+import argparse
+import os
+from pathlib import Path
+
+# 리포트 실행 중에는 서버 모듈이 페이로드를 다시 저장하지 않도록 한다.
+os.environ.setdefault("SAVE_BACKBONE_PAYLOADS", "false")
+
+import torch
+import torchvision
+
+import server_fastapi as server
+import split_protocol
+from payload_archiver import read_archived
+
+
+def match_detections(reference, candidate, iou_thres=0.5):
+    """같은 class 끼리 IoU 가 큰 순서로 1:1 매칭해 (매칭 수, IoU 합, |conf 차이| 합) 을 반환한다."""
+    if not reference or not candidate:
+        return 0, 0.0, 0.0
+    ref_boxes = torch.tensor([d["box"] for d in reference])
+    cand_boxes = torch.tensor([d["box"] for d in candidate])
+    iou = torchvision.ops.box_iou(ref_boxes, cand_boxes)
+    same_class = torch.tensor([[r["class"] == c["class"] for c in candidate] for r in reference])
+    iou = torch.where(same_class, iou, torch.zeros_like(iou))
+
+    matched, iou_sum, conf_diff_sum = 0, 0.0, 0.0
+    while True:
+        best = iou.max()
+        if best < iou_thres:
+            break
+        r, c = divmod(int(iou.argmax()), iou.shape[1])
+        matched += 1
+        iou_sum += float(best)
+        conf_diff_sum += abs(reference[r]["confidence"] - candidate[c]["confidence"])
+        iou[r, :] = 0
+        iou[:, c] = 0
+    return matched, iou_sum, conf_diff_sum
+
+
+def detect(model, backbone_outputs):
+    return server.postprocess_detections(model, server.run_head(model, backbone_outputs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="양자화 전송 모드 정확도/전송량 비교")
+    parser.add_argument("--payload-dir", type=Path, default=server.BACKBONE_PAYLOAD_DIR)
+    parser.add_argument("--modes", nargs="+", default=["fp16", "int8"], choices=["fp16", "int8"])
+    parser.add_argument("--limit", type=int, default=0, help="사용할 최대 페이로드 수 (0 = 전체)")
+    parser.add_argument("--iou-thres", type=float, default=0.5)
+    args = parser.parse_args()
+
+    paths = sorted(
+        p for p in args.payload_dir.iterdir()
+        if not p.name.startswith(".") and p.name.removesuffix(".gz").endswith((".pt", ".sdit"))
+    )
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"{args.payload_dir} 에 재생할 페이로드가 없습니다.")
+
+    modes = ["none", *args.modes]
+    stats = {mode: {"bytes": 0, "dets": 0, "matched": 0, "iou": 0.0, "conf_diff": 0.0} for mode in modes}
+    reference_dets = 0
+    frames = 0
+
+    for path in paths:
+        try:
+            outputs, meta = server.decode_backbone_payload(read_archived(path))
+            model = server.registry.get(str(meta.get("model") or server.DEFAULT_MODEL_ID))
+            model.validate(outputs)
+        except Exception as e:
+            print(f"건너뜀 {path.name}: {e}")
+            continue
+        required = model.required_outputs_by_split[len(outputs)]
+        selected = [
+            out.float() if out is not None and i in required else None
+            for i, out in enumerate(outputs)
+        ]
+        reference = detect(model, selected)
+        reference_dets += len(reference)
+        frames += 1
+
+        for mode in modes:
+            encoded = split_protocol.encode_outputs(selected, quantization=mode)
+            decoded, _ = split_protocol.decode_outputs(encoded, server.device)
+            candidate = reference if mode == "none" else detect(model, decoded)
+            matched, iou_sum, conf_diff_sum = match_detections(reference, candidate, args.iou_thres)
+            entry = stats[mode]
+            entry["bytes"] += len(encoded)
+            entry["dets"] += len(candidate)
+            entry["matched"] += matched
+            entry["iou"] += iou_sum
+            entry["conf_diff"] += conf_diff_sum
+
+    if not frames:
+        raise SystemExit("디코딩 가능한 페이로드가 없습니다.")
+
+    raw_bytes = stats["none"]["bytes"] / frames
+    print(f"\n페이로드 {frames}개, 기준(float32) 검출 {reference_dets}개")
+    print(f"{'mode':>6s} {'bytes/frame':>12s} {'ratio':>7s} {'precision':>10s} {'recall':>8s} {'mean IoU':>9s} {'|dconf|':>8s}")
+    for mode in modes:
+        entry = stats[mode]
+        per_frame = entry["bytes"] / frames
+        precision = entry["matched"] / entry["dets"] if entry["dets"] else 1.0
+        recall = entry["matched"] / reference_dets if reference_dets else 1.0
+        mean_iou = entry["iou"] / entry["matched"] if entry["matched"] else 0.0
+        conf_diff = entry["conf_diff"] / entry["matched"] if entry["matched"] else 0.0
+        print(f"{mode:>6s} {per_frame:12.0f} {per_frame / raw_bytes:7.3f} {precision:10.3f} {recall:8.3f} "
+              f"{mean_iou:9.3f} {conf_diff:8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,40 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 import torch
 from pathlib import Path
 import io
-import torchvision
+import json
 import os
-from datetime import datetime
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Optional
 
-app = FastAPI()
+import split_model
+import split_protocol
+from split_trace import NULL_TRACE, Tracer
+from batching import Histogram, MicroBatcher, QueueFullError
+from model_registry import HeadModel, ModelLoadError, ModelRegistry, UnknownModelError
+from payload_archiver import PayloadArchiver
+from split_delta import DeltaReferences, KeyframeRequired
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global local_server
+    head_batcher.start()
+    local_server = await start_local_server()
+    yield
+    if local_server is not None:
+        local_server.close()
+        await local_server.wait_closed()
+        LOCAL_SOCKET.unlink(missing_ok=True)
+    await head_batcher.stop()
+    await asyncio.to_thread(payload_archiver.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # COCO 클래스 목록
 CLASSES = [
@@ -30,125 +55,559 @@ CLASSES = [
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 YOLO_ROOT = Path.cwd()
 model_path = YOLO_ROOT / 'yolov5n.pt'
+head_model_path = YOLO_ROOT / os.getenv("NECK_HEAD_MODEL_PATH", "yolov5n_head.pt")
+# YAML 기준: backbone은 10개의 레이어 (인덱스 0~9). 전체 체크포인트로 폴백할 때의 기본 분할 지점
+DEFAULT_BACKBONE_LEN = 10
+# /split_info 로 알리는 기본 모델의 기본 분할 지점. 미지정 시 head 아티팩트의 backbone_len
+SPLIT_OVERRIDE = os.getenv("NECK_HEAD_SPLIT")
+
+# head 모델 레지스트리. 요청은 SDIT meta 의 model 로 모델을 고르고, 없으면 기본 모델(NECK_HEAD_MODEL_PATH)을 쓴다.
+# NECK_HEAD_MODELS 는 "id=head 아티팩트 경로" 를 쉼표로 구분한 목록이며, 작업 디렉터리의 <id>_head.pt 도 자동 등록한다.
+DEFAULT_MODEL_ID = os.getenv("NECK_HEAD_DEFAULT_MODEL", "yolov5n")
+MODEL_SPECS = [entry.split("=", 1) for entry in os.getenv("NECK_HEAD_MODELS", "").split(",") if "=" in entry]
+MODEL_MEMORY_MB = float(os.getenv("NECK_HEAD_MODEL_MEMORY_MB", "1024"))  # 0 이면 무제한
+MODEL_LOAD_WORKERS = int(os.getenv("NECK_HEAD_MODEL_LOAD_WORKERS", "2"))
+
+# 같은 노드의 백본은 hostPath 로 공유한 Unix domain socket 으로 보낸다 (비우면 사용 안 함).
+# NODE_NAME(downward API)을 /split_info 로 알려 백본이 같은 노드인지 판단하게 한다.
+LOCAL_SOCKET_PATH = os.getenv("NECK_HEAD_LOCAL_SOCKET", "/run/sdi-split/neck-head.sock")
+LOCAL_SOCKET = Path(LOCAL_SOCKET_PATH) if LOCAL_SOCKET_PATH else None
+NODE_NAME = os.getenv("NODE_NAME", "")
+local_server = None
 
 SAVE_BACKBONE_PAYLOADS = os.getenv("SAVE_BACKBONE_PAYLOADS", "true").lower() in {"true", "1", "yes", "on"}
 BACKBONE_PAYLOAD_DIR = Path(os.getenv("BACKBONE_PAYLOAD_DIR", "/data/backbone-inputs")).resolve()
-payload_lock = asyncio.Lock()
+# 샘플링 / 대기열 / 용량·기간 제한 / 압축은 ARCHIVE_* 환경 변수 (payload_archiver.py)
+payload_archiver = PayloadArchiver.from_env(BACKBONE_PAYLOAD_DIR, "backbone", enabled=SAVE_BACKBONE_PAYLOADS)
 
-if SAVE_BACKBONE_PAYLOADS:
-    BACKBONE_PAYLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# delta encoding(SDIT v3) stream 별 keyframe 기준을 보관할 최대 stream 수 (split_delta.py)
+DELTA_MAX_STREAMS = int(os.getenv("NECK_HEAD_DELTA_MAX_STREAMS", "64"))
+delta_references = DeltaReferences(max_streams=DELTA_MAX_STREAMS)
 
+# 여러 백본의 동시 요청을 모아 한 번에 head forward 를 수행하는 micro-batching 설정
+MAX_BATCH_SIZE = int(os.getenv("NECK_HEAD_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("NECK_HEAD_MAX_BATCH_WAIT_MS", "5"))
 
-async def _persist_backbone_payload(data: bytes, original_filename: Optional[str] = None) -> Optional[str]:
-    if not SAVE_BACKBONE_PAYLOADS:
-        return None
+# 추론(디코딩 / head forward / NMS)은 이벤트 루프 밖의 전용 worker 에서 실행한다.
+INFERENCE_WORKERS = int(os.getenv("NECK_HEAD_INFERENCE_WORKERS", "1"))
+INTRA_OP_THREADS = int(os.getenv("NECK_HEAD_INTRA_OP_THREADS", "0"))  # 0 이면 torch 기본값
+MAX_QUEUE = int(os.getenv("NECK_HEAD_MAX_QUEUE", "32"))  # 초과 시 503 으로 거절
+RETRY_AFTER_SEC = int(os.getenv("NECK_HEAD_RETRY_AFTER_SEC", "1"))
+
+# 후처리(클래스별 NMS) 설정. NECK_HEAD_CLASSES 는 쉼표로 구분한 class id 또는 이름 (비어 있으면 전체)
+CONF_THRES = float(os.getenv("NECK_HEAD_CONF_THRES", "0.20"))
+# objectness: objectness 만 임계값과 비교 (이전 동작), score: YOLOv5 와 같이 obj × class 점수도 비교 (postprocess.py)
+CONF_MODE = os.getenv("NECK_HEAD_CONF_MODE", "objectness").strip().lower()
+IOU_THRES = float(os.getenv("NECK_HEAD_IOU_THRES", "0.45"))
+MAX_DET = int(os.getenv("NECK_HEAD_MAX_DET", "300"))
+CLASS_FILTER = [c for c in os.getenv("NECK_HEAD_CLASSES", "").split(",") if c.strip()]
+AGNOSTIC_NMS = os.getenv("NECK_HEAD_AGNOSTIC_NMS", "false").lower() in {"true", "1", "yes", "on"}
+
+if INTRA_OP_THREADS > 0:
+    torch.set_num_threads(INTRA_OP_THREADS)
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="neck-head-infer")
 
+
+def _persist_backbone_payload(data: bytes, original_filename: Optional[str] = None) -> Optional[str]:
+    """보관 대기열에 넣기만 하고 저장될 경로를 반환한다 (쓰기는 백그라운드). 보관하지 않으면 None."""
     suffix = Path(original_filename or "").suffix or ".pt"
-    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
-    filename = f"backbone_{timestamp}{suffix}"
-    target_path = BACKBONE_PAYLOAD_DIR / filename
+    return payload_archiver.submit(data, suffix)
+
+
+POSTPROCESS_OPTIONS = {
+    "conf_thres": CONF_THRES,
+    "conf_mode": CONF_MODE,
+    "iou_thres": IOU_THRES,
+    "classes": CLASS_FILTER,
+    "agnostic": AGNOSTIC_NMS,
+    "max_det": MAX_DET,
+}
 
-    async with payload_lock:
-        await asyncio.to_thread(target_path.write_bytes, data)
 
-    return str(target_path)
+def load_head_model(model_id, spec):
+    """head 분할 아티팩트만 로드 (split_model.py 로 생성). 없으면 전체 체크포인트에서 잘라 사용한다."""
+    layers, meta = split_model.load_part(
+        spec["path"], "head", fallback=spec.get("fallback"), split=DEFAULT_BACKBONE_LEN, map_location=device
+    )
+    layers = layers.float().eval().to(device)
+    return HeadModel(model_id, layers, meta, class_names=spec.get("classes"), postprocess_options=POSTPROCESS_OPTIONS)
 
-# 전체 모델 로드 및 CUDA로 이동
-print("전체 모델 로드 시작...")
-full_model = torch.load(model_path, map_location=device, weights_only=False)['model'].float().eval().to(device)
-print("전체 모델 로드 완료.")
 
-# YAML 기준: backbone은 10개의 레이어 (인덱스 0~9)
-backbone_len = 10
-head_layers = full_model.model[backbone_len:]
-print(f"head_layers (인덱스 {backbone_len} 이후) 로드 완료.")
+registry = ModelRegistry(
+    load_head_model, memory_budget=int(MODEL_MEMORY_MB * 1024 * 1024), load_workers=MODEL_LOAD_WORKERS
+)
+registry.register(DEFAULT_MODEL_ID, pinned=True, path=head_model_path, fallback=model_path, classes=CLASSES)
+for discovered in sorted(YOLO_ROOT.glob("*_head.pt")):
+    model_id = discovered.name[:-len("_head.pt")]
+    if model_id not in registry.specs:
+        registry.register(model_id, path=discovered, fallback=discovered.with_name(f"{model_id}.pt"))
+for model_id, path in MODEL_SPECS:
+    path = YOLO_ROOT / path.strip()
+    registry.register(model_id.strip(), path=path, fallback=path.with_name(path.name.replace("_head", "")))
 
-def head_forward(layers, backbone_outputs):
+# 기본 모델은 시작할 때 불러와 설정을 검증하고 내리지 않는다. 다른 모델은 첫 요청 때 불러온다.
+print("head 모델 로드 시작...")
+default_model = registry.get(DEFAULT_MODEL_ID)
+backbone_len = int(SPLIT_OVERRIDE) if SPLIT_OVERRIDE else default_model.backbone_len
+if backbone_len not in default_model.required_outputs_by_split:
+    raise ValueError(
+        f"NECK_HEAD_SPLIT={backbone_len} 은 처리할 수 있는 분할 지점이 아닙니다: {default_model.split_points}"
+    )
+print(f"처리 가능한 분할 지점: {default_model.split_points}, 기본 분할 지점: {backbone_len}")
+print(f"neck-head 가 사용하는 백본 출력 인덱스: {default_model.required_outputs_by_split[backbone_len]}")
+print(f"등록된 head 모델: {sorted(registry.specs)} (기본 {DEFAULT_MODEL_ID})")
+
+# 요청 단위 단계별 시간(SPLIT_TRACE_LEVEL=info 이상)과 head 레이어별 시간 / shape(debug)
+request_tracer = Tracer("neck_head")
+layer_tracer = Tracer("neck_head.layers", debug_only=True)
+
+
+def head_forward(layers, backbone_outputs, trace=NULL_TRACE):
     """
     YOLOv5 네크+헤드 forward 함수.
-    backbone_outputs는 백본에서 반환된 리스트 (인덱스 0~9).
+    backbone_outputs는 백본에서 반환된 리스트 (인덱스 0 ~ split-1), layers 는 split 번째 레이어부터.
     """
     outputs = backbone_outputs.copy()  # 기존 백본 출력들을 복사
-    x = outputs[-1]  # 백본의 마지막 출력 (인덱스 9)
-    print(f"백본 마지막 출력 shape: {x.shape}")
-    for idx, m in enumerate(layers, start=backbone_len):
+    x = outputs[-1]  # 백본의 마지막 출력 (인덱스 split-1)
+    for idx, m in enumerate(layers, start=len(outputs)):
         if m.f != -1:
             if isinstance(m.f, int):
                 x = outputs[m.f]
             else:
                 x = [outputs[j] for j in m.f]
-        x = m(x)
+        if trace.enabled:
+            with trace.stage(f"layer{idx}"):
+                x = m(x)
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+            trace.set(**{f"layer{idx}_shape": list(getattr(x, "shape", []))})
+        else:
+            x = m(x)
         outputs.append(x)
-        print(f"레이어 {idx} 통과 후 출력 shape: {x.shape if hasattr(x, 'shape') else x}")
     return outputs[-1]
 
-@app.post("/process_neck_head")
-async def process_backbone(file: UploadFile = File(...)):
-    print("fastapi 들어옴")
-    contents = await file.read()
-    saved_path = await _persist_backbone_payload(contents, file.filename)
+@app.get("/split_info")
+async def split_info(model: Optional[str] = None):
+    """
+    백본 pod 는 이 정보를 받아 분할 지점을 정하고, 그 지점의 required_outputs 에 포함된 출력만 전송한다.
+    model 을 지정하면 그 모델(필요하면 불러온 뒤)의 정보를 돌려준다.
+    """
+    try:
+        head = await registry.aget(model or DEFAULT_MODEL_ID)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    split = backbone_len if head is default_model else head.backbone_len
+    return {
+        "model": head.model_id,
+        "models": sorted(registry.specs),
+        "backbone_len": split,
+        "required_outputs": head.required_outputs_by_split[split],
+        "split_points": head.split_points,
+        "required_outputs_by_split": {str(s): req for s, req in head.required_outputs_by_split.items()},
+        "wire_versions": list(split_protocol.SUPPORTED_WIRE_VERSIONS),
+        "stream_path": "/ws/neck_head",
+        # 백본의 NODE_NAME 과 같으면 local_socket 으로 보낼 수 있다
+        "node_name": NODE_NAME or None,
+        "local_socket": str(LOCAL_SOCKET) if local_server is not None else None,
+        # SDID 응답을 받는 클라이언트는 class 이름 표를 여기서 한 번만 받는다
+        "detection_formats": ["application/json", split_protocol.DETECTIONS_CONTENT_TYPE],
+        "classes": head.class_names,
+        "class_table": head.class_table,
+    }
+
+
+def decode_backbone_payload(contents):
+    """
+    SDIT 프레임 또는 torch.save 페이로드를 (백본 출력 리스트, meta) 로 복원한다. 형식 오류는 ValueError.
+    delta 프레임은 stream 의 keyframe 기준을 더해 복원하며, 기준이 없으면 KeyframeRequired.
+    torch.save 페이로드의 meta 는 빈 dict 이다.
+    """
+    if split_protocol.is_binary_payload(contents):
+        # SDIT 바이너리 프레임: pickle 없이 수신 버퍼를 그대로 텐서로 사용
+        try:
+            outputs, meta = split_protocol.decode_outputs(contents, device)
+        except KeyError as e:
+            raise ValueError(f"meta 항목 누락: {e}")
+        # 후처리 / 검출 나이 계산에 쓰는 숫자 항목은 head 를 돌리기 전에 확인한다
+        for key in ("scale", "captured_at"):
+            value = meta.get(key, 0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"meta.{key} 가 숫자가 아닙니다: {value!r}")
+        return delta_references.apply(outputs, meta), meta
+    # 이전 버전 백본 호환용 torch.save 포맷
     buffer = io.BytesIO(contents)
-    backbone_outputs = torch.load(buffer, map_location=device)
-    print(f"불러온 백본 출력 개수: {len(backbone_outputs)}, 마지막 출력 shape: {backbone_outputs[-1].shape}")
+    try:
+        return torch.load(buffer, map_location=device), {}
+    except Exception as e:
+        # SDIT 도 torch.save 도 아닌 본문 (UnpicklingError / EOFError / RuntimeError 등)
+        detail = str(e).strip().splitlines()[0] if str(e).strip() else ""
+        raise ValueError(f"알 수 없는 페이로드 형식 ({type(e).__name__}: {detail})")
+
 
+async def decode_request(trace, contents):
+    """
+    페이로드를 디코딩하고 meta 의 model(없으면 기본 모델)로 head 모델을 찾아 (모델, 백본 출력, meta) 를 반환한다.
+    형식 오류 / 등록되지 않은 모델 / 처리할 수 없는 분할 지점은 ValueError(기준 keyframe 이 없는 delta 프레임은
+    그 하위의 KeyframeRequired), 모델 로드 실패는 ModelLoadError.
+    """
+    with trace.stage("decode"):
+        backbone_outputs, meta = await run_in_inference_pool(decode_backbone_payload, contents)
+    with trace.stage("model"):
+        model = await registry.aget(str(meta.get("model") or DEFAULT_MODEL_ID))
+    model.validate(backbone_outputs)
+    return model, backbone_outputs, meta
+
+
+def run_head(model, backbone_outputs):
+    layers = model.layers_from(len(backbone_outputs))
+    trace = layer_tracer.start(model=model.model_id, split=len(backbone_outputs), batch=backbone_outputs[-1].shape[0])
     with torch.no_grad():
-        head_output = head_forward(head_layers, backbone_outputs)
+        head_output = head_forward(layers, backbone_outputs, trace)
         # Detect 모듈이 튜플을 반환하는 경우, 첫 번째 요소 사용
         if isinstance(head_output, tuple):
             head_output = head_output[0]
+    trace.emit()
+    return head_output
+
+
+def batch_key(model, backbone_outputs):
+    """같은 배치로 묶을 수 있는 요청인지 판단하는 key (모델, batch 차원을 제외한 입력 shape / dtype)."""
+    return model.model_id, len(backbone_outputs), tuple(
+        (i, tuple(backbone_outputs[i].shape[1:]), backbone_outputs[i].dtype)
+        for i in model.required_outputs_by_split[len(backbone_outputs)]
+    )
+
+
+def run_head_batch(batch):
+    """
+    같은 key 의 (모델, 백본 출력) 들을 batch 차원으로 이어 붙여 head forward 를 한 번 수행하고 요청별로 나눈다.
+    """
+    model = batch[0][0]
+    if len(batch) == 1:
+        return [run_head(model, batch[0][1])]
+    batch_outputs = [outputs for _, outputs in batch]
+    required = model.required_outputs_by_split[len(batch_outputs[0])]
+    stacked = [None] * len(batch_outputs[0])
+    for i in required:
+        stacked[i] = torch.cat([outputs[i] for outputs in batch_outputs], dim=0)
+    head_output = run_head(model, stacked)
+    sizes = [outputs[required[0]].shape[0] for outputs in batch_outputs]
+    return list(torch.split(head_output, sizes))
+
+
+head_batcher = MicroBatcher(
+    run_head_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait=MAX_BATCH_WAIT_MS / 1000,
+    executor=inference_executor,
+    concurrency=INFERENCE_WORKERS,
+    max_queue=MAX_QUEUE,
+)
+
+
+async def run_in_inference_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, fn, *args)
+
+
+def server_timing(received_at, queue_wait):
+    """응답에 싣는 서버 측 소요 시간. 백본의 분할 지점 제어기가 전송 시간과 서버 부하를 구분하는 데 쓴다."""
+    return {
+        "server_ms": round((time.perf_counter() - received_at) * 1000, 2),
+        "queue_ms": round(queue_wait * 1000, 2),
+    }
+
+
+# 서버 부하 보고. 스트림 응답(오류 포함)에는 필드로, HTTP 응답에는 split_protocol.LOAD_HEADERS 헤더로 싣는다.
+# 백본은 이 값으로 전송 간격 / 프레임 건너뛰기 / 입력 해상도를 조절한다 (backbone/pod_sync/frame_pacer.py).
+def load_fields():
+    """대기 요청 수, 최근 배치 실행 시간, 지금 보낸 요청의 예상 대기 시간 (ms)."""
+    service_time = head_batcher.service_time
+    return {
+        "queue_depth": head_batcher.queue_depth(),
+        "service_ms": round(service_time * 1000, 2) if service_time is not None else 0.0,
+        "expected_wait_ms": round(head_batcher.expected_wait() * 1000, 2),
+    }
+
+
+def load_headers(retry_after=None):
+    headers = {split_protocol.LOAD_HEADERS[k]: str(v) for k, v in load_fields().items()}
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return headers
+
+
+# 검출 나이: 백본이 프레임을 캡처한 시각(SDIT meta.captured_at, epoch 초)부터 응답을 보내는 시각까지.
+# 노드 간 시계 차이가 그대로 들어가므로 NTP 로 맞춰진 클러스터에서만 의미가 있다. 백본도 같은 값을 따로 집계한다.
+detection_age_hist = Histogram([50, 100, 200, 500, 1000, 2000, 5000, 10000])  # ms
+
+
+def observe_detection_age(meta):
+    captured_at = meta.get("captured_at")
+    if captured_at is None:
+        return None
+    age_ms = max(time.time() - float(captured_at), 0.0) * 1000
+    detection_age_hist.observe(age_ms)
+    return round(age_ms, 2)
+
+
+def busy_response():
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "neck-head 추론 대기열이 가득 찼습니다.", **load_fields()},
+        headers=load_headers(retry_after=RETRY_AFTER_SEC),
+    )
+
+
+async def submit_head(trace, model, backbone_outputs):
+    """head 배치 큐에 넣고 (head 출력, 큐 대기 초) 를 돌려준다. trace 에는 queue / head 시간을 나눠 기록한다."""
+    started = time.perf_counter()
+    head_output, queue_wait = await head_batcher.submit_timed(
+        batch_key(model, backbone_outputs), (model, backbone_outputs)
+    )
+    trace.add("queue", queue_wait)
+    trace.add("head", time.perf_counter() - started - queue_wait)
+    return head_output, queue_wait
+
+
+def postprocess_detections(model, head_output, packed=False, scale=1.0):
+    """
+    head 출력 [1, num_dets, 5 + nc] 의 첫 이미지에 대한 검출 결과.
+    packed 면 SDID 로 보낼 (n, 6) 배열, 아니면 JSON 용 dict 리스트.
+    백본이 입력 해상도를 낮춰 보낸 경우 box 를 scale 배 해 원래 프레임 좌표로 돌려준다.
+    """
+    det = model.postprocessor.nms(head_output)[0]
+    if scale != 1.0:
+        det[:, :4] *= scale
+    if packed:
+        return det
+    return model.postprocessor.to_dicts(det, head_output.shape[-1] - 5)
+
+
+def wants_packed(accept):
+    """Accept 헤더에 SDID 가 있으면 압축 바이너리 응답으로 보낸다. 없으면 기존 JSON."""
+    return split_protocol.DETECTIONS_CONTENT_TYPE in (accept or "")
+
+
+def packed_detections(head_model, det, **fields):
+    return split_protocol.encode_detections(det, class_table=head_model.class_table, **fields)
+
+
+@app.post("/process_neck_head")
+async def process_backbone(request: Request, file: UploadFile = File(...)):
+    # 대기열이 이미 가득 차 있으면 디코딩 전에 바로 거절
+    if not head_batcher.admit():
+        return busy_response()
+    contents = await file.read()
+    received_at = time.perf_counter()
+    trace = request_tracer.start(path="http", bytes=len(contents))
+    saved_path = _persist_backbone_payload(contents, file.filename)
+    try:
+        model, backbone_outputs, meta = await decode_request(trace, contents)
+    except KeyframeRequired as e:
+        # 백본은 다음 프레임을 keyframe 으로 보낸다
+        return JSONResponse(status_code=409, content={"detail": str(e), "keyframe_required": True},
+                            headers=load_headers())
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"백본 출력 디코딩 실패: {e}")
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=load_headers(retry_after=RETRY_AFTER_SEC))
+
+    try:
+        head_output, queue_wait = await submit_head(trace, model, backbone_outputs)
+    except QueueFullError:
+        return busy_response()
+    packed = wants_packed(request.headers.get("accept"))
+    with trace.stage("nms"):
+        detections = await run_in_inference_pool(
+            postprocess_detections, model, head_output, packed, float(meta.get("scale", 1.0))
+        )
+
+    fields = {
+        "model": model.model_id, "split": len(backbone_outputs), **server_timing(received_at, queue_wait),
+        **load_fields(),
+    }
+    age_ms = observe_detection_age(meta)
+    if age_ms is not None:
+        fields["captured_at"] = meta["captured_at"]
+    if saved_path:
+        fields["saved_path"] = saved_path
+    with trace.stage("encode"):
+        if packed:
+            response = Response(content=packed_detections(model, detections, **fields),
+                                media_type=split_protocol.DETECTIONS_CONTENT_TYPE, headers=load_headers())
+        else:
+            response = JSONResponse(content={"detections": detections, **fields}, headers=load_headers())
+    trace.emit(model=model.model_id, split=len(backbone_outputs), detections=len(detections), packed=packed,
+               age_ms=age_ms)
+    return response
+
+
+@app.get("/healthz")
+async def healthz():
+    # 추론과 분리된 이벤트 루프에서 바로 응답
+    return {"status": "ok", "queue_depth": head_batcher.queue_depth()}
+
+
+@app.get("/metrics")
+async def metrics():
+    # micro-batching 튜닝용: 배치 크기 / 큐 대기 시간(ms) 히스토그램
+    # 검출 나이는 SDIT meta 에 captured_at 을 싣는 백본의 요청만 집계한다
+    return {
+        "batching": head_batcher.stats(),
+        "detection_age_ms": detection_age_hist.snapshot(),
+        "delta": delta_references.stats(),
+        "models": registry.stats(),
+        "archive": payload_archiver.stats(),
+    }
 
-    # head_output의 shape: [1, num_dets, 85]
-    #   0:4 -> [cx, cy, w, h]
-    #   4   -> obj_conf
-    #   5:  -> class_scores
-    pred = head_output.squeeze(0)  # [num_dets, 85]
-
-    # 1) confidence 필터링 (obj_conf)
-    conf_thres = 0.20
-    mask = pred[:, 4] > conf_thres
-    filtered = pred[mask]  # [N, 85]
-    print(f"필터링 후 검출 개수: {filtered.shape[0]}")
-
-    # 2) center xywh -> xyxy 변환
-    cxcywh = filtered[:, :4]
-    obj_conf = filtered[:, 4:5]
-    class_scores = filtered[:, 5:]
-    class_conf, class_id = class_scores.max(dim=1)   # 각 row별 최대 class score 및 index
-    final_scores = obj_conf.squeeze() * class_conf   # 최종 score = obj_conf * class_conf
-
-    # center to xyxy
-    x1 = cxcywh[:, 0] - cxcywh[:, 2] / 2
-    y1 = cxcywh[:, 1] - cxcywh[:, 3] / 2
-    x2 = cxcywh[:, 0] + cxcywh[:, 2] / 2
-    y2 = cxcywh[:, 1] + cxcywh[:, 3] / 2
-    boxes_xyxy = torch.stack([x1, y1, x2, y2], dim=1)  # [N, 4]
-
-    # 3) NMS 적용
-    iou_threshold = 0.45
-    keep_idx = torchvision.ops.nms(boxes_xyxy, final_scores, iou_threshold)
-    boxes_xyxy = boxes_xyxy[keep_idx]
-    final_scores = final_scores[keep_idx]
-    class_id = class_id[keep_idx]
-
-    # 4) 최종 detection 구성
-    detections = []
-    for i in range(len(keep_idx)):
-        x1, y1, x2, y2 = boxes_xyxy[i].tolist()
-        label_idx = int(class_id[i].item())
-        score_val = final_scores[i].item()
-        label = CLASSES[label_idx] if label_idx < len(CLASSES) else f"Unknown({label_idx})"
-
-        detection = {
-            "box": [x1, y1, x2, y2],
-            "class": label,
-            "confidence": score_val
-        }
-        detections.append(detection)
-        print(f"[#{i}] {detection}")
-
-    response_payload = {"detections": detections}
+
+def stream_error(frame_id, error, **fields):
+    return json.dumps({"frame_id": frame_id, "error": error, **fields, **load_fields()}, ensure_ascii=False)
+
+
+def stream_frame_failed(frame_id, stage, error):
+    """예상하지 못한 프레임 처리 예외. 서버 로그에 남기고 그 프레임의 오류 응답을 만든다."""
+    print(f"neck-head 스트림 프레임 {frame_id} {stage}: {type(error).__name__}: {error}")
+    return stream_error(frame_id, f"{stage}: {type(error).__name__}: {error}")
+
+
+async def process_stream_frame(contents, packed, path):
+    """
+    스트림(WebSocket / 로컬 UDS) 프레임 하나를 처리해 응답을 반환한다.
+    packed 면 SDID bytes, 아니면 JSON str. 오류 응답은 항상 JSON str 이다.
+    디코딩 / 추론 중 예외는 그 프레임의 오류 응답으로 돌려주므로 한 프레임 때문에 연결이 끊기지 않는다.
+    """
+    if not split_protocol.is_binary_payload(contents):
+        return stream_error(None, "SDIT 바이너리 프레임만 지원합니다.")
+
+    received_at = time.perf_counter()
+    trace = request_tracer.start(path=path, bytes=len(contents))
+    saved_path = _persist_backbone_payload(contents, "stream.sdit")
+    # 파이프라이닝 중이므로 디코딩 오류 / keyframe 요청도 어느 프레임의 것인지 알려 준다 (meta 를 못 읽으면 None)
+    try:
+        frame_id = split_protocol.decode_meta(contents).get("frame_id")
+    except Exception:
+        frame_id = None
+    try:
+        model, backbone_outputs, meta = await decode_request(trace, contents)
+    except KeyframeRequired as e:
+        return stream_error(frame_id, str(e), keyframe_required=True)
+    except UnknownModelError as e:
+        return stream_error(frame_id, str(e))
+    except ValueError as e:
+        return stream_error(frame_id, f"백본 출력 디코딩 실패: {e}")
+    except ModelLoadError as e:
+        return stream_error(frame_id, str(e), retry_after=RETRY_AFTER_SEC)
+    except Exception as e:
+        return stream_frame_failed(frame_id, "백본 출력 디코딩 실패", e)
+
+    try:
+        head_output, queue_wait = await submit_head(trace, model, backbone_outputs)
+        with trace.stage("nms"):
+            detections = await run_in_inference_pool(
+                postprocess_detections, model, head_output, packed, float(meta.get("scale", 1.0))
+            )
+    except QueueFullError as e:
+        return stream_error(frame_id, str(e), retry_after=RETRY_AFTER_SEC)
+    except Exception as e:
+        return stream_frame_failed(frame_id, "head 추론 실패", e)
+    fields = {
+        "frame_id": frame_id, "model": model.model_id, "split": len(backbone_outputs),
+        **server_timing(received_at, queue_wait), **load_fields(),
+    }
+    age_ms = observe_detection_age(meta)
+    if age_ms is not None:
+        fields["captured_at"] = meta["captured_at"]
     if saved_path:
-        response_payload["saved_path"] = saved_path
+        fields["saved_path"] = saved_path
+    with trace.stage("encode"):
+        if packed:
+            body = packed_detections(model, detections, **fields)
+        else:
+            body = json.dumps({"detections": detections, **fields}, separators=(",", ":"), ensure_ascii=False)
+    trace.emit(frame_id=meta.get("frame_id"), model=model.model_id, split=len(backbone_outputs),
+               detections=len(detections), packed=packed, age_ms=age_ms)
+    return body
+
+
+@app.websocket("/ws/neck_head")
+async def neck_head_stream(websocket: WebSocket):
+    """
+    백본 pod 와의 지속 연결. 클라이언트는 SDIT 프레임(meta 에 frame_id 포함)을 응답을 기다리지 않고
+    연속으로 보내고, 서버는 수신 순서대로 처리해 {"frame_id", "detections"} JSON 을 돌려준다.
+    연결 요청의 Accept 헤더에 SDID 가 있으면 검출 결과를 SDID 바이너리 프레임으로 보낸다 (오류는 계속 JSON).
+    """
+    packed = wants_packed(websocket.headers.get("accept"))
+    await websocket.accept()
+    print("neck-head 스트림 연결")
+    while True:
+        try:
+            message = await websocket.receive()
+        except WebSocketDisconnect:
+            break
+        if message["type"] == "websocket.disconnect":
+            break
+        # 프레임 처리 오류는 process_stream_frame 이 그 프레임의 stream_error 로 돌려준다
+        body = await process_stream_frame(message.get("bytes") or b"", packed, "ws")
+        try:
+            if isinstance(body, bytes):
+                await websocket.send_bytes(body)
+            else:
+                await websocket.send_text(body)
+        except (WebSocketDisconnect, RuntimeError):
+            # 처리 중 클라이언트가 끊고 나간 경우 (응답을 보낼 곳이 없음, 닫힌 연결에 보내면 RuntimeError)
+            break
+    print("neck-head 스트림 종료")
+
+
+async def read_local_frame(reader):
+    header = await reader.readexactly(split_protocol.STREAM_FRAME_HEADER.size)
+    (size,) = split_protocol.STREAM_FRAME_HEADER.unpack(header)
+    return await reader.readexactly(size)
+
+
+async def read_local_hello(reader):
+    """연결 직후 백본이 보내는 {"accept": ...} 를 읽어 SDID 로 응답할지 반환한다. 형식이 맞지 않으면 ValueError."""
+    hello = json.loads(await read_local_frame(reader))
+    if not isinstance(hello, dict) or not isinstance(hello.get("accept", ""), str):
+        raise ValueError(f"인사 메시지 형식이 올바르지 않습니다: {hello!r}")
+    return wants_packed(hello.get("accept"))
 
-    # JSON으로 반환
-    return JSONResponse(content=response_payload)
+
+async def local_stream(reader, writer):
+    """
+    같은 노드의 백본 pod 와의 Unix domain socket 스트림. 처리 방식은 /ws/neck_head 와 같고,
+    메시지 framing 만 길이 prefix 를 쓴다 (split_protocol.STREAM_FRAME_HEADER).
+    """
+    print("neck-head 로컬 스트림 연결")
+    try:
+        packed = await read_local_hello(reader)
+        while True:
+            contents = await read_local_frame(reader)
+            # 프레임 처리 오류는 process_stream_frame 이 그 프레임의 stream_error 로 돌려준다
+            body = await process_stream_frame(contents, packed, "uds")
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            writer.writelines([split_protocol.STREAM_FRAME_HEADER.pack(len(body)), body])
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except ValueError as e:
+        print("neck-head 로컬 스트림 handshake 오류:", e)
+    finally:
+        writer.close()
+    print("neck-head 로컬 스트림 종료")
+
+
+async def start_local_server():
+    """LOCAL_SOCKET 디렉터리(hostPath)가 마운트되어 있으면 Unix domain socket 스트림을 연다. 아니면 None."""
+    if not LOCAL_SOCKET or not LOCAL_SOCKET.parent.is_dir():
+        return None
+    LOCAL_SOCKET.unlink(missing_ok=True)  # 이전 pod 가 남긴 소켓
+    server = await asyncio.start_unix_server(local_stream, path=str(LOCAL_SOCKET))
+    print(f"neck-head 로컬 스트림 대기: {LOCAL_SOCKET} (node {NODE_NAME or '-'})")
+    return server
@@ -0,0 +1,142 @@
+"""
+연속 프레임 feature map delta encoding (backbone/pod_sync 와 neck-head-slim/app 에 동일하게 복사해 사용).
+
+천천히 움직이는 로봇의 연속 프레임은 백본 출력이 거의 같으므로, keyframe 을 한 번 보낸 뒤에는
+keyframe 복원값과의 차이(residual)만 보낸다 (SDIT version 3 의 delta encoding, split_protocol.py).
+
+    송신(DeltaEncoder)    : |residual| 이 threshold × (keyframe 텐서 최대 절댓값) 미만인 값은 0 으로 버리고
+                            채널별 int8 로 양자화해 zlib 으로 압축한다. keyframe_interval 프레임마다, 또는 delta 가
+                            keyframe 크기의 max_ratio 를 넘으면(장면 변화) 새 keyframe 을 보낸다.
+    수신(DeltaReferences) : stream 별 마지막 keyframe 복원값을 LRU 로 보관하고 delta 프레임에 더해 복원한다.
+
+delta 는 항상 keyframe 기준이므로 delta 프레임 하나가 유실 / 거절되어도 이후 프레임에 오차가 쌓이지 않는다.
+수신 측에 기준 keyframe 이 없으면(재시작, 다른 replica, keyframe 유실) KeyframeRequired 로 거절하고,
+송신 측은 다음 프레임을 keyframe 으로 보낸다.
+"""
+import collections
+import threading
+
+import torch
+
+import split_protocol
+
+
+class KeyframeRequired(ValueError):
+    pass
+
+
+def _signature(outputs):
+    return tuple((i, tuple(out.shape)) for i, out in enumerate(outputs) if out is not None)
+
+
+class DeltaEncoder:
+    def __init__(self, stream_id, keyframe_interval=30, threshold=0.01, max_ratio=0.5, quantization="none"):
+        self.stream_id = stream_id
+        self.keyframe_interval = keyframe_interval
+        self.threshold = threshold
+        self.max_ratio = max_ratio
+        self.quantization = quantization
+        self.counters = collections.Counter()
+        self.reset()
+
+    def reset(self):
+        """다음 프레임을 keyframe 으로 보낸다 (수신 측이 기준을 잃었을 때)."""
+        self._key_id = None
+        self._reference = None
+        self._key_bytes = 0
+        self._since_key = 0
+
+    def _keyframe(self, outputs, frame_id, meta):
+        payload = split_protocol.encode_outputs(
+            outputs, version=split_protocol.DELTA_WIRE_VERSION, quantization=self.quantization,
+            frame_id=frame_id, stream=self.stream_id, key=frame_id, **meta,
+        )
+        # 수신 측과 같은 기준을 쓰도록 양자화까지 거친 복원값을 기준으로 삼는다
+        reference, _ = split_protocol.decode_outputs(payload)
+        return payload, ("key", frame_id, reference, len(payload))
+
+    def encode(self, outputs, frame_id, **meta):
+        """
+        (페이로드, pending) 을 반환한다. 실제로 전송했을 때만 commit(pending) 을 호출해야
+        송신 측 기준이 수신 측과 어긋나지 않는다.
+        """
+        if (self._reference is None or self._since_key + 1 >= self.keyframe_interval
+                or _signature(self._reference) != _signature(outputs)):
+            return self._keyframe(outputs, frame_id, meta)
+
+        residuals = {}
+        for index, out in enumerate(outputs):
+            if out is None or not out.is_floating_point():
+                continue
+            reference = self._reference[index]
+            residual = out.detach().float().cpu() - reference.float()
+            floor = self.threshold * float(reference.abs().max())
+            residual.masked_fill_(residual.abs() < floor, 0.0)
+            residuals[index] = split_protocol.quantize_residual(residual)
+        payload = split_protocol.encode_outputs(
+            outputs, version=split_protocol.DELTA_WIRE_VERSION, residuals=residuals,
+            frame_id=frame_id, stream=self.stream_id, key=self._key_id, **meta,
+        )
+        if len(payload) > self._key_bytes * self.max_ratio:
+            # 장면이 바뀌어 delta 이득이 작으면 새 keyframe
+            return self._keyframe(outputs, frame_id, meta)
+        return payload, ("delta",)
+
+    def commit(self, pending):
+        if pending[0] == "key":
+            _, self._key_id, self._reference, self._key_bytes = pending
+            self._since_key = 0
+            self.counters["keyframes"] += 1
+        else:
+            self._since_key += 1
+            self.counters["deltas"] += 1
+
+
+class DeltaReferences:
+    """수신 측 stream 별 keyframe 기준. 가장 오래 쓰지 않은 stream 부터 max_streams 개까지만 보관한다."""
+
+    def __init__(self, max_streams=64):
+        self.max_streams = max_streams
+        self.counters = collections.Counter()
+        self._streams = collections.OrderedDict()  # stream -> (keyframe ID, 복원된 출력 리스트)
+        self._lock = threading.Lock()
+
+    def apply(self, outputs, meta):
+        """
+        keyframe 이면 기준으로 보관하고, delta 프레임이면 기준을 더해 복원한 출력 리스트를 반환한다.
+        stream 이 없는 프레임은 그대로 반환한다. 기준 keyframe 이 없으면 KeyframeRequired.
+        """
+        stream = meta.get("stream")
+        if stream is None:
+            return outputs
+        if not isinstance(stream, str):
+            raise ValueError(f"meta.stream 이 문자열이 아닙니다: {stream!r}")
+        deltas = [entry["index"] for entry in meta["tensors"] if entry.get("encoding") == "delta"]
+        with self._lock:
+            if not deltas:
+                self._streams[stream] = (meta.get("key"), outputs)
+                self._streams.move_to_end(stream)
+                while len(self._streams) > self.max_streams:
+                    self._streams.popitem(last=False)
+                self.counters["keyframes"] += 1
+                return outputs
+            key_id, reference = self._streams.get(stream, (None, None))
+            if reference is None or key_id != meta.get("key"):
+                self.counters["keyframe_required"] += 1
+                raise KeyframeRequired(f"stream {stream} 의 기준 keyframe {meta.get('key')} 이 없습니다.")
+            self._streams.move_to_end(stream)
+            self.counters["deltas"] += 1
+        restored = list(outputs)
+        for index in deltas:
+            if index >= len(reference) or reference[index] is None:
+                raise KeyframeRequired(f"stream {stream} 의 keyframe 에 출력 {index} 가 없습니다.")
+            if reference[index].shape != outputs[index].shape:
+                raise KeyframeRequired(
+                    f"stream {stream} 의 출력 {index} shape {list(outputs[index].shape)} 이 "
+                    f"keyframe {list(reference[index].shape)} 과 다릅니다."
+                )
+            restored[index] = torch.add(reference[index], outputs[index].to(reference[index].dtype))
+        return restored
+
+    def stats(self):
+        return {"streams": len(self._streams), "max_streams": self.max_streams, **self.counters}
@@ -0,0 +1,114 @@
+"""
+분할 지점 선택용 프로파일러 (backbone/pod_sync 와 neck-head-slim/app 에 동일하게 복사해 사용).
+
+레이어별 연산 시간을 BaseModel._profile_one_layer 로 측정하고, 각 분할 지점에서 백본 -> neck-head 로
+넘어가는 feature map 의 실제 SDIT 전송 바이트를 계산한다. 로봇과 서버에서 각각 --save 로 측정 결과를
+저장한 뒤 한 곳에서 합치면, 링크 대역폭별로 종단 지연이 가장 작은 분할 지점을 고를 수 있다.
+
+    종단 지연(split) = 로봇 레이어 [0, split) 시간 + 전송 바이트 / 대역폭 + 서버 레이어 [split, 끝) 시간
+
+사용 예:
+    # 로봇(백본 pod)과 서버(neck-head pod)에서 각각 측정
+    python split_profile.py --weights yolov5n.pt --save robot.json
+    python split_profile.py --weights yolov5n.pt --save server.json
+    # 측정 결과를 합쳐 대역폭별 최적 분할 지점 계산
+    python split_profile.py --weights yolov5n.pt --robot robot.json --server server.json --bandwidth-mbps 5 20 100
+"""
+import argparse
+import json
+import platform
+from pathlib import Path
+
+import torch
+
+import split_model
+import split_protocol
+
+
+def profile_layers(model, img_size):
+    """(레이어별 ms 리스트, 레이어별 출력 리스트). 시간은 _profile_one_layer 의 10회 평균."""
+    x = torch.zeros(1, 3, img_size, img_size)
+    with torch.no_grad():
+        model(x)  # warmup
+        y, dt = [], []
+        for m in model.model:
+            if m.f != -1:
+                x = y[m.f] if isinstance(m.f, int) else [x if j == -1 else y[j] for j in m.f]
+            model._profile_one_layer(m, x, dt)
+            x = m(x)
+            y.append(x)
+    return dt, y
+
+
+def cut_bytes(model, outputs, quantization):
+    """분할 지점별 SDIT 프레임 크기 {split: bytes}."""
+    layers = list(model.model)
+    sizes = {}
+    for split in range(1, len(layers)):
+        required = set(split_model.required_backbone_outputs(layers[split:], split))
+        selected = [out if i in required else None for i, out in enumerate(outputs[:split])]
+        sizes[split] = len(split_protocol.encode_outputs(selected, quantization=quantization))
+    return sizes
+
+
+def load_layer_times(path, num_layers):
+    data = json.loads(Path(path).read_text())
+    if len(data["layer_ms"]) != num_layers:
+        raise SystemExit(f"{path} 의 레이어 수({len(data['layer_ms'])})가 모델({num_layers})과 다릅니다.")
+    print(f"{path}: {data.get('host', '?')}, threads={data.get('threads', '?')}, img={data.get('img_size', '?')}")
+    return data["layer_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="레이어별 연산 시간 / 분할 지점별 전송량 프로파일")
+    parser.add_argument("--weights", type=Path, default=Path("yolov5n.pt"))
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=0, help="torch 연산 스레드 수 (0 = 기본값)")
+    parser.add_argument("--quantization", default="none", choices=split_protocol.QUANTIZATION_MODES)
+    parser.add_argument("--save", type=Path, help="이 장비의 레이어별 측정 결과를 JSON 으로 저장")
+    parser.add_argument("--robot", type=Path, help="로봇에서 저장한 측정 결과 (미지정 시 이 장비 측정값)")
+    parser.add_argument("--server", type=Path, help="서버에서 저장한 측정 결과 (미지정 시 이 장비 측정값)")
+    parser.add_argument("--bandwidth-mbps", type=float, nargs="+", default=[10.0, 50.0, 100.0])
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = split_model.load_checkpoint_model(args.weights).float().eval()
+    layer_ms, outputs = profile_layers(model, args.img_size)
+    num_layers = len(layer_ms)
+
+    if args.save:
+        args.save.write_text(json.dumps({
+            "host": platform.node(),
+            "threads": torch.get_num_threads(),
+            "img_size": args.img_size,
+            "layer_ms": layer_ms,
+        }, indent=2))
+        print(f"측정 결과 저장: {args.save}")
+
+    robot_ms = load_layer_times(args.robot, num_layers) if args.robot else layer_ms
+    server_ms = load_layer_times(args.server, num_layers) if args.server else layer_ms
+    sizes = cut_bytes(model, outputs, args.quantization)
+
+    bandwidths = args.bandwidth_mbps
+    header = f"{'split':>5s} {'robot ms':>9s} {'bytes':>10s} {'server ms':>10s}"
+    header += "".join(f" {f'e2e@{bw:g}Mbps':>13s}" for bw in bandwidths)
+    print(f"\n전송 양자화: {args.quantization}")
+    print(header)
+    e2e = {bw: {} for bw in bandwidths}
+    for split, size in sizes.items():
+        robot, server = sum(robot_ms[:split]), sum(server_ms[split:])
+        row = f"{split:5d} {robot:9.2f} {size:10d} {server:10.2f}"
+        for bw in bandwidths:
+            e2e[bw][split] = robot + size * 8 / (bw * 1e6) * 1000 + server
+            row += f" {e2e[bw][split]:13.2f}"
+        print(row)
+
+    print()
+    for bw in bandwidths:
+        best = min(e2e[bw], key=e2e[bw].get)
+        print(f"{bw:g} Mbps: 최적 분할 지점 {best} (종단 {e2e[bw][best]:.2f} ms, 전송 {sizes[best]} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+백본 <-> neck-head 간 feature map 전송 포맷 (backbone/pod_sync 와 neck-head-slim/app 에 동일하게 복사해 사용).
+
+프레임 구조 (little-endian):
+
+    magic "SDIT" (4B) | version (1B) | reserved (3B) | meta_len (4B) | meta (JSON, utf-8) | padding | segments
+
+meta 에는 원래 출력 리스트 길이(count)와 텐서별 layer index / dtype / shape / offset / nbytes 가 들어가고,
+segments 는 각 텐서의 contiguous raw 버퍼를 _ALIGN 바이트 경계에 맞춰 이어 붙인 것이다.
+meta.model 이 있으면 neck-head 는 그 model ID 의 head 로 처리한다 (없으면 서버 기본 모델).
+수신 측은 torch.frombuffer 로 복사 없이 텐서를 복원하므로 pickle 을 거치지 않는다.
+
+version 2 부터 텐서별 encoding 을 지원한다.
+    raw  : 원본 dtype 그대로
+    fp16 : float16 으로 변환해 전송, 수신 측에서 원본 dtype 으로 복원
+    int8 : 채널(dim 1)별 비대칭 8bit 양자화. 채널별 scale(float32) / zero_point(int32) 버퍼를
+           segments 에 함께 싣고 meta 의 scale_offset / zero_point_offset 으로 가리킨다.
+
+version 3 은 시간 방향 delta encoding 을 추가한다 (split_delta.py).
+    delta : 같은 stream 의 keyframe 복원값과의 차이(residual)를 채널별 대칭 int8 로 양자화하고 zlib 으로 압축한 것.
+            nbytes 는 압축된 크기이고, 채널별 scale(float32)은 scale_offset 이 가리킨다.
+    meta.stream 은 송신 측 stream ID, meta.key 는 keyframe 이면 자신의, delta 프레임이면 기준 keyframe 의 frame ID 이다.
+
+neck-head -> 백본 검출 결과 응답(SDID, Accept 로 협상):
+
+    magic "SDID" (4B) | version (1B) | reserved (3B) | count (4B) | meta_len (4B) | meta (JSON) | records
+
+records 는 검출마다 (x1, y1, x2, y2, conf) float32 + cls uint16 (22B) 를 이어 붙인 배열이다.
+class 이름은 /split_info 의 classes 로 한 번만 받고, 프레임의 meta.class_table(이름 목록 crc32)로 일치 여부를 확인한다.
+
+같은 노드의 로컬 스트림(Unix domain socket)은 메시지마다 길이(uint32 LE)를 앞에 붙인다. 연결 직후 첫 메시지는
+{"accept": ...} JSON 이고, 이후 요청은 SDIT 프레임, 응답은 SDID 프레임 또는 JSON 이다.
+
+neck-head 는 모든 응답에 부하(queue_depth / service_ms / expected_wait_ms)를 싣는다. 스트림은 응답 필드(SDID meta
+또는 JSON), HTTP 는 LOAD_HEADERS 헤더다. 백본이 meta.captured_at(캡처 시각, epoch 초)을 보내면 응답에 그대로 돌려주고,
+meta.scale 이 있으면 box 를 scale 배 해 원래 프레임 좌표로 돌려준다 (입력 해상도를 낮춰 보낸 경우).
+"""
+import json
+import struct
+import warnings
+import zlib
+
+import numpy as np
+import torch
+
+MAGIC = b"SDIT"
+WIRE_VERSION = 2
+SUPPORTED_WIRE_VERSIONS = (1, 2, 3)
+DELTA_WIRE_VERSION = 3
+QUANTIZATION_MODES = ("none", "fp16", "int8")
+CONTENT_TYPE = "application/x-sdi-tensor"
+
+_PREFIX = struct.Struct("<4sB3xI")
+_ALIGN = 64
+_MAX_OUTPUTS = 1024  # meta.count 상한 (YOLOv5 는 25 레이어 안팎)
+
+DETECTIONS_MAGIC = b"SDID"
+DETECTIONS_VERSION = 1
+DETECTIONS_CONTENT_TYPE = "application/x-sdi-detections"
+DETECTION_DTYPE = np.dtype([("box", "<f4", (4,)), ("conf", "<f4"), ("cls", "<u2")])
+_DETECTIONS_PREFIX = struct.Struct("<4sB3xII")
+STREAM_FRAME_HEADER = struct.Struct("<I")
+LOAD_HEADERS = {
+    "queue_depth": "X-Queue-Depth",
+    "service_ms": "X-Service-Time-Ms",
+    "expected_wait_ms": "X-Expected-Wait-Ms",
+}
+_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "int8": torch.int8,
+    "uint8": torch.uint8,
+    "int32": torch.int32,
+}
+
+def _frombuffer(buffer, **kwargs):
+    """
+    torch.frombuffer 로 복사 없이 텐서를 만든다.
+    디코딩된 텐서는 읽기 전용 수신 버퍼를 그대로 가리킨다 (head 는 입력을 in-place 로 수정하지 않음).
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="The given buffer is not writable", category=UserWarning)
+        return torch.frombuffer(buffer, **kwargs)
+
+
+def _padding(size):
+    return -size % _ALIGN
+
+
+def is_binary_payload(data):
+    return len(data) >= _PREFIX.size and bytes(data[:4]) == MAGIC
+
+
+def negotiate_wire_version(server_versions):
+    """서버가 지원하는 버전 중 이쪽도 지원하는 가장 높은 버전. 공통 버전이 없으면 None."""
+    common = set(server_versions or ()) & set(SUPPORTED_WIRE_VERSIONS)
+    return max(common) if common else None
+
+
+def _numel(shape):
+    numel = 1
+    for dim in shape:
+        numel *= dim
+    return numel
+
+
+def _itemsize(dtype):
+    return torch.empty((), dtype=dtype).element_size()
+
+
+def _dtype_name(dtype):
+    name = str(dtype).replace("torch.", "")
+    if name not in _DTYPES:
+        raise ValueError(f"전송할 수 없는 dtype: {dtype}")
+    return name
+
+
+def _channel_view(tensor):
+    """채널(dim 1) 단위 통계를 내기 위해 [C, -1] 형태로 펼친다. 1차원 이하는 채널 1개로 본다."""
+    if tensor.dim() < 2:
+        return tensor.reshape(1, -1)
+    return tensor.transpose(0, 1).reshape(tensor.shape[1], -1)
+
+
+def _broadcast_shape(tensor):
+    return [1, -1] + [1] * (tensor.dim() - 2) if tensor.dim() >= 2 else [-1]
+
+
+def quantize_int8(tensor):
+    """채널별 비대칭 int8 양자화. (q, scale[C], zero_point[C]) 를 반환한다."""
+    values = tensor.float()
+    channels = _channel_view(values)
+    low = channels.amin(dim=1)
+    high = channels.amax(dim=1)
+    scale = (high - low) / 255.0
+    scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+    zero_point = (-128 - torch.round(low / scale)).to(torch.int32)
+    shape = _broadcast_shape(values)
+    q = torch.round(values / scale.view(shape)) + zero_point.view(shape)
+    return q.clamp_(-128, 127).to(torch.int8), scale, zero_point
+
+
+def dequantize_int8(q, scale, zero_point, dtype=torch.float32):
+    shape = _broadcast_shape(q)
+    return ((q.float() - zero_point.view(shape).float()) * scale.view(shape)).to(dtype)
+
+
+def quantize_residual(residual):
+    """채널별 대칭 int8 양자화 (zero_point 0, 0 은 그대로 0). (q, scale[C]) 를 반환한다."""
+    values = residual.float()
+    scale = _channel_view(values).abs().amax(dim=1) / 127.0
+    scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+    q = torch.round(values / scale.view(_broadcast_shape(values)))
+    return q.clamp_(-127, 127).to(torch.int8), scale
+
+
+def dequantize_residual(q, scale, dtype=torch.float32):
+    return (q.float() * scale.view(_broadcast_shape(q))).to(dtype)
+
+
+def encode_outputs(outputs, version=WIRE_VERSION, quantization="none", residuals=None, **extra_meta):
+    """
+    백본 출력 리스트(사용하지 않는 인덱스는 None)를 바이너리 프레임으로 직렬화한다.
+    quantization 은 QUANTIZATION_MODES 중 하나이며 version 2 이상에서만 쓸 수 있다.
+    residuals({index: quantize_residual 결과})에 있는 출력은 delta encoding 으로 싣는다 (version 3 이상,
+    outputs[index] 는 dtype / shape 에만 쓰인다). extra_meta 는 meta JSON 에 그대로 실린다.
+    """
+    if version not in SUPPORTED_WIRE_VERSIONS:
+        raise ValueError(f"지원하지 않는 wire version: {version}")
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"알 수 없는 quantization: {quantization}")
+    if quantization != "none" and version < 2:
+        raise ValueError("quantization 은 wire version 2 이상에서만 지원합니다.")
+    if residuals and version < DELTA_WIRE_VERSION:
+        raise ValueError(f"delta encoding 은 wire version {DELTA_WIRE_VERSION} 이상에서만 지원합니다.")
+
+    entries = []
+    segments = []
+    offset = 0
+
+    def append_segment(tensor):
+        nonlocal offset
+        raw = memoryview(tensor if isinstance(tensor, bytes) else tensor.reshape(-1).view(torch.uint8).numpy())
+        start = offset
+        segments.append(raw)
+        pad = _padding(raw.nbytes)
+        if pad:
+            segments.append(bytes(pad))
+        offset += raw.nbytes + pad
+        return start, raw.nbytes
+
+    for index, tensor in enumerate(outputs):
+        if tensor is None:
+            continue
+        tensor = tensor.detach().contiguous().cpu()
+        entry = {"index": index, "dtype": _dtype_name(tensor.dtype), "shape": list(tensor.shape)}
+        encoding = quantization if quantization != "none" and tensor.is_floating_point() else "raw"
+        if residuals and index in residuals:
+            encoding = "delta"
+            q, scale = residuals[index]
+            entry["offset"], entry["nbytes"] = append_segment(zlib.compress(q.contiguous().numpy().tobytes(), 1))
+            entry["scale_offset"], _ = append_segment(scale.contiguous())
+        elif encoding == "fp16":
+            entry["offset"], entry["nbytes"] = append_segment(tensor.half())
+        elif encoding == "int8":
+            q, scale, zero_point = quantize_int8(tensor)
+            entry["offset"], entry["nbytes"] = append_segment(q)
+            entry["scale_offset"], _ = append_segment(scale)
+            entry["zero_point_offset"], _ = append_segment(zero_point)
+        else:
+            entry["offset"], entry["nbytes"] = append_segment(tensor)
+        if version >= 2:
+            entry["encoding"] = encoding
+        entries.append(entry)
+
+    meta = dict(extra_meta, count=len(outputs), tensors=entries)
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    header = _PREFIX.pack(MAGIC, version, len(meta_bytes)) + meta_bytes
+    header += bytes(_padding(len(header)))
+    return b"".join([header, *segments])
+
+
+def _read_meta(data):
+    if not is_binary_payload(data):
+        raise ValueError("SDIT 프레임이 아닙니다.")
+    magic, version, meta_len = _PREFIX.unpack_from(data, 0)
+    if version not in SUPPORTED_WIRE_VERSIONS:
+        raise ValueError(f"지원하지 않는 wire version: {version}")
+
+    meta_end = _PREFIX.size + meta_len
+    if meta_end > len(data):
+        raise ValueError("프레임 헤더가 잘렸습니다.")
+    # JSONDecodeError / UnicodeDecodeError 도 ValueError 이다
+    meta = json.loads(bytes(data[_PREFIX.size:meta_end]).decode("utf-8"))
+    if not isinstance(meta, dict):
+        raise ValueError(f"meta 가 JSON 객체가 아닙니다: {type(meta).__name__}")
+    return version, meta, meta_end
+
+
+def _non_negative_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{name} 는 0 이상의 정수여야 합니다: {value!r}")
+    return value
+
+
+def _read_entry(entry, count):
+    """
+    meta.tensors 항목을 검사해 (index, dtype, shape) 를 반환한다.
+    index 는 [0, count), shape / offset / nbytes 는 0 이상의 정수여야 한다 (버퍼 범위는 읽을 때 확인).
+    """
+    if not isinstance(entry, dict):
+        raise ValueError(f"meta.tensors 항목이 JSON 객체가 아닙니다: {entry!r}")
+    index = _non_negative_int(entry.get("index"), "텐서 index")
+    if index >= count:
+        raise ValueError(f"텐서 index {index} 가 출력 개수 {count} 를 벗어납니다.")
+    dtype = _DTYPES.get(entry.get("dtype")) if isinstance(entry.get("dtype"), str) else None
+    if dtype is None:
+        raise ValueError(f"텐서 {index} 의 dtype 을 알 수 없습니다: {entry.get('dtype')!r}")
+    shape = entry.get("shape")
+    if not isinstance(shape, list):
+        raise ValueError(f"텐서 {index} 의 shape 이 리스트가 아닙니다: {shape!r}")
+    for dim in shape:
+        _non_negative_int(dim, f"텐서 {index} 의 shape 차원")
+    for key in ("offset", "nbytes"):
+        _non_negative_int(entry.get(key), f"텐서 {index} 의 {key}")
+    return index, dtype, shape
+
+
+def decode_meta(data):
+    """텐서는 읽지 않고 프레임의 meta 만 반환한다 (텐서 디코딩이 실패해도 frame_id 를 알 수 있도록)."""
+    return _read_meta(data)[1]
+
+
+def decode_outputs(data, device=None):
+    """
+    encode_outputs 로 만든 프레임을 (출력 리스트, meta) 로 복원한다.
+    CPU 텐서는 data 버퍼를 복사 없이 참조하므로 data 는 텐서를 쓰는 동안 유지되어야 한다.
+    meta 형식이 맞지 않거나 텐서가 프레임 밖을 가리키면 ValueError.
+    """
+    version, meta, meta_end = _read_meta(data)
+    base = meta_end + _padding(meta_end)
+
+    def read_segment(offset, dtype, shape, index):
+        numel = _numel(shape)
+        start = base + _non_negative_int(offset, f"텐서 {index} 의 offset")
+        if start + numel * _itemsize(dtype) > len(data):
+            raise ValueError(f"텐서 {index} 의 버퍼 크기가 올바르지 않습니다.")
+        if numel == 0:
+            tensor = torch.empty(shape, dtype=dtype)
+        else:
+            tensor = _frombuffer(data, dtype=dtype, count=numel, offset=start).view(shape)
+        return tensor.to(device) if device is not None else tensor
+
+    count = _non_negative_int(meta.get("count"), "meta.count")
+    if count > _MAX_OUTPUTS:
+        raise ValueError(f"meta.count 가 너무 큽니다: {count}")
+    tensors = meta.get("tensors")
+    if not isinstance(tensors, list):
+        raise ValueError(f"meta.tensors 가 리스트가 아닙니다: {tensors!r}")
+    outputs = [None] * count
+    for entry in tensors:
+        index, dtype, shape = _read_entry(entry, count)
+        encoding = entry.get("encoding", "raw") if version >= 2 else "raw"
+        if encoding == "delta" and version >= DELTA_WIRE_VERSION:
+            start = base + entry["offset"]
+            if start + entry["nbytes"] > len(data):
+                raise ValueError(f"텐서 {index} 의 버퍼 크기가 올바르지 않습니다.")
+            try:
+                raw = zlib.decompress(data[start:start + entry["nbytes"]])
+            except zlib.error as e:
+                raise ValueError(f"텐서 {index} 의 delta 압축을 풀 수 없습니다: {e}")
+            if len(raw) != _numel(shape):
+                raise ValueError(f"텐서 {index} 의 delta 크기가 올바르지 않습니다.")
+            q = _frombuffer(raw, dtype=torch.int8).view(shape) if raw else torch.empty(shape, dtype=torch.int8)
+            channels = shape[1] if len(shape) >= 2 else 1
+            scale = read_segment(entry.get("scale_offset"), torch.float32, [channels], index).cpu()
+            tensor = dequantize_residual(q, scale, dtype)
+            outputs[index] = tensor.to(device) if device is not None else tensor
+            continue
+        if encoding == "raw":
+            wire_dtype = dtype
+        elif encoding == "fp16":
+            wire_dtype = torch.float16
+        elif encoding == "int8":
+            wire_dtype = torch.int8
+        else:
+            raise ValueError(f"알 수 없는 encoding: {encoding}")
+
+        if entry["nbytes"] != _numel(shape) * _itemsize(wire_dtype):
+            raise ValueError(f"텐서 {index} 의 버퍼 크기가 올바르지 않습니다.")
+        tensor = read_segment(entry["offset"], wire_dtype, shape, index)
+
+        if encoding == "fp16":
+            tensor = tensor.to(dtype)
+        elif encoding == "int8":
+            channels = shape[1] if len(shape) >= 2 else 1
+            scale = read_segment(entry.get("scale_offset"), torch.float32, [channels], index)
+            zero_point = read_segment(entry.get("zero_point_offset"), torch.int32, [channels], index)
+            tensor = dequantize_int8(tensor, scale, zero_point, dtype)
+        outputs[index] = tensor
+    return outputs, meta
+
+
+def class_table_id(class_names):
+    """class 이름 목록의 crc32. 응답 프레임과 클라이언트가 가진 class 표가 같은지 확인하는 데 쓴다."""
+    return zlib.crc32("\n".join(class_names).encode("utf-8"))
+
+
+def is_detections_payload(data):
+    return len(data) >= _DETECTIONS_PREFIX.size and bytes(data[:4]) == DETECTIONS_MAGIC
+
+
+def encode_detections(detections, **meta):
+    """(n, 6) 배열 [x1, y1, x2, y2, conf, cls] 을 SDID 프레임으로 직렬화한다. meta 는 JSON 으로 실린다."""
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    records = np.empty(len(detections), dtype=DETECTION_DTYPE)
+    records["box"] = detections[:, :4]
+    records["conf"] = detections[:, 4]
+    records["cls"] = detections[:, 5]
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    header = _DETECTIONS_PREFIX.pack(DETECTIONS_MAGIC, DETECTIONS_VERSION, len(records), len(meta_bytes))
+    return b"".join([header, meta_bytes, records.tobytes()])
+
+
+def decode_detections(data):
+    """SDID 프레임을 (DETECTION_DTYPE records 배열, meta) 로 복원한다."""
+    if not is_detections_payload(data):
+        raise ValueError("SDID 프레임이 아닙니다.")
+    _, version, count, meta_len = _DETECTIONS_PREFIX.unpack_from(data, 0)
+    if version != DETECTIONS_VERSION:
+        raise ValueError(f"지원하지 않는 검출 응답 version: {version}")
+    meta_end = _DETECTIONS_PREFIX.size + meta_len
+    if meta_end + count * DETECTION_DTYPE.itemsize != len(data):
+        raise ValueError("검출 응답 크기가 올바르지 않습니다.")
+    meta = json.loads(bytes(data[_DETECTIONS_PREFIX.size:meta_end]).decode("utf-8"))
+    records = np.frombuffer(data, dtype=DETECTION_DTYPE, count=count, offset=meta_end)
+    return records, meta
+
+
+def detections_to_dicts(records, class_names):
+    """SDID records 를 JSON 응답과 같은 [{"box", "class", "confidence"}] 형태로 바꾼다."""
+    names = [class_names[c] if c < len(class_names) else f"Unknown({c})" for c in records["cls"].tolist()]
+    return [
+        {"box": box, "class": name, "confidence": conf}
+        for box, name, conf in zip(records["box"].tolist(), names, records["conf"].tolist())
+    ]
@@ -0,0 +1,139 @@
+"""
+분할 추론 경로 추적 (backbone/pod_sync 와 neck-head-slim/app 에 동일하게 복사해 사용).
+
+기본값은 꺼짐이다. 켜면 SPLIT_TRACE_SAMPLE 개 요청 중 하나만 골라 단계별 소요 시간을 JSON 한 줄로 남긴다.
+기록은 QueueHandler 로 넘기고 별도 스레드가 출력하므로 요청 처리 중에는 stdout 에 쓰지 않는다.
+
+    SPLIT_TRACE_LEVEL  : off / info (요청 단위 단계별 시간) / debug (+ head 레이어별 시간과 출력 shape)
+    SPLIT_TRACE_SAMPLE : N 개 요청 중 1 개 기록 (기본 1 = 모두)
+
+    {"trace": "neck_head", "seq": 40, "path": "ws", "frame_id": 7, "decode_ms": 0.41, "queue_ms": 0.02,
+     "head_ms": 21.3, "nms_ms": 0.9, "encode_ms": 0.05, "split": 10, "detections": 5, "total_ms": 23.1}
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import nullcontext
+
+LEVELS = {"off": None, "info": logging.INFO, "debug": logging.DEBUG}
+
+logger = logging.getLogger("split_trace")
+_listener = None
+
+
+def _start_listener():
+    """trace 기록을 큐로 받아 백그라운드 스레드에서 stdout 으로 출력한다 (프로세스당 한 번)."""
+    global _listener
+    if _listener is not None:
+        return
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("[trace] %(message)s"))
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+
+class Trace:
+    """샘플링된 요청 하나의 기록. stage() / add() 로 단계 시간을 모으고 emit() 으로 한 줄을 남긴다."""
+
+    enabled = True
+
+    def __init__(self, name, level, seq, fields):
+        self.level = level
+        self.fields = {"trace": name, "seq": seq, **fields}
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        key = f"{name}_ms"
+        self.fields[key] = round(self.fields.get(key, 0.0) + seconds * 1000, 3)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def emit(self, **fields):
+        self.fields.update(fields)
+        self.fields["total_ms"] = round((time.perf_counter() - self.started) * 1000, 3)
+        logger.log(self.level, json.dumps(self.fields, ensure_ascii=False, default=str))
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTrace:
+    """추적하지 않는 요청용. 모든 호출이 아무 일도 하지 않는다."""
+
+    enabled = False
+
+    def __init__(self):
+        self._stage = nullcontext(self)
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def set(self, **fields):
+        pass
+
+    def emit(self, **fields):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Tracer:
+    """
+    name 단위의 trace 생성기. start() 는 샘플링에 걸린 요청이면 Trace, 아니면 NULL_TRACE 를 돌려준다.
+    debug_only 면 SPLIT_TRACE_LEVEL=debug 일 때만 기록한다 (레이어별 상세 기록용).
+    """
+
+    def __init__(self, name, level=None, sample_every=None, debug_only=False):
+        level = (level or os.getenv("SPLIT_TRACE_LEVEL", "off")).lower()
+        if level not in LEVELS:
+            raise ValueError(f"SPLIT_TRACE_LEVEL 은 {list(LEVELS)} 중 하나여야 합니다: {level}")
+        self.name = name
+        self.level = LEVELS[level]
+        if debug_only and self.level != logging.DEBUG:
+            self.level = None
+        self.sample_every = max(int(sample_every or os.getenv("SPLIT_TRACE_SAMPLE", "1")), 1)
+        self._seq = itertools.count(1)
+        if self.level is not None:
+            _start_listener()
+
+    @property
+    def enabled(self):
+        return self.level is not None
+
+    def start(self, **fields):
+        if self.level is None:
+            return NULL_TRACE
+        seq = next(self._seq)
+        if seq % self.sample_every:
+            return NULL_TRACE
+        return Trace(self.name, self.level, seq, fields)
@@ -1,68 +1,192 @@
 # fastapi_image_stream_server.py
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Path as PathParam, Query, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
-import time
+import asyncio
+import json
 import os
+import re
+from contextlib import asynccontextmanager
 from pathlib import Path
-from datetime import datetime
-import asyncio
 from typing import Optional
+from urllib.parse import urlencode
+
+import overlay
+from frame_hub import ORIGINAL, FrameChannels, FrameHub, Subscriber, Tier, TooManyStreams
+from payload_archiver import PayloadArchiver
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await asyncio.to_thread(image_archiver.close)
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.mount("/static", StaticFiles(directory="."), name="static")
 
-latest_frame = None
-save_lock = asyncio.Lock()
+# 시청자별 대기열 크기와, 프레임을 가져가지 않고 버린 수가 이를 넘으면 스트림을 끝낼 기준 (frame_hub.py)
+VIDEO_CLIENT_BUFFER = int(os.getenv("VIDEO_CLIENT_BUFFER", "2"))
+VIDEO_MAX_DROPPED = int(os.getenv("VIDEO_MAX_DROPPED", "100"))
+# 로봇(stream)별 채널. stream 을 지정하지 않은 /upload_image, /video_feed 는 기본 stream 을 쓴다
+DEFAULT_STREAM = os.getenv("VIDEO_DEFAULT_STREAM", "default")
+VIDEO_MAX_STREAMS = int(os.getenv("VIDEO_MAX_STREAMS", "64"))
+STREAM_ID_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+# 로봇이 검출 결과를 따로 보내면 시청자가 있을 때만 서버에서 그린다 (overlay.py)
+# 시청자가 요청한 ?w= / ?q= 는 이 단계 중 하나로 맞춘다 (단계마다 한 번만 인코딩해 시청자들이 나눠 쓰도록).
+# w 는 요청 이하의 가장 큰 폭(가장 작은 폭보다 작으면 가장 작은 폭), q 는 가장 가까운 품질. q 만 없으면 기본 품질
+VIDEO_TIER_WIDTHS = sorted(int(w) for w in os.getenv("VIDEO_TIER_WIDTHS", "160,320,480,640").split(",") if w.strip())
+VIDEO_TIER_QUALITIES = sorted(int(q) for q in os.getenv("VIDEO_TIER_QUALITIES", "40,60,75,90").split(",") if q.strip())
+VIDEO_TIER_DEFAULT_QUALITY = int(os.getenv("VIDEO_TIER_DEFAULT_QUALITY", "75"))
+channels = FrameChannels(
+    VIDEO_MAX_STREAMS, max_buffer=VIDEO_CLIENT_BUFFER, max_lag=VIDEO_MAX_DROPPED, renderer=overlay.render
+)
 
 SAVE_IMAGES = os.getenv("SAVE_UPLOADED_IMAGES", "true").lower() in {"true", "1", "yes", "on"}
 SAVE_DIR = Path(os.getenv("UPLOADED_IMAGE_DIR", "/data/uploaded-images")).resolve()
-if SAVE_IMAGES:
-    SAVE_DIR.mkdir(parents=True, exist_ok=True)
-
+# 샘플링 / 대기열 / 용량·기간 제한 / 압축은 ARCHIVE_* 환경 변수 (payload_archiver.py)
+image_archiver = PayloadArchiver.from_env(SAVE_DIR, "frame", enabled=SAVE_IMAGES)
 
-async def _persist_image(image_bytes: bytes, original_filename: Optional[str] = None) -> Optional[str]:
-    if not SAVE_IMAGES:
-        return None
 
+def _persist_image(image_bytes: bytes, original_filename: Optional[str] = None, stream: str = DEFAULT_STREAM) -> Optional[str]:
+    """보관 대기열에 넣기만 하고 저장될 경로를 반환한다 (쓰기는 백그라운드). 보관하지 않으면 None."""
     suffix = Path(original_filename or "").suffix or ".jpg"
-    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
-    filename = f"frame_{timestamp}{suffix}"
-    target_path = SAVE_DIR / filename
+    if stream != DEFAULT_STREAM:
+        suffix = f"_{stream}{suffix}"
+    return image_archiver.submit(image_bytes, suffix)
+
 
-    async with save_lock:
-        await asyncio.to_thread(target_path.write_bytes, image_bytes)
+def _tier(width: Optional[int], quality: Optional[int]) -> Tier:
+    if width is None and quality is None:
+        return ORIGINAL
+    if width is not None:
+        width = max([w for w in VIDEO_TIER_WIDTHS if w <= width] or VIDEO_TIER_WIDTHS[:1])
+        quality = VIDEO_TIER_DEFAULT_QUALITY if quality is None else quality
+    quality = min(VIDEO_TIER_QUALITIES, key=lambda q: abs(q - quality))
+    return width, quality
 
-    return str(target_path)
+
+def _channel(stream: str) -> FrameHub:
+    try:
+        return channels.get(stream)
+    except TooManyStreams as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def _parse_detections(message):
+    try:
+        return overlay.parse_detections(message)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/upload_image")
-async def upload_image(file: UploadFile = File(...)):
-    global latest_frame
-    latest_frame = await file.read()
-    saved_path = await _persist_image(latest_frame, file.filename)
-    response = {"message": "Image received"}
+async def upload_image(file: UploadFile = File(...), detections: Optional[str] = Form(None)):
+    return await upload_stream_image(DEFAULT_STREAM, file, detections)
+
+
+@app.post("/upload_image/{stream}")
+async def upload_stream_image(
+    stream: str = PathParam(..., pattern=STREAM_ID_PATTERN),
+    file: UploadFile = File(...),
+    detections: Optional[str] = Form(None),
+):
+    """detections(검출 메시지 JSON, overlay.py)를 함께 보내면 원본 프레임에 서버가 그린다."""
+    image_bytes = await file.read()
+    parsed = _parse_detections(detections) if detections is not None else None
+    _channel(stream).publish(image_bytes, parsed)
+    saved_path = _persist_image(image_bytes, file.filename, stream)
+    # overlay: 로봇이 그리지 않고 검출 결과만 보내도 된다는 표시
+    response = {"message": "Image received", "overlay": True}
     if saved_path:
         response["saved_path"] = saved_path
     return response
 
-def frame_generator():
-    global latest_frame
 
-    while True:
-        if latest_frame is not None:
+@app.websocket("/ws/upload_image")
+async def upload_image_stream(websocket: WebSocket):
+    await upload_stream_image_stream(websocket, DEFAULT_STREAM)
+
+
+@app.websocket("/ws/upload_image/{stream}")
+async def upload_stream_image_stream(websocket: WebSocket, stream: str):
+    """
+    로봇의 지속 업로드 연결. 바이너리 메시지 하나가 JPEG 프레임 하나이며 응답은 보내지 않는다
+    (프레임마다 HTTP 요청 / multipart 파싱을 하지 않는다). 텍스트 메시지는 검출 메시지(overlay.py)로,
+    다음 검출 메시지까지 이후 프레임에 그린다. 연결 직후 {"overlay": true} 를 한 번 보낸다.
+    """
+    if not re.match(STREAM_ID_PATTERN, stream):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await websocket.send_text(json.dumps({"overlay": True}))
+    print(f"영상 업로드 스트림 연결: {stream}")
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                try:
+                    channels.get(stream).set_detections(overlay.parse_detections(message["text"]))
+                except ValueError as e:
+                    print(f"검출 메시지 무시 ({stream}): {e}")
+                continue
+            image_bytes = message.get("bytes")
+            if not image_bytes:
+                continue
+            # 시청자가 없는 동안 stream 이 정리되었을 수 있으므로 매번 찾는다
+            channels.get(stream).publish(image_bytes)
+            _persist_image(image_bytes, None, stream)
+    except TooManyStreams as e:
+        await websocket.close(code=1013, reason=str(e))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    print(f"영상 업로드 스트림 종료: {stream}")
+
+async def frame_generator(hub: FrameHub, subscriber: Subscriber):
+    # 새 프레임이 올라올 때만 깨어나 한 번씩 보낸다. 연결이 끊기면 starlette 가 generator 를 취소한다
+    try:
+        async for frame in subscriber.frames():
+            data = await hub.render(frame, subscriber.tier)
             yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + latest_frame + b"\r\n")
-        time.sleep(0.05) 
+                   b"Content-Type: image/jpeg\r\n\r\n" + data + b"\r\n")
+    finally:
+        hub.unsubscribe(subscriber)
 
 @app.get("/video_feed")
-def video_feed():
-    return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
+async def video_feed(w: Optional[int] = Query(None, ge=1), q: Optional[int] = Query(None, ge=1, le=100)):
+    return await stream_video_feed(DEFAULT_STREAM, w, q)
+
+@app.get("/video_feed/{stream}")
+async def stream_video_feed(
+    stream: str = PathParam(..., pattern=STREAM_ID_PATTERN),
+    w: Optional[int] = Query(None, ge=1),
+    q: Optional[int] = Query(None, ge=1, le=100),
+):
+    """w(폭) / q(JPEG 품질)를 주면 줄인 영상을 보낸다 (VIDEO_TIER_* 단계 중 하나로 맞춤)."""
+    hub = _channel(stream)
+    subscriber = hub.subscribe(_tier(w, q))
+    return StreamingResponse(frame_generator(hub, subscriber), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.get("/streams")
+def list_streams():
+    """stream 별 (tier 별) 시청자 수, 최신 프레임 버전 / 나이, 업로드 FPS, 누적 프레임 / 바이트 / 버린 / 서버에서 만든 프레임 수."""
+    return {
+        "default_stream": DEFAULT_STREAM,
+        "max_streams": VIDEO_MAX_STREAMS,
+        "tier_widths": VIDEO_TIER_WIDTHS,
+        "tier_qualities": VIDEO_TIER_QUALITIES,
+        "streams": channels.stats(),
+    }
 
 @app.get("/", response_class=HTMLResponse)
-def index():
+def index(
+    stream: str = Query(None, pattern=STREAM_ID_PATTERN),
+    w: Optional[int] = Query(None, ge=1),
+    q: Optional[int] = Query(None, ge=1, le=100),
+):
     html_content = """
     <html>
         <head>
@@ -118,9 +242,10 @@ def index():
                 <h1>SDR(TURTLEBOT)-REALTIME-VIDEO</h1>
             </div>
             <div class="video-container">
-                <img src="/video_feed" alt="Real-time Video Feed">
+                <img src="/video_feed/{stream}{query}" alt="Real-time Video Feed">
             </div>
         </body>
     </html>
     """
-    return html_content
+    query = urlencode({k: v for k, v in (("w", w), ("q", q)) if v is not None})
+    return html_content.replace("{stream}", stream or DEFAULT_STREAM).replace("{query}", f"?{query}" if query else "")
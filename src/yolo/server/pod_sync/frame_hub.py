@@ -0,0 +1,201 @@
+"""
+MJPEG 시청자에게 업로드된 프레임을 나눠 주는 broadcast hub (이벤트 루프 안에서만 사용).
+
+업로드는 publish() 로 새 프레임을 올리고 버전(seq)을 하나 올린다. /video_feed 시청자는 각자 subscribe() 한
+Subscriber 의 크기 제한 대기열에서 다음 버전을 await 하므로, 새 프레임이 없으면 CPU 도 스레드도 쓰지 않고
+같은 프레임을 다시 보내지도 않는다.
+
+느린 시청자(대기열이 가득 참)는 가장 오래된 프레임을 버리고 최신 프레임을 받으며,
+마지막으로 프레임을 가져간 뒤 max_lag 개를 넘게 버리면(응답을 읽지 않는 연결) 스트림을 끝낸다.
+
+로봇이 검출 결과를 따로 보내면(set_detections / publish(detections=...)) 프레임에는 그 시점의 검출 결과만 붙여 두고,
+시청자에게 보낼 때 render() 가 renderer 로 한 번 그려 프레임에 캐시한다. 시청자는 해상도 / 품질 단계(tier)를
+골라 구독할 수 있고, 같은 방식으로 프레임 버전마다 tier 별로 한 번만 만든다. 시청자가 없는 tier 는 만들지 않고,
+시청자가 여럿이어도 한 번만 만든다 (이벤트 루프를 막지 않도록 스레드 풀에서).
+
+FrameChannels 는 로봇(stream)별 hub 를 보관한다. hub 하나는 최신 프레임 한 장과 카운터만 가지므로
+수십 대가 한 pod 를 같이 써도 메모리는 (stream 수 x 프레임 크기) 정도다.
+"""
+import asyncio
+import collections
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (width, quality). None 이면 원본 그대로
+Tier = Tuple[Optional[int], Optional[int]]
+ORIGINAL: Tier = (None, None)
+
+
+def tier_label(tier: Tier) -> str:
+    width, quality = tier
+    if tier == ORIGINAL:
+        return "original"
+    return (f"w{width}" if width else "") + (f"q{quality}" if quality else "")
+
+
+class Frame:
+    __slots__ = ("seq", "data", "published_at", "detections", "variants")
+
+    def __init__(self, seq: int, data: bytes, detections: Optional[List] = None):
+        self.seq = seq
+        self.data = data
+        self.published_at = time.time()
+        self.detections = detections
+        self.variants = {}  # tier -> 그리고 / 다시 인코딩한 JPEG 의 future (그 tier 로 처음 보낼 때 만든다)
+
+
+class Subscriber:
+    def __init__(self, max_buffer: int, tier: Tier = ORIGINAL):
+        self.queue = asyncio.Queue(max_buffer)
+        self.tier = tier
+        self.lag = 0  # 마지막으로 프레임을 가져간 뒤 버린 수
+        self.closed = False
+
+    def offer(self, frame: Frame, max_lag: int) -> int:
+        """프레임을 대기열에 넣고 버린 프레임 수를 반환한다. max_lag 를 넘으면 스트림을 끝낸다."""
+        if self.closed:
+            return 0
+        dropped = 0
+        if self.queue.full():
+            self.queue.get_nowait()
+            dropped = 1
+            self.lag += 1
+            if self.lag > max_lag:
+                self.close()
+                return dropped
+        self.queue.put_nowait(frame)
+        return dropped
+
+    def close(self):
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def frames(self):
+        """다음 프레임을 기다려 차례로 내준다. hub 가 끊으면 끝난다."""
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                return
+            self.lag = 0
+            yield frame
+
+
+class FrameHub:
+    def __init__(self, max_buffer: int = 2, max_lag: int = 100, renderer: Optional[Callable] = None):
+        self.max_buffer = max_buffer
+        self.max_lag = max_lag
+        self.renderer = renderer  # renderer(jpeg, detections, width, quality) -> JPEG (실패하면 None)
+        self.latest: Optional[Frame] = None
+        self.detections: List = []  # 로봇이 마지막으로 보낸 검출 결과 (다음 프레임들에 붙인다)
+        self.counters = collections.Counter()
+        self.last_active = time.monotonic()  # 마지막 업로드 / 시청 시작·종료 시각 (오래 쓰지 않은 stream 정리용)
+        self._subscribers = set()
+        self._last_published = None
+        self._interval = None  # 업로드 간격 EWMA (초)
+
+    @property
+    def viewers(self) -> int:
+        return len(self._subscribers)
+
+    def set_detections(self, detections: List):
+        self.detections = detections
+        self.counters["detection_updates"] += 1
+
+    def publish(self, data: bytes, detections: Optional[List] = None) -> Frame:
+        if detections is not None:
+            self.set_detections(detections)
+        frame = Frame(self.latest.seq + 1 if self.latest else 1, data, self.detections)
+        self.latest = frame
+        self.counters["frames"] += 1
+        self.counters["bytes"] += len(data)
+        now = time.monotonic()
+        if self._last_published is not None:
+            interval = now - self._last_published
+            self._interval = interval if self._interval is None else self._interval * 0.8 + interval * 0.2
+        self._last_published = self.last_active = now
+        for subscriber in list(self._subscribers):
+            self.counters["dropped"] += subscriber.offer(frame, self.max_lag)
+            if subscriber.closed:
+                self._subscribers.discard(subscriber)
+                self.counters["disconnected_slow"] += 1
+        return frame
+
+    def subscribe(self, tier: Tier = ORIGINAL) -> Subscriber:
+        """새 시청자. 이미 받은 프레임이 있으면 기다리지 않고 바로 보여 준다."""
+        subscriber = Subscriber(self.max_buffer, tier)
+        if self.latest is not None:
+            subscriber.offer(self.latest, self.max_lag)
+        self._subscribers.add(subscriber)
+        self.last_active = time.monotonic()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        self.last_active = time.monotonic()
+
+    async def render(self, frame: Frame, tier: Tier = ORIGINAL) -> bytes:
+        """tier 시청자에게 보낼 JPEG. 원본과 다르면 프레임 / tier 마다 한 번만 만들고 시청자들이 나눠 쓴다."""
+        if self.renderer is None or (tier == ORIGINAL and not frame.detections):
+            return frame.data
+        future = frame.variants.get(tier)
+        if future is None:
+            future = frame.variants[tier] = asyncio.get_running_loop().run_in_executor(
+                None, self.renderer, frame.data, frame.detections or [], *tier
+            )
+            self.counters["rendered"] += 1
+        # 기다리던 시청자가 끊겨도 다른 시청자가 같은 결과를 받도록 취소를 전파하지 않는다
+        try:
+            rendered = await asyncio.shield(future)
+        except Exception as e:
+            print(f"검출 결과를 그리지 못해 원본 프레임을 보냅니다: {e}")
+            return frame.data
+        return rendered or frame.data
+
+    def fps(self) -> float:
+        """최근 업로드 FPS. 평소 간격의 5배(최소 5초) 넘게 업로드가 없으면 0."""
+        if self._interval is None or not self._interval:
+            return 0.0
+        if time.monotonic() - self._last_published > max(self._interval * 5, 5.0):
+            return 0.0
+        return 1.0 / self._interval
+
+    def stats(self) -> dict:
+        return {
+            "viewers": self.viewers,
+            "tiers": dict(collections.Counter(tier_label(s.tier) for s in self._subscribers)),
+            "seq": self.latest.seq if self.latest else 0,
+            "fps": round(self.fps(), 2),
+            "age_sec": round(time.time() - self.latest.published_at, 3) if self.latest else None,
+            "max_buffer": self.max_buffer,
+            **self.counters,
+        }
+
+
+class TooManyStreams(RuntimeError):
+    pass
+
+
+class FrameChannels:
+    """stream ID 별 FrameHub. max_streams 에 닿으면 시청자가 없고 가장 오래 쓰지 않은 stream 부터 정리한다."""
+
+    def __init__(self, max_streams: int = 64, **hub_options):
+        self.max_streams = max_streams
+        self.hub_options = hub_options
+        self._hubs: Dict[str, FrameHub] = {}
+
+    def get(self, stream: str) -> FrameHub:
+        """stream 의 hub. 없으면 만든다 (로봇보다 시청자가 먼저 연결해도 된다). 만들 수 없으면 TooManyStreams."""
+        hub = self._hubs.get(stream)
+        if hub is None:
+            if len(self._hubs) >= self.max_streams:
+                idle = [(h.last_active, s) for s, h in self._hubs.items() if not h.viewers]
+                if not idle:
+                    raise TooManyStreams(f"stream 수가 상한({self.max_streams})에 닿았습니다.")
+                del self._hubs[min(idle)[1]]
+            hub = self._hubs[stream] = FrameHub(**self.hub_options)
+        return hub
+
+    def stats(self) -> dict:
+        return {stream: hub.stats() for stream, hub in sorted(self._hubs.items())}
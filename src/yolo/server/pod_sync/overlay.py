@@ -0,0 +1,49 @@
+"""
+로봇이 보낸 검출 결과를 서버에서 프레임에 그리고, 시청자가 요청한 해상도 / 품질 단계로 다시 인코딩한다
+(로봇은 원본 JPEG 과 검출 메시지만 보낸다).
+
+검출 메시지: {"detections": [[x1, y1, x2, y2, confidence, "class"], ...]} (좌표는 업로드한 JPEG 의 픽셀)
+그리는 모양은 로봇이 그리던 것(realtime_container_process_backbone.draw_detections)과 같다.
+"""
+import json
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Detection = Tuple[int, int, int, int, float, str]
+
+
+def parse_detections(message) -> List[Detection]:
+    """검출 메시지(JSON 문자열 또는 dict)를 검사해 바꾼다. 형식이 맞지 않으면 ValueError."""
+    if isinstance(message, (str, bytes)):
+        message = json.loads(message)
+    detections = []
+    try:
+        for x1, y1, x2, y2, conf, label in message["detections"]:
+            detections.append((int(x1), int(y1), int(x2), int(y2), float(conf), str(label)))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"검출 메시지 형식이 올바르지 않습니다: {e}")
+    return detections
+
+
+def render(jpeg: bytes, detections: List[Detection], width: Optional[int] = None,
+           quality: Optional[int] = None) -> Optional[bytes]:
+    """
+    JPEG 을 width 로 줄이고(원본보다 크게는 하지 않음) 검출 결과를 그려 quality 로 다시 인코딩한다.
+    줄인 뒤에 좌표를 맞춰 그리므로 작은 해상도에서도 글자가 뭉개지지 않는다. 디코딩할 수 없는 JPEG 이면 None.
+    """
+    frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    scale = 1.0
+    if width and width < frame.shape[1]:
+        scale = width / frame.shape[1]
+        frame = cv2.resize(frame, (width, max(round(frame.shape[0] * scale), 1)), interpolation=cv2.INTER_AREA)
+    for x1, y1, x2, y2, conf, label in detections:
+        x1, y1, x2, y2 = (round(v * scale) for v in (x1, y1, x2, y2))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, f"{label} {conf:.2f}", (x1, max(y1 - 10, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if quality else []
+    ret, encoded = cv2.imencode(".jpg", frame, params)
+    return encoded.tobytes() if ret else None
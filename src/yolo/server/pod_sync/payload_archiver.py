@@ -0,0 +1,181 @@
+"""
+입력 페이로드 / 이미지 보관기 (backbone/pod_sync, neck-head-slim/app, server/pod_sync 에 동일하게 복사해 사용).
+
+요청 처리 경로에서는 submit() 으로 큐에 넣기만 하고, 파일 쓰기(필요하면 인코딩 / 압축 포함)는
+백그라운드 writer 스레드가 한다. 큐가 가득 차면 새 항목을 버리므로 디스크가 느려도 요청이 기다리지 않는다.
+디렉터리 안에서 prefix 로 시작하는 파일만 관리하며, 총 크기(max_bytes) 또는 보관 기간(max_age)을
+넘으면 오래된 파일부터 지운다.
+
+환경 변수 (from_env, 세 pod 공통):
+    ARCHIVE_SAMPLE_EVERY  : N 개 중 1 개만 보관 (기본 1 = 모두)
+    ARCHIVE_MAX_QUEUE     : writer 대기열 크기. 넘으면 버림 (기본 64)
+    ARCHIVE_MAX_MB        : 보관 디렉터리 총 크기 상한 (MB, 0 = 무제한, 기본 2048)
+    ARCHIVE_MAX_AGE_HOURS : 보관 기간 (시간, 0 = 무제한, 기본 72)
+    ARCHIVE_COMPRESS      : none / gzip (gzip 이면 .gz 를 붙여 저장. JPEG 는 이득이 거의 없다)
+"""
+import collections
+import gzip
+import itertools
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+COMPRESSIONS = ("none", "gzip")
+
+
+def read_archived(path):
+    """보관 파일 내용을 읽는다. ARCHIVE_COMPRESS=gzip 으로 저장된 .gz 파일은 압축을 푼다."""
+    path = Path(path)
+    data = path.read_bytes()
+    return gzip.decompress(data) if path.suffix == ".gz" else data
+
+
+class PayloadArchiver:
+    def __init__(self, directory, prefix, enabled=True, sample_every=1, max_queue=64,
+                 max_bytes=0, max_age=0.0, compress="none", gc_interval=60.0):
+        if compress not in COMPRESSIONS:
+            raise ValueError(f"compress 는 {COMPRESSIONS} 중 하나여야 합니다: {compress}")
+        self.directory = Path(directory).resolve()
+        self.prefix = prefix
+        self.enabled = enabled
+        self.sample_every = max(int(sample_every), 1)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.gc_interval = gc_interval
+        self.counters = collections.Counter()
+        self._seq = itertools.count()
+        self._queue = queue.Queue(maxsize=max(int(max_queue), 1))
+        self._files = collections.deque()  # (mtime, path, size), 오래된 순
+        self._disk_bytes = 0
+        self._thread = None
+        if enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name=f"archive-{prefix}", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls, directory, prefix, enabled=True):
+        return cls(
+            directory, prefix, enabled=enabled,
+            sample_every=int(os.getenv("ARCHIVE_SAMPLE_EVERY", "1")),
+            max_queue=int(os.getenv("ARCHIVE_MAX_QUEUE", "64")),
+            max_bytes=int(float(os.getenv("ARCHIVE_MAX_MB", "2048")) * 1024 * 1024),
+            max_age=float(os.getenv("ARCHIVE_MAX_AGE_HOURS", "72")) * 3600,
+            compress=os.getenv("ARCHIVE_COMPRESS", "none").lower(),
+        )
+
+    def submit(self, data, suffix) -> Optional[str]:
+        """
+        data(bytes 또는 bytes 를 돌려주는 callable)를 보관 대기열에 넣고 저장될 경로를 반환한다.
+        callable 이면 인코딩도 writer 스레드에서 한다. 샘플링에서 빠지거나 대기열이 가득 차면 None.
+        """
+        if not self.enabled:
+            return None
+        if next(self._seq) % self.sample_every:
+            self.counters["sampled_out"] += 1
+            return None
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+        path = self.directory / f"{self.prefix}_{timestamp}{suffix}"
+        if self.compress == "gzip":
+            path = path.with_name(path.name + ".gz")
+        try:
+            self._queue.put_nowait((path, data))
+        except queue.Full:
+            self.counters["dropped"] += 1
+            return None
+        return str(path)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize(),
+            "files": len(self._files),
+            "disk_bytes": self._disk_bytes,
+            **self.counters,
+        }
+
+    def close(self, timeout=5.0):
+        """대기 중인 항목을 timeout 초까지 기록하고 writer 를 멈춘다."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    # writer 스레드
+
+    def _run(self):
+        self._scan()
+        last_gc = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.gc_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return
+            if item:
+                self._write(*item)
+            if item or time.monotonic() - last_gc >= self.gc_interval:
+                self._rotate()
+                last_gc = time.monotonic()
+
+    def _scan(self):
+        """이미 있는 보관 파일을 오래된 순으로 등록한다 (재시작해도 상한이 유지되도록)."""
+        for tmp_path in self.directory.glob(f".{self.prefix}_*.tmp"):  # 쓰는 도중 종료된 파일
+            tmp_path.unlink(missing_ok=True)
+        files = []
+        for path in self.directory.glob(f"{self.prefix}_*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file():
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        self._files.extend(files)
+        self._disk_bytes = sum(size for _, _, size in files)
+        self._rotate()
+
+    def _write(self, path, data):
+        try:
+            if callable(data):
+                data = data()
+            if self.compress == "gzip":
+                data = gzip.compress(data, compresslevel=1)
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.counters["failed"] += 1
+            print(f"{self.prefix} 보관 실패 ({path.name}):", e)
+            return
+        self.counters["written"] += 1
+        self._files.append((time.time(), path, len(data)))
+        self._disk_bytes += len(data)
+
+    def _rotate(self):
+        expire_before = time.time() - self.max_age if self.max_age > 0 else None
+        while self._files:
+            mtime, path, size = self._files[0]
+            over_size = self.max_bytes > 0 and self._disk_bytes > self.max_bytes
+            expired = expire_before is not None and mtime < expire_before
+            if not (over_size or expired):
+                break
+            self._files.popleft()
+            self._disk_bytes -= size
+            try:
+                path.unlink()
+                self.counters["rotated"] += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"{self.prefix} 보관 파일 삭제 실패 ({path.name}):", e)